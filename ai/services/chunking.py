@@ -0,0 +1,183 @@
+"""
+Splitting large code reviews into chunks and merging the results.
+
+A unified diff is split by file and then by hunk; other code is split at
+its top-level definitions. Neighbouring pieces from the same file are packed
+together up to a token budget, and a piece larger than the budget is cut at
+line boundaries. Each chunk is then reviewed on its own and the analyses are
+merged section by section, dropping items more than one chunk reported.
+
+A chunk's prompt depends only on its content (hunk line numbers are left
+out), so chunks that haven't changed since the last review are answered from
+the AI response cache.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List
+
+from devcord.review_feedback import LIST_SECTIONS
+
+# Rough size of a token in characters; close enough for code and English
+CHARS_PER_TOKEN = 4
+
+DIFF_START = re.compile(r'^(?:diff --git |--- )', re.M)
+HUNK_HEADER = re.compile(r'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@ ?(.*)$')
+DEFINITION = re.compile(
+    r'^(?:@|async\s+def\b|def\b|class\b|function\b|func\b|fn\b|pub\b|impl\b|struct\b|'
+    r'interface\b|export\b|public\b|private\b|protected\b|static\b|module\b)'
+)
+
+
+@dataclass
+class Chunk:
+    """A piece of code to review: the file it comes from, if known, and its text."""
+    path: str
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def is_diff(code: str) -> bool:
+    return bool(DIFF_START.search(code)) and '\n@@ ' in code
+
+
+def _diff_path(name: str, prefix: str) -> str:
+    name = name.split('\t')[0].strip()
+    if name == '/dev/null':
+        return ''
+    return name[len(prefix):] if name.startswith(prefix) else name
+
+
+def _diff_pieces(diff: str) -> List[Chunk]:
+    """One piece per hunk, headed by its file's path and the hunk's context."""
+    pieces = []
+    path = ''
+    # Lines left in the current hunk, on the old and new side, so that a
+    # removed line reading "-- x" isn't taken for a file header
+    old = new = 0
+    for line in diff.splitlines():
+        if old > 0 or new > 0:
+            pieces[-1].text += '\n' + line
+            if line.startswith('-'):
+                old -= 1
+            elif line.startswith('+'):
+                new -= 1
+            elif not line.startswith('\\'):
+                old -= 1
+                new -= 1
+            continue
+
+        header = HUNK_HEADER.match(line)
+        if header:
+            old, new = int(header.group(1) or 1), int(header.group(2) or 1)
+            text = f'File: {path}\n@@ {header.group(3)}'.rstrip()
+            pieces.append(Chunk(path, text))
+        elif line.startswith('--- '):
+            path = _diff_path(line[4:], 'a/')
+        elif line.startswith('+++ '):
+            path = _diff_path(line[4:], 'b/') or path
+    return pieces
+
+
+def _definition_pieces(code: str) -> List[Chunk]:
+    """Split plain code before each top-level definition."""
+    pieces = []
+    current = []
+    for line in code.splitlines():
+        if DEFINITION.match(line) and any(l.strip() for l in current):
+            # Keep decorators and comments directly above with the definition
+            lead = []
+            while current and (current[-1].startswith(('@', '#', '//')) or not current[-1].strip()):
+                lead.insert(0, current.pop())
+            if any(l.strip() for l in current):
+                pieces.append(Chunk('', '\n'.join(current)))
+                current = []
+            current = lead + current
+        current.append(line)
+    if any(l.strip() for l in current):
+        pieces.append(Chunk('', '\n'.join(current)))
+    return pieces
+
+
+def _cut(piece: Chunk, max_tokens: int) -> List[Chunk]:
+    """Cut an oversized piece at line boundaries."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    parts = []
+    current = []
+    size = 0
+    for line in piece.text.splitlines():
+        if current and size + len(line) + 1 > limit:
+            parts.append(Chunk(piece.path, '\n'.join(current)))
+            current, size = [], 0
+            if piece.path:
+                current.append(f'File: {piece.path}')
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        parts.append(Chunk(piece.path, '\n'.join(current)))
+    return parts
+
+
+def split_code(code: str, max_tokens: int) -> List[Chunk]:
+    """
+    Split ``code``, a unified diff or plain source, into chunks of at most
+    about ``max_tokens`` tokens each.
+    """
+    pieces = _diff_pieces(code) if is_diff(code) else _definition_pieces(code)
+    chunks = []
+    for piece in pieces:
+        for part in (_cut(piece, max_tokens) if piece.tokens > max_tokens else [piece]):
+            last = chunks[-1] if chunks else None
+            # Only pack within a file, so a change in one file doesn't change
+            # (and uncache) the chunks of another
+            if last is not None and last.path == part.path and last.tokens + part.tokens <= max_tokens:
+                chunks[-1] = Chunk(last.path, f'{last.text}\n{part.text}')
+            else:
+                chunks.append(part)
+    return chunks
+
+
+def _normalize(item: str) -> str:
+    return ' '.join(item.lower().split()).rstrip('.;:')
+
+
+def _unique(items, key=_normalize):
+    seen = set()
+    result = []
+    for item in items:
+        k = key(item)
+        if k not in seen:
+            seen.add(k)
+            result.append(item)
+    return result
+
+
+def merge_analyses(chunks: List[Chunk], analyses: List[Dict]) -> Dict:
+    """
+    Merge the analyses of ``chunks`` into one, in chunk order. Feedback is
+    kept per chunk under its file's path; the sections and suggestions are
+    concatenated without repeats.
+    """
+    feedback = []
+    for chunk, analysis in zip(chunks, analyses):
+        feedback.append(f"{chunk.path}:\n{analysis['feedback']}" if chunk.path else analysis['feedback'])
+
+    merged = {
+        'status': 'success',
+        'feedback': '\n\n'.join(feedback),
+        'suggestions': _unique(
+            (s for analysis in analyses for s in analysis['suggestions']),
+            key=lambda s: (s['section'], _normalize(s['suggestion'])),
+        ),
+        'summary': ' '.join(analysis['summary'] for analysis in analyses if analysis['summary']),
+        'chunks': len(chunks),
+    }
+    for section in LIST_SECTIONS:
+        merged[section] = _unique(item for analysis in analyses for item in analysis[section])
+    return merged
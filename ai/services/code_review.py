@@ -1,105 +1,297 @@
 """
 AI service for code review functionality.
 """
-import json
-import time
-from functools import wraps
-from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
 
 import openai
+from asgiref.sync import sync_to_async
 from celery import shared_task
 from django.conf import settings
-from django.core.cache import cache
-from openai import OpenAI
 
-def rate_limit(key_prefix: str, limit: int = 10, period: int = 60) -> Callable:
-    """
-    Rate limiting decorator.
-    """
-    def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs) -> Any:
-            cache_key = f"rate_limit:{key_prefix}:{int(time.time()) // period}"
-            count = cache.get(cache_key, 0)
-            
-            if count >= limit:
-                raise Exception(f"Rate limit exceeded. Try again in {period} seconds.")
-            
-            cache.set(cache_key, count + 1, period)
-            return func(*args, **kwargs)
-        return wrapper
-    return decorator
+from ai.services.chunking import estimate_tokens, merge_analyses, split_code
+
+from devcord.ai_cache import acached_completion, cached_completion
+from devcord.ai_client import (
+    astream_completion, concurrency_limit, get_async_client, get_client, run_async,
+    stream_completion
+)
+from devcord.circuit import aguarded, guarded
+from devcord.ratelimit import RateLimitExceeded, check_ai_rate, retry_countdown
+from devcord.review_feedback import (
+    parse_feedback, parse_structured, render_feedback, schema_response_format
+)
+from devcord.streaming import StreamPublisher
+
+logger = logging.getLogger(__name__)
+
+# Used when the provider turns a request away without saying for how long
+DEFAULT_RETRY_AFTER = 60
 
 class AIServiceError(Exception):
     """Base exception for AI service errors."""
     pass
 
-class RateLimitError(AIServiceError):
-    """Rate limit exceeded."""
-    pass
+class RateLimitError(AIServiceError, RateLimitExceeded):
+    """Rate limit exceeded, ours or OpenAI's. ``wait`` is in seconds."""
+
+    def __init__(self, message: str, wait: float = DEFAULT_RETRY_AFTER):
+        RateLimitExceeded.__init__(self, wait, message)
 
 class APIError(AIServiceError):
     """OpenAI API error."""
     pass
 
+def _retry_after(error: Exception) -> float:
+    """Read the Retry-After header of an OpenAI error response."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
 class CodeReviewService:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, structured: Optional[bool] = None):
+        """
+        With ``structured`` (default AI_REVIEW_STRUCTURED_OUTPUT) the model
+        is asked for JSON matching devcord.review_feedback.REVIEW_SCHEMA
+        instead of sectioned text. The model has to support structured
+        outputs.
+        """
+        self.model = settings.AI_REVIEW_MODEL
+        self.temperature = 0.7
         self.max_retries = 3
         self.retry_delay = 1  # seconds
+        self.structured = settings.AI_REVIEW_STRUCTURED_OUTPUT if structured is None else structured
 
-    @rate_limit(key_prefix="code_review", limit=10, period=60)
-    def analyze_code(self, code: str, context: Optional[Dict] = None) -> Dict:
+    @property
+    def client(self):
+        # Shared per process, so pooled connections outlive each task
+        return get_client()
+
+    def analyze_code(self, code: str, context: Optional[Dict] = None, use_cache: bool = True,
+                     on_chunk: Optional[Callable[[str], None]] = None) -> Dict:
         """
-        Analyze code using OpenAI's GPT model with retries and error handling.
+        Analyze code using OpenAI's GPT model with error handling.
         
         Args:
             code: The code to analyze
             context: Optional context about the code (language, framework, etc.)
+            use_cache: Answer repeat requests from the AI response cache
+            on_chunk: Stream the feedback, passing each piece of text to this
+                callable as it arrives
+
+        Context may include ``team_id`` to count the request against that
+        team's rate limit as well as the model's.
+
+        Code longer than AI_REVIEW_CHUNK_TOKENS, such as a large diff, is
+        split by file, hunk or definition and the chunks are reviewed in
+        parallel; see ai.services.chunking. The result then also has
+        ``chunks``, the number reviewed.
         
         Returns:
             Dict containing analysis results
             
         Raises:
-            AIServiceError: If the analysis fails after retries
+            RateLimitError: If a rate limit is used up; ``wait`` says for how long
+            APIError: If the API call fails; worth retrying later
+            AIServiceError: If the analysis fails otherwise
         """
         context = context or {}
+        if estimate_tokens(code) > settings.AI_REVIEW_CHUNK_TOKENS:
+            return run_async(self._aanalyze_chunks(code, context, use_cache, on_chunk))
+
+        system_message = self._build_system_message(context)
+        prompt = self._build_prompt(code)
+
+        # Structured output is JSON until it is parsed, so it isn't streamed
+        stream = None if self.structured else on_chunk
+        streamed = False
+
+        def request():
+            nonlocal streamed
+            streamed = stream is not None
+            return self._request_feedback(system_message, prompt, stream, context.get('team_id'))
+
+        # Cache hits skip the rate limit as well as the API call
+        feedback = cached_completion(
+            request, self.model, prompt, self.temperature,
+            system=system_message, bypass=not use_cache
+        )
+        analysis = self._build_analysis(feedback)
+        if on_chunk is not None and not streamed:
+            on_chunk(analysis['feedback'])
+        return analysis
+
+    async def _aanalyze_whole(self, code: str, context: Dict, use_cache: bool = True,
+                              on_chunk: Optional[Callable[[str], None]] = None) -> Dict:
+        system_message = self._build_system_message(context)
+        prompt = self._build_prompt(code)
+
+        stream = None if self.structured else on_chunk
+        streamed = False
+
+        async def request():
+            nonlocal streamed
+            streamed = stream is not None
+            return await self._arequest_feedback(system_message, prompt, stream, context.get('team_id'))
+
+        feedback = await acached_completion(
+            request, self.model, prompt, self.temperature,
+            system=system_message, bypass=not use_cache
+        )
+        analysis = self._build_analysis(feedback)
+        if on_chunk is not None and not streamed:
+            on_chunk(analysis['feedback'])
+        return analysis
+
+    async def _aanalyze_chunks(self, code: str, context: Dict, use_cache: bool = True,
+                               on_chunk: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Review code too large for one prompt as chunks of about
+        AI_REVIEW_CHUNK_TOKENS, concurrently, and merge the results. Each
+        chunk is cached on its own, so a re-review only pays for the chunks
+        that changed. With ``on_chunk`` each chunk's feedback is passed on
+        as soon as it is ready.
+        """
+        chunks = split_code(code, settings.AI_REVIEW_CHUNK_TOKENS)
+        send = sync_to_async(on_chunk, thread_sensitive=False) if on_chunk is not None else None
+        sending = asyncio.Lock()
+
+        async def review(chunk):
+            analysis = await self._aanalyze_whole(chunk.text, context, use_cache)
+            if send is not None:
+                heading = f"{chunk.path}:\n" if chunk.path else ""
+                async with sending:
+                    await send(f"{heading}{analysis['feedback']}\n\n")
+            return analysis
+
+        results = await asyncio.gather(*(review(chunk) for chunk in chunks), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            # Finished chunks are cached; a retry after the longest wait
+            # only asks for the rest
+            limited = [error for error in errors if isinstance(error, RateLimitError)]
+            raise max(limited, key=lambda error: error.wait) if limited else errors[0]
+        return merge_analyses(chunks, results)
+
+    def _build_prompt(self, code: str) -> str:
+        return f"Please review this code and provide feedback:\n\n{code}"
+
+    def _build_analysis(self, feedback: str) -> Dict:
+        """
+        Parse the model's feedback into the sections of the analysis. A
+        structured response that doesn't match the schema is read as text.
+        """
+        review = None
+        if self.structured:
+            try:
+                review = parse_structured(feedback)
+                feedback = render_feedback(review)
+            except ValueError as e:
+                logger.warning(f"Structured code review unreadable, parsing it as text: {e}")
+        if review is None:
+            review = parse_feedback(feedback)
+        return {'status': 'success', 'feedback': feedback, **review}
+
+    def _completion_params(self, system_message: str, prompt: str) -> Dict:
+        params = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": 1000,
+        }
+        if self.structured:
+            params["response_format"] = schema_response_format()
+        return params
+
+    def _request_feedback(self, system_message: str, prompt: str,
+                          on_chunk: Optional[Callable[[str], None]] = None,
+                          team_id: Optional[int] = None) -> str:
+        """
+        Call the model once. Failures aren't retried here, where waiting would
+        hold a worker; async_code_review retries them later with backoff.
+        While the provider's circuit is open the call isn't made at all and
+        RateLimitError says how long to wait.
+        """
+        params = self._completion_params(system_message, prompt)
+        try:
+            check_ai_rate(self.model, team_id)
+            with guarded():
+                if on_chunk is not None:
+                    return stream_completion(on_chunk, **params)
+                response = self.client.chat.completions.create(**params)
+                return response.choices[0].message.content
+
+        except RateLimitExceeded as e:
+            raise RateLimitError(str(e), wait=e.wait) from e
+
+        except openai.RateLimitError as e:
+            raise RateLimitError(
+                "OpenAI rate limit exceeded. Please try again later.",
+                wait=_retry_after(e)
+            ) from e
+
+        except openai.APIError as e:
+            raise APIError(f"Code analysis failed: {str(e)}") from e
+
+        except Exception as e:
+            raise AIServiceError(f"Unexpected error during code analysis: {str(e)}") from e
+
+    async def _arequest_feedback(self, system_message: str, prompt: str,
+                                 on_chunk: Optional[Callable[[str], None]] = None,
+                                 team_id: Optional[int] = None) -> str:
+        """
+        Async _request_feedback. Here API errors are retried with backoff,
+        since waiting doesn't block the event loop, until the circuit opens.
+        """
+        try:
+            await sync_to_async(check_ai_rate, thread_sensitive=False)(self.model, team_id)
+        except RateLimitExceeded as e:
+            raise RateLimitError(str(e), wait=e.wait) from e
+
         attempt = 0
         last_error = None
+        started = False
+
+        def forward(text):
+            nonlocal started
+            started = True
+            on_chunk(text)
+
+        params = self._completion_params(system_message, prompt)
 
         while attempt < self.max_retries:
             try:
-                system_message = self._build_system_message(context)
-                response = self.client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": system_message},
-                        {"role": "user", "content": f"Please review this code and provide feedback:\n\n{code}"}
-                    ],
-                    temperature=0.7,
-                    max_tokens=1000
-                )
-                
-                feedback = response.choices[0].message.content
-                return {
-                    'status': 'success',
-                    'feedback': feedback,
-                    'suggestions': self._parse_suggestions(feedback),
-                    'security_issues': self._extract_security_issues(feedback),
-                    'performance_issues': self._extract_performance_issues(feedback),
-                    'best_practices': self._extract_best_practices(feedback),
-                }
+                async with concurrency_limit(), aguarded():
+                    if on_chunk is not None:
+                        return await astream_completion(forward, **params)
+                    response = await get_async_client().chat.completions.create(**params)
+                    return response.choices[0].message.content
+
+            except RateLimitExceeded as e:
+                # The circuit opened, or every slot is taken
+                raise RateLimitError(str(e), wait=e.wait) from e
 
             except openai.RateLimitError as e:
-                raise RateLimitError("OpenAI rate limit exceeded. Please try again later.") from e
-                
+                raise RateLimitError(
+                    "OpenAI rate limit exceeded. Please try again later.",
+                    wait=_retry_after(e)
+                ) from e
+
             except openai.APIError as e:
+                if started:
+                    raise APIError(f"Code analysis stream failed: {str(e)}") from e
                 last_error = e
                 attempt += 1
                 if attempt < self.max_retries:
-                    time.sleep(self.retry_delay * attempt)  # Exponential backoff
+                    await asyncio.sleep(self.retry_delay * attempt)
                 continue
-                
+
             except Exception as e:
                 raise AIServiceError(f"Unexpected error during code analysis: {str(e)}") from e
 
@@ -121,7 +313,18 @@ class CodeReviewService:
         3. Best practices violations
         4. Code style issues
         5. Potential bugs
-        
+        """
+
+        if self.structured:
+            base_message += """
+        Respond with a JSON object: a one-paragraph summary, then one short
+        finding per list item under bugs, security_issues, performance_issues,
+        best_practices, style_issues and improvements. Leave a list empty
+        when there is nothing to report.
+        """
+            return base_message
+
+        base_message += """
         Format your response with clear sections:
         - Security Issues
         - Performance Concerns
@@ -132,79 +335,40 @@ class CodeReviewService:
         
         return base_message
 
-    def _parse_suggestions(self, feedback: str) -> List[str]:
-        """Parse feedback for actionable suggestions."""
-        suggestions = []
-        current_section = None
-        
-        for line in feedback.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.endswith(':') and line[:-1].upper() == line[:-1]:
-                current_section = line[:-1]
-                continue
-                
-            if line.startswith('-') or line.startswith('*'):
-                suggestions.append({
-                    'section': current_section,
-                    'suggestion': line[1:].strip()
-                })
-                
-        return suggestions
-
-    def _extract_security_issues(self, feedback: str) -> List[str]:
-        """Extract security-related issues from feedback."""
-        return self._extract_section(feedback, 'Security Issues')
-
-    def _extract_performance_issues(self, feedback: str) -> List[str]:
-        """Extract performance-related issues from feedback."""
-        return self._extract_section(feedback, 'Performance Concerns')
-
-    def _extract_best_practices(self, feedback: str) -> List[str]:
-        """Extract best practices from feedback."""
-        return self._extract_section(feedback, 'Best Practices')
-
-    def _extract_section(self, feedback: str, section_name: str) -> List[str]:
-        """Extract items from a specific section of the feedback."""
-        issues = []
-        in_section = False
-        
-        for line in feedback.split('\n'):
-            line = line.strip()
-            
-            if not line:
-                continue
-                
-            if line.upper() == section_name.upper() + ':':
-                in_section = True
-                continue
-                
-            if in_section:
-                if line.endswith(':') and line[:-1].upper() == line[:-1]:
-                    break
-                if line.startswith('-') or line.startswith('*'):
-                    issues.append(line[1:].strip())
-                    
-        return issues
-
 @shared_task(
     bind=True,
     max_retries=3,
     default_retry_delay=60,
     rate_limit='10/m'
 )
-def async_code_review(self, code: str, context: Optional[Dict] = None) -> Dict:
+def async_code_review(self, code: str, context: Optional[Dict] = None,
+                      review_id: Optional[int] = None) -> Dict:
     """
     Asynchronous task for code review with retries and rate limiting.
+
+    With ``review_id`` the feedback is streamed to that review's page as it
+    is generated.
     """
+    publisher = StreamPublisher('code-review', review_id) if review_id else None
     try:
         service = CodeReviewService()
-        return service.analyze_code(code, context)
-    except (RateLimitError, APIError) as exc:
-        raise self.retry(exc=exc)
+        result = service.analyze_code(
+            code, context, on_chunk=publisher.write if publisher else None
+        )
+    except RateLimitError as exc:
+        raise self.retry(exc=exc, countdown=retry_countdown(exc.wait))
+    except APIError as exc:
+        # Exponential backoff with jitter, so reviews that failed together
+        # don't all come back together
+        raise self.retry(
+            exc=exc, countdown=retry_countdown(self.default_retry_delay * 2 ** self.request.retries)
+        )
     except Exception as exc:
         # Log the error but don't retry on unexpected errors
         print(f"Unexpected error in async_code_review: {str(exc)}")
-        raise 
\ No newline at end of file
+        if publisher:
+            publisher.fail("Code review failed.")
+        raise
+    if publisher:
+        publisher.finish(result)
+    return result 
\ No newline at end of file
@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import ChatMessage
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(admin.ModelAdmin):
+    list_display = ['room', 'user', 'content', 'created_at']
+    list_filter = ['room']
+    search_fields = ['room', 'content', 'user__username']
+    readonly_fields = ['id', 'created_at']
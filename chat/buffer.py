@@ -0,0 +1,137 @@
+"""
+Write-behind buffer for chat messages.
+
+ChatConsumer broadcasts a message at once and hands it to
+``buffer_message``, which never waits on the database. Buffered messages
+are written together with one ``bulk_create`` when CHAT_WRITE_BATCH_SIZE
+have gathered, or CHAT_WRITE_INTERVAL_MS after the first of them, whichever
+comes first, so broadcast latency doesn't depend on how fast the database
+is.
+
+There is one buffer per event loop, writing one batch at a time so messages
+reach the database in the order they were sent. A batch the database
+rejects is written one message at a time, and only the messages rejected on
+their own are logged and dropped. When the database can't be reached the
+unwritten messages go back in the buffer for the next attempt; beyond
+RETRY_BUFFER_FACTOR batches' worth the oldest messages are dropped. Messages still buffered
+when the process is killed are lost, at most CHAT_WRITE_INTERVAL_MS worth.
+"""
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+RETRY_BUFFER_FACTOR = 10
+
+# Errors meaning the database can't be reached, rather than that it
+# rejected the messages
+UNAVAILABLE_ERRORS = (InterfaceError, OperationalError)
+
+
+class MessageBuffer:
+    def __init__(self, loop):
+        self.loop = loop
+        self.pending = []
+        self.timer = None
+        self.writing = asyncio.Lock()
+        self.flushes = set()
+
+    def add(self, message):
+        self.pending.append(message)
+        if len(self.pending) >= settings.CHAT_WRITE_BATCH_SIZE:
+            self.start_flush()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(settings.CHAT_WRITE_INTERVAL_MS / 1000, self.start_flush)
+
+    def start_flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        flush = self.loop.create_task(self.flush())
+        # Hold a reference until it is done, or it may be collected
+        self.flushes.add(flush)
+        flush.add_done_callback(self.flushes.discard)
+
+    async def flush(self):
+        """Write out everything buffered so far. Returns the number of messages."""
+        async with self.writing:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            try:
+                return await database_sync_to_async(_write)(batch)
+            except Exception as e:
+                # _write leaves the batch holding what it didn't get to
+                logger.error(f"Could not write {len(batch)} chat messages: {e}")
+                self._restore(batch)
+                return 0
+
+    def _restore(self, batch):
+        """Put messages that failed to write back at the front of the buffer."""
+        self.pending[:0] = batch
+        overflow = len(self.pending) - settings.CHAT_WRITE_BATCH_SIZE * RETRY_BUFFER_FACTOR
+        if overflow > 0:
+            del self.pending[:overflow]
+            logger.error(f"Chat message buffer full, dropped {overflow} oldest messages")
+        if self.timer is None:
+            self.timer = self.loop.call_later(settings.CHAT_WRITE_INTERVAL_MS / 1000, self.start_flush)
+
+
+def _write(messages):
+    """
+    Insert a batch of messages. Returns the number written.
+
+    Messages are taken off ``messages`` as they are written or dropped, so
+    when the database can't be reached the list is left holding the ones
+    still to write.
+    """
+    try:
+        with transaction.atomic():
+            ChatMessage.objects.bulk_create(messages, batch_size=settings.CHAT_WRITE_BATCH_SIZE)
+    except UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        logger.warning(f"Chat batch of {len(messages)} rejected, writing one at a time: {e}")
+    else:
+        written = len(messages)
+        del messages[:]
+        return written
+
+    written = 0
+    while messages:
+        message = messages[0]
+        try:
+            with transaction.atomic():
+                ChatMessage.objects.bulk_create([message])
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Dropped chat message {message.id} in {message.room}: {e}")
+        else:
+            written += 1
+        del messages[0]
+    return written
+
+
+_buffers = weakref.WeakKeyDictionary()
+
+
+def get_buffer():
+    """The running event loop's message buffer."""
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = _buffers[loop] = MessageBuffer(loop)
+    return buffer
+
+
+def buffer_message(message):
+    """Queue an unsaved ChatMessage to be written with the next batch."""
+    get_buffer().add(message)
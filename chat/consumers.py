@@ -1,14 +1,47 @@
 """
 WebSocket consumer for chat functionality.
+
+Rooms belong to teams (chat.rooms); only members of the team can connect,
+and a connection closes when its user leaves the team.
+
+Clients send ``{"message": ...}`` to post. To catch up after connecting they
+send ``{"type": "history", "after": <id of the last message they saw>}``, or
+no ``after`` for the latest page, and receive ``{"type": "history",
+"messages": [...], "more": bool}`` pages, oldest first. While ``more`` is
+true they ask again after the last message received. Messages posted during
+catch-up may arrive both live and in a page; clients drop repeated ids.
 """
 import json
+import uuid
+
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
 
+from .buffer import buffer_message
+from .history import history_page, message_payload, remember
+from .models import ChatMessage
+from .rooms import load_members, members_group, room_team_id
+
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
+        self.team_id = room_team_id(self.room_name)
+        user = self.scope.get('user')
+        if self.team_id is None or not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        # Join before reading the members so no change falls in between
+        self.members_group = members_group(self.team_id)
+        await self.channel_layer.group_add(self.members_group, self.channel_name)
+        self.members = await database_sync_to_async(load_members)(self.team_id)
+        if user.pk not in self.members:
+            await self.close()
+            return
+
         self.room_group_name = f'chat_{self.room_name}'
 
         # Join room group
@@ -20,30 +53,71 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'members_group'):
+            await self.channel_layer.group_discard(self.members_group, self.channel_name)
         # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
 
     async def receive(self, text_data):
         """
         Receive message from WebSocket.
         """
+        user = self.scope['user']
+        if user.pk not in self.members:
+            await self.close()
+            return
+
         text_data_json = json.loads(text_data)
+        if text_data_json.get('type') == 'history':
+            await self.send_history(text_data_json.get('after'))
+            return
+
         message = text_data_json['message']
-        user = self.scope['user']
+
+        # Stored by the write-behind buffer; the broadcast doesn't wait for it
+        chat_message = ChatMessage(
+            room=self.room_name,
+            team_id=self.team_id,
+            user_id=user.id,
+            content=str(message),
+            created_at=timezone.now(),
+        )
+        buffer_message(chat_message)
+        payload = message_payload(chat_message, user.username)
 
         # Send message to room group
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'user': user.username,
-                'timestamp': timezone.now().isoformat(),
-            }
+            {'type': 'chat_message', **payload}
         )
+        await sync_to_async(remember, thread_sensitive=False)(self.room_name, payload)
+
+    async def send_history(self, after):
+        """
+        Send the messages after ``after`` in pages, up to
+        CHAT_HISTORY_MAX_PAGES of them.
+        """
+        try:
+            after = str(uuid.UUID(after)) if after else None
+        except (TypeError, ValueError):
+            after = None
+
+        for _ in range(settings.CHAT_HISTORY_MAX_PAGES):
+            messages, more = await database_sync_to_async(history_page)(
+                self.room_name, after, settings.CHAT_HISTORY_PAGE_SIZE
+            )
+            await self.send(text_data=json.dumps({
+                'type': 'history',
+                'messages': messages,
+                'more': more,
+            }))
+            if not more or not messages:
+                break
+            after = messages[-1]['id']
 
     async def chat_message(self, event):
         """
@@ -51,7 +125,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
+            'id': event['id'],
             'message': event['message'],
             'user': event['user'],
             'timestamp': event['timestamp'],
-        })) 
\ No newline at end of file
+        }))
+
+    async def membership_changed(self, event):
+        """
+        A user joined or left the room's team.
+        """
+        if event['member']:
+            self.members.add(event['user_id'])
+        else:
+            self.members.discard(event['user_id'])
+            if event['user_id'] == self.scope['user'].pk:
+                await self.close()
@@ -0,0 +1,133 @@
+"""
+Chat history for reconnecting clients.
+
+Every message sent in a room is also pushed onto a Redis list holding the
+room's last CHAT_HISTORY_RING_SIZE messages, as broadcast. A client that
+reconnects sends the id of the last message it saw, and ``history_page``
+answers from that ring whenever the id falls inside it, which covers the
+usual short disconnect without touching the database. The ring also holds
+messages the write-behind buffer hasn't written yet.
+
+Clients further behind are paged from ChatMessage by id until they reach
+the ring. Without Redis each process keeps its own rings.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+from devcord.redis_client import get_redis
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+RING_KEY_PREFIX = 'chat:recent:'
+# Rooms whose rings are kept per process when there is no Redis
+LOCAL_ROOMS = 1000
+
+_lock = threading.Lock()
+_local_rings = OrderedDict()
+
+
+def message_payload(message, username):
+    """A ChatMessage as sent to clients."""
+    return {
+        'id': str(message.id),
+        'message': message.content,
+        'user': username,
+        'timestamp': message.created_at.isoformat(),
+    }
+
+
+def _local_ring(room):
+    ring = _local_rings.get(room)
+    if ring is None:
+        ring = _local_rings[room] = deque(maxlen=settings.CHAT_HISTORY_RING_SIZE)
+        while len(_local_rings) > LOCAL_ROOMS:
+            _local_rings.popitem(last=False)
+    _local_rings.move_to_end(room)
+    return ring
+
+
+def remember(room, payload):
+    """Add a sent message to the room's ring."""
+    client = get_redis()
+    if client is None:
+        with _lock:
+            _local_ring(room).append(payload)
+        return
+    key = RING_KEY_PREFIX + room
+    try:
+        pipe = client.pipeline()
+        pipe.rpush(key, json.dumps(payload))
+        pipe.ltrim(key, -settings.CHAT_HISTORY_RING_SIZE, -1)
+        pipe.expire(key, settings.CHAT_HISTORY_RING_TTL)
+        pipe.execute()
+    except Exception as e:
+        # The message is still stored; reconnects just read it from the database
+        logger.warning(f"Could not add message to the history of {room}: {e}")
+
+
+def recent(room):
+    """The room's ring, oldest first."""
+    client = get_redis()
+    if client is None:
+        with _lock:
+            return list(_local_ring(room))
+    try:
+        return [json.loads(item) for item in client.lrange(RING_KEY_PREFIX + room, 0, -1)]
+    except Exception as e:
+        logger.warning(f"Could not read the history of {room}: {e}")
+        return []
+
+
+def _after(messages, after):
+    # Ids are time-ordered UUIDs, whose text sorts in the same order
+    return [message for message in messages if message['id'] > after]
+
+
+def history_page(room, after, limit):
+    """
+    Up to ``limit`` messages sent in ``room`` after the message with id
+    ``after``, oldest first, and whether there are more. Without ``after``
+    the latest ``limit`` messages are returned.
+    """
+    ring = recent(room)
+    if ring and (after is None or ring[0]['id'] <= after):
+        if after is None:
+            return ring[-limit:], False
+        newer = _after(ring, after)
+        return newer[:limit], len(newer) > limit
+
+    messages = ChatMessage.objects.filter(room=room)
+    if after is None:
+        rows = list(messages.order_by('-id').values('id', 'content', 'user__username', 'created_at')[:limit])
+        rows.reverse()
+        more = False
+    else:
+        rows = list(
+            messages.filter(id__gt=after).order_by('id')
+            .values('id', 'content', 'user__username', 'created_at')[:limit + 1]
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+    page = [
+        {
+            'id': str(row['id']),
+            'message': row['content'],
+            'user': row['user__username'] or '',
+            'timestamp': row['created_at'].isoformat(),
+        }
+        for row in rows
+    ]
+
+    if after is not None and not page and ring:
+        # Nothing newer is written yet; the rest is only in the ring
+        newer = _after(ring, after)
+        return newer[:limit], len(newer) > limit
+    if page and ring and ring[-1]['id'] > page[-1]['id']:
+        more = True
+    return page, more
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:42
+
+import chat.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.UUIDField(default=chat.models.message_id, editable=False, primary_key=True, serialize=False)),
+                ('room', models.CharField(max_length=100)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_messages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['room', 'id'], name='chat_room_id_idx'), models.Index(fields=['created_at'], name='chat_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0008_team_vibe_score'),
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='team',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='devcord.team'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['team', 'created_at'], name='chat_team_created_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+import os
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+from devcord.models import Team
+
+_id_lock = threading.Lock()
+_last_id = 0
+
+
+def message_id():
+    """
+    A time-ordered UUID (version 7 layout): 48 bits of milliseconds, then
+    random bits. Ids are handed out before the message is written, so they
+    can be broadcast with it, and they sort in the order they were made.
+    """
+    global _last_id
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), 'big')
+    # Set the version and variant bits
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    with _id_lock:
+        # Within one millisecond, keep ids from this process increasing
+        if value <= _last_id:
+            value = _last_id + 1
+        _last_id = value
+    return uuid.UUID(int=value)
+
+
+class ChatMessage(models.Model):
+    id = models.UUIDField(primary_key=True, default=message_id, editable=False)
+    room = models.CharField(max_length=100)
+    # The team the room belongs to (chat.rooms)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, null=True, blank=True, db_index=False, related_name='chat_messages')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='chat_messages')
+    content = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # set when sent, not when the buffer is written
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['room', 'id'], name='chat_room_id_idx'),
+            models.Index(fields=['created_at'], name='chat_created_idx'),
+            models.Index(fields=['team', 'created_at'], name='chat_team_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.room}: {self.content[:50]}'
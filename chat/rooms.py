@@ -0,0 +1,76 @@
+"""
+Chat rooms and who may use them.
+
+Every room belongs to a team: ``team-<team id>`` is the team's main room and
+``team-<team id>-<topic>`` any other. Only members of an active team can
+join its rooms.
+
+A connection reads the team's member ids once, when it connects, and keeps
+them. When a TeamMember row is created or deleted, the change is sent to the
+team's Channels group once the transaction commits; each connection updates
+its set from the event, and closes if its own user has left. Posting a
+message never reads the database.
+"""
+import logging
+import re
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from devcord.models import TeamMember
+
+logger = logging.getLogger(__name__)
+
+ROOM_NAME = re.compile(r'^team-(\d+)(?:-[\w-]{1,80})?$')
+
+
+def room_team_id(room_name):
+    """The id of the team a room belongs to, or None if it isn't a team room."""
+    match = ROOM_NAME.match(room_name)
+    return int(match.group(1)) if match else None
+
+
+def members_group(team_id):
+    return f'chat.team.{team_id}.members'
+
+
+def load_members(team_id):
+    """Ids of the users who may chat in the team's rooms."""
+    return set(
+        TeamMember.objects.filter(team_id=team_id, team__is_active=True)
+        .values_list('user_id', flat=True)
+    )
+
+
+def membership_changed(team_id, user_id, member):
+    """Tell the team's open connections, once committed, that a user joined or left."""
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(
+                members_group(team_id),
+                {'type': 'membership.changed', 'user_id': user_id, 'member': member},
+            )
+        except Exception as e:
+            logger.warning(f"Could not send membership change for team {team_id}: {e}")
+
+    transaction.on_commit(send)
+
+
+def _member_saved(sender, instance, created, **kwargs):
+    # Role and status changes don't affect who may chat
+    if created:
+        membership_changed(instance.team_id, instance.user_id, True)
+
+
+def _member_deleted(sender, instance, **kwargs):
+    membership_changed(instance.team_id, instance.user_id, False)
+
+
+def connect_signals():
+    post_save.connect(_member_saved, sender=TeamMember, dispatch_uid='chat_member_saved')
+    post_delete.connect(_member_deleted, sender=TeamMember, dispatch_uid='chat_member_deleted')
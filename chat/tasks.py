@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChatMessage
+
+
+@shared_task
+def cleanup_old_messages() -> int:
+    """
+    Delete chat messages older than CHAT_MESSAGE_RETENTION_DAYS, at most
+    CHAT_CLEANUP_BATCH_SIZE rows per statement so no delete holds its locks
+    for long. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.CHAT_MESSAGE_RETENTION_DAYS)
+    size = settings.CHAT_CLEANUP_BATCH_SIZE
+    deleted = 0
+    while True:
+        ids = list(
+            ChatMessage.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:size]
+        )
+        if not ids:
+            break
+        count, _ = ChatMessage.objects.filter(id__in=ids).delete()
+        deleted += count
+        if len(ids) < size:
+            break
+    return deleted
@@ -0,0 +1,76 @@
+import asyncio
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+
+from .buffer import RETRY_BUFFER_FACTOR, MessageBuffer
+from .models import ChatMessage
+
+
+async def _flush(messages):
+    """Flush ``messages`` through a fresh buffer; returns the count and what is left."""
+    buffer = MessageBuffer(asyncio.get_running_loop())
+    buffer.pending.extend(messages)
+    written = await buffer.flush()
+    if buffer.timer is not None:
+        buffer.timer.cancel()
+    return written, buffer.pending
+
+
+@override_settings(CHAT_WRITE_BATCH_SIZE=2)
+class MessageBufferTests(TestCase):
+    """Buffered messages are written once, and one bad message can't hold back the rest."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dev', password='password')
+
+    def message(self, content='hi'):
+        return ChatMessage(room='team-1', user=self.user, content=content)
+
+    def flush(self, messages):
+        return async_to_sync(_flush)(messages)
+
+    def test_flush_writes_the_batch(self):
+        messages = [self.message(), self.message(), self.message()]
+
+        self.assertEqual(self.flush(messages), (3, []))
+        self.assertEqual(ChatMessage.objects.count(), 3)
+
+    def test_rejected_message_is_dropped_and_the_rest_written(self):
+        bad = self.message(None)
+        messages = [self.message('first'), bad, self.message('last')]
+
+        with self.assertLogs('chat.buffer', 'ERROR') as logs:
+            self.assertEqual(self.flush(messages), (2, []))
+
+        self.assertEqual(list(ChatMessage.objects.values_list('content', flat=True)), ['first', 'last'])
+        self.assertIn(f'Dropped chat message {bad.id} in team-1', logs.output[0])
+
+    def test_messages_wait_while_the_database_is_unreachable(self):
+        messages = [self.message(), self.message()]
+
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError):
+            with self.assertLogs('chat.buffer', 'ERROR'):
+                written, pending = self.flush(messages)
+
+        self.assertEqual((written, pending), (0, messages))
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_overflow_drops_the_oldest_messages(self):
+        limit = 2 * RETRY_BUFFER_FACTOR
+        messages = [self.message(str(n)) for n in range(limit + 5)]
+
+        async def restore():
+            buffer = MessageBuffer(asyncio.get_running_loop())
+            buffer._restore(messages)
+            buffer.timer.cancel()
+            return buffer.pending
+
+        with self.assertLogs('chat.buffer', 'ERROR'):
+            pending = async_to_sync(restore)()
+
+        self.assertEqual(pending, messages[5:])
@@ -0,0 +1,229 @@
+"""
+Buffered ActivityLog writes.
+
+``log_activity`` does not touch the database. Entries are held until the
+surrounding transaction commits (entries from a rolled back transaction are
+dropped with it) and then written together with one ``bulk_create`` when the
+request finishes, when a Celery task finishes, when the buffer fills up, or
+when the process exits.
+
+With ``ACTIVITY_LOG_ASYNC`` enabled the flushed batches are handed to the
+``write_activity_batch`` task instead. That task acknowledges its message
+only after the batch is written, so a worker crash redelivers the batch
+rather than losing it, and a broker that cannot be reached falls back to
+writing in-process.
+
+A batch the database rejects is retried one entry at a time, and only the
+entries rejected on their own are logged and dropped. When the database
+cannot be reached at all, the unwritten entries go back in the buffer for
+the next flush.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('user_id', 'project_id', 'action', 'details', 'target_type', 'target_id', 'target_name')
+
+# Errors meaning the database can't be reached, rather than that it
+# rejected the entries
+UNAVAILABLE_ERRORS = (InterfaceError, OperationalError)
+
+# Entries kept for another attempt when a write fails, as a multiple of
+# the buffer size; beyond that the oldest are dropped
+RETRY_BUFFER_FACTOR = 10
+
+_lock = threading.Lock()
+_buffer = []
+
+
+def max_buffer_size():
+    return getattr(settings, 'ACTIVITY_LOG_BUFFER_SIZE', 200)
+
+
+def log_activity(user, action, project=None, details=None,
+                 target_type=None, target_id=None, target_name=None):
+    """
+    Record an activity once the current transaction commits.
+
+    Returns the unsaved ActivityLog; its ``pk`` is assigned when the buffer
+    is flushed.
+    """
+    entry = ActivityLog(
+        user=user,
+        project=project,
+        action=action,
+        details=details,
+        target_type=target_type,
+        target_id=target_id,
+        target_name=target_name,
+        timestamp=timezone.now(),
+    )
+    transaction.on_commit(lambda: _append(entry))
+    return entry
+
+
+def _append(entry):
+    with _lock:
+        _buffer.append(entry)
+        full = len(_buffer) >= max_buffer_size()
+    if full:
+        safe_flush()
+
+
+def _take():
+    with _lock:
+        entries = _buffer[:]
+        del _buffer[:]
+    return entries
+
+
+def _restore(entries):
+    """Put entries that failed to write back at the front of the buffer."""
+    limit = max_buffer_size() * RETRY_BUFFER_FACTOR
+    with _lock:
+        _buffer[:0] = entries
+        overflow = len(_buffer) - limit
+        if overflow > 0:
+            del _buffer[:overflow]
+    if overflow > 0:
+        logger.error(f"Activity buffer full, dropped {overflow} oldest entries")
+
+
+def flush():
+    """Write out everything buffered so far. Returns the number of entries."""
+    entries = _take()
+    if not entries:
+        return 0
+    if getattr(settings, 'ACTIVITY_LOG_ASYNC', False):
+        _enqueue(entries)
+    else:
+        _write_or_restore(entries)
+    return len(entries)
+
+
+def safe_flush():
+    """Flush, logging instead of raising when the write fails."""
+    try:
+        return flush()
+    except Exception as e:
+        logger.error(f"Could not write activity log: {e}")
+        return 0
+
+
+def _write_or_restore(entries):
+    unwritten = list(entries)
+    try:
+        write_entries(unwritten)
+    except Exception:
+        _restore(unwritten)
+        raise
+
+
+def _enqueue(entries):
+    from .tasks import write_activity_batch
+    size = max_buffer_size()
+    for start in range(0, len(entries), size):
+        batch = entries[start:start + size]
+        try:
+            write_activity_batch.delay(serialize(batch))
+        except Exception as e:
+            logger.error(f"Could not queue activity batch, writing in-process: {e}")
+            # Everything not yet queued is written here instead
+            _write_or_restore(entries[start:])
+            return
+
+
+def serialize(entries):
+    """Turn ActivityLog instances into task-safe dicts."""
+    rows = []
+    for entry in entries:
+        row = {field: getattr(entry, field) for field in FIELDS}
+        row['timestamp'] = entry.timestamp.isoformat()
+        rows.append(row)
+    return rows
+
+
+def deserialize(rows):
+    entries = []
+    for row in rows:
+        row = dict(row)
+        row['timestamp'] = parse_datetime(row['timestamp'])
+        entries.append(ActivityLog(**row))
+    return entries
+
+
+def write_entries(entries):
+    """
+    Insert a batch of ActivityLog instances and refresh the affected
+    dashboards. Returns the entries written.
+
+    Entries are taken off ``entries`` as they are written or dropped, so
+    when the database can't be reached the list is left holding the ones
+    still to write.
+    """
+    try:
+        _insert(entries)
+    except UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        logger.warning(f"Activity batch of {len(entries)} rejected, writing one at a time: {e}")
+    else:
+        written = entries[:]
+        del entries[:]
+        return written
+
+    written = []
+    while entries:
+        entry = entries[0]
+        try:
+            _insert([entry])
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Dropped activity '{entry.action}' by user {entry.user_id}: {e}")
+        else:
+            written.append(entry)
+        del entries[0]
+    return written
+
+
+def _insert(entries):
+    from .dashboard import invalidate_teammate_dashboards
+    with transaction.atomic():
+        ActivityLog.objects.bulk_create(entries, batch_size=max_buffer_size())
+        # bulk_create skips ActivityLog.save, which would normally do this
+        for user_id in {entry.user_id for entry in entries}:
+            invalidate_teammate_dashboards(user_id)
+
+
+class ActivityLogFlushMiddleware:
+    """Write the activity buffered during a request once it has finished."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            safe_flush()
+
+
+def _flush_after_task(*args, **kwargs):
+    safe_flush()
+
+
+def connect_signals():
+    from celery.signals import task_postrun, worker_process_shutdown
+    task_postrun.connect(_flush_after_task, weak=False)
+    worker_process_shutdown.connect(_flush_after_task, weak=False)
+    atexit.register(safe_flush)
@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import (
     Team, TeamMember, Project, Task, DeveloperProfile,
     Standup, CodeReview, ActivityLog, AIInsight,
-    TaskBoard, TaskColumn, AIInsightTracker, CodeReviewInbox
+    TaskBoard, TaskColumn, AIInsightTracker, CodeReviewInbox, ProjectStats,
+    ActivityRollup, TeamAnalysisRun
 )
 
 @admin.register(Team)
@@ -100,3 +101,23 @@ class CodeReviewInboxAdmin(admin.ModelAdmin):
     list_display = ['name', 'project', 'created_at']
     search_fields = ['name', 'description', 'project__name']
     readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(ProjectStats)
+class ProjectStatsAdmin(admin.ModelAdmin):
+    list_display = ['project', 'task_total', 'task_completed', 'review_pending', 'member_total', 'updated_at']
+    search_fields = ['project__name']
+    readonly_fields = ['updated_at']
+
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'project', 'action', 'count']
+    list_filter = ['date', 'action']
+    search_fields = ['action', 'project__name']
+    date_hierarchy = 'date'
+
+@admin.register(TeamAnalysisRun)
+class TeamAnalysisRunAdmin(admin.ModelAdmin):
+    list_display = ['date', 'status', 'total', 'analyzed', 'failed', 'updated_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['started_at', 'updated_at', 'finished_at']
+    date_hierarchy = 'date'
@@ -0,0 +1,251 @@
+"""
+Content-addressed cache for AI completions.
+
+Responses are keyed on a hash of everything that determines them: the model,
+system message, prompt and temperature. Lookups go through two tiers:
+
+* an in-process LRU, so a repeat within one worker costs a dict lookup
+* Redis, shared by every process, bounded to ``AI_CACHE_MAX_ENTRIES`` with
+  least-recently-used eviction tracked in a sorted set. Without Redis the
+  default Django cache is used instead.
+
+Pass ``bypass=True`` (or set ``AI_CACHE_ENABLED = False``) to always call
+the model. Hits and misses are counted per process and in Redis; see
+``get_cache_stats``.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ai:response:'
+LRU_INDEX_KEY = 'ai:response:lru'
+STATS_KEY = 'ai:response:stats'
+
+_MISSING = object()
+
+
+def response_key(model, prompt, temperature, system=None):
+    """Hash the inputs of a completion into its cache key."""
+    payload = json.dumps(
+        {'model': model, 'system': system, 'prompt': prompt, 'temperature': temperature},
+        sort_keys=True,
+    )
+    return KEY_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LocalLRU:
+    """A small thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisTier:
+    """Shared tier with a size bound enforced through an access-time index."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        if value is None:
+            # Expired by TTL; drop it from the index as well
+            self.client.zrem(LRU_INDEX_KEY, key)
+            return _MISSING
+        self.client.zadd(LRU_INDEX_KEY, {key: time.time()})
+        return json.loads(value)
+
+    def set(self, key, value):
+        pipe = self.client.pipeline()
+        pipe.set(key, json.dumps(value), ex=settings.AI_CACHE_TTL)
+        pipe.zadd(LRU_INDEX_KEY, {key: time.time()})
+        pipe.zcard(LRU_INDEX_KEY)
+        size = pipe.execute()[-1]
+        excess = size - settings.AI_CACHE_MAX_ENTRIES
+        if excess > 0:
+            evicted = self.client.zrange(LRU_INDEX_KEY, 0, excess - 1)
+            if evicted:
+                pipe = self.client.pipeline()
+                pipe.delete(*evicted)
+                pipe.zrem(LRU_INDEX_KEY, *evicted)
+                pipe.execute()
+            record('evictions', len(evicted))
+
+
+class CacheTier:
+    """Shared tier on the Django cache, for deployments without Redis."""
+
+    def get(self, key):
+        return cache.get(key, _MISSING)
+
+    def set(self, key, value):
+        cache.set(key, value, settings.AI_CACHE_TTL)
+
+
+_local = None
+_local_lock = threading.Lock()
+_stats = Counter()
+_pending = Counter()
+
+
+def _local_tier():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = LocalLRU(settings.AI_CACHE_LOCAL_MAX_ENTRIES, settings.AI_CACHE_LOCAL_TTL)
+    return _local
+
+
+def _shared_tier():
+    client = get_redis()
+    return RedisTier(client) if client is not None else CacheTier()
+
+
+def record(event, amount=1):
+    """
+    Count a cache event. Counts are kept per process and added to the shared
+    Redis totals the next time the cache talks to Redis anyway.
+    """
+    with _local_lock:
+        _stats[event] += amount
+        _pending[event] += amount
+
+
+def _flush_stats():
+    client = get_redis()
+    if client is None:
+        return
+    with _local_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+    try:
+        pipe = client.pipeline()
+        for event, amount in pending.items():
+            pipe.hincrby(STATS_KEY, event, amount)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record AI cache stats: {e}")
+
+
+def get_cache_stats():
+    """Return ``{'process': {...}, 'shared': {...}}`` hit/miss counters."""
+    shared = {}
+    client = get_redis()
+    if client is not None:
+        try:
+            shared = {event: int(n) for event, n in client.hgetall(STATS_KEY).items()}
+        except Exception as e:
+            logger.warning(f"Could not read AI cache stats: {e}")
+    return {'process': dict(_stats), 'shared': shared}
+
+
+def get_cached(key):
+    """Look a response up in both tiers. Returns None on a miss."""
+    local = _local_tier()
+    value = local.get(key)
+    if value is not _MISSING:
+        record('local_hits')
+        return value
+    try:
+        value = _shared_tier().get(key)
+    except Exception as e:
+        logger.warning(f"AI cache read failed: {e}")
+        value = _MISSING
+    if value is _MISSING:
+        record('misses')
+        return None
+    record('shared_hits')
+    _flush_stats()
+    local.set(key, value)
+    return value
+
+
+def set_cached(key, value):
+    _local_tier().set(key, value)
+    try:
+        _shared_tier().set(key, value)
+    except Exception as e:
+        logger.warning(f"AI cache write failed: {e}")
+    _flush_stats()
+
+
+def cached_completion(compute, model, prompt, temperature, system=None, bypass=False):
+    """
+    Return the cached response for these inputs, or call ``compute()`` and
+    cache what it returns. Only non-empty string responses are stored.
+    """
+    if bypass or not settings.AI_CACHE_ENABLED:
+        record('bypassed')
+        return compute()
+    key = response_key(model, prompt, temperature, system)
+    value = get_cached(key)
+    if value is not None:
+        return value
+    value = compute()
+    if isinstance(value, str) and value:
+        set_cached(key, value)
+    return value
+
+
+async def acached_completion(compute, model, prompt, temperature, system=None, bypass=False):
+    """
+    Async cached_completion; ``compute`` is a coroutine function. The cache
+    is read and written from a worker thread, but only briefly; nothing
+    holds a thread while the model is working.
+    """
+    if bypass or not settings.AI_CACHE_ENABLED:
+        record('bypassed')
+        return await compute()
+    key = response_key(model, prompt, temperature, system)
+    value = await sync_to_async(get_cached, thread_sensitive=False)(key)
+    if value is not None:
+        return value
+    value = await compute()
+    if isinstance(value, str) and value:
+        await sync_to_async(set_cached, thread_sensitive=False)(key, value)
+    return value
+
+
+def clear_local_cache():
+    """Empty this process's in-memory tier."""
+    _local_tier().clear()
@@ -0,0 +1,209 @@
+"""
+Process-wide OpenAI client.
+
+The client is created on first use rather than at import, so web workers
+and management commands that never call the model don't pay for it. All
+callers in a process share it, and with it one pooled HTTP/2 connection
+set, so steady-state requests reuse warm TLS connections.
+
+Async code uses an AsyncOpenAI client instead, one per event loop since
+its connections belong to the loop that opened them. At most
+AI_MAX_CONCURRENCY requests per loop are in flight at once; the rest wait
+on a semaphore without holding a thread. Sync code such as Celery tasks can
+hand coroutines to ``run_async``, which runs them on a long-lived loop in a
+background thread, so one worker process keeps many requests in flight and
+its async connections survive from one task to the next.
+
+A forked child (Celery prefork workers, preloaded gunicorn workers) must not
+share its parent's sockets or event loop thread, so both are dropped in the
+child after a fork and rebuilt there on first use.
+"""
+import asyncio
+import os
+import threading
+import weakref
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+_semaphores = weakref.WeakKeyDictionary()
+_loop = None
+
+
+def _http_options():
+    import httpx
+
+    timeout = httpx.Timeout(
+        settings.OPENAI_TIMEOUT,
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+    )
+    return timeout, {
+        'http2': settings.OPENAI_HTTP2,
+        'timeout': timeout,
+        'limits': httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def _build_client():
+    import httpx
+    from openai import OpenAI
+
+    timeout, options = _http_options()
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        timeout=timeout,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=httpx.Client(**options),
+    )
+
+
+def _build_async_client():
+    import httpx
+    from openai import AsyncOpenAI
+
+    timeout, options = _http_options()
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        timeout=timeout,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=httpx.AsyncClient(**options),
+    )
+
+
+def get_client():
+    """Return this process's OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def reset_client(close=True):
+    """
+    Drop the shared client so the next call builds a new one. In a forked
+    child pass ``close=False``: the sockets still belong to the parent.
+    """
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None and close:
+        client.close()
+
+
+def stream_completion(on_chunk, **params):
+    """
+    Create a chat completion with ``stream=True``, passing each piece of
+    content to ``on_chunk`` as it arrives. Returns the whole text.
+    """
+    parts = []
+    for event in get_client().chat.completions.create(stream=True, **params):
+        if not event.choices:
+            continue
+        text = event.choices[0].delta.content
+        if text:
+            parts.append(text)
+            on_chunk(text)
+    return ''.join(parts)
+
+
+def get_async_client():
+    """Return the AsyncOpenAI client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                client = _async_clients[loop] = _build_async_client()
+    return client
+
+
+def concurrency_limit():
+    """
+    The running loop's semaphore for AI requests:
+
+        async with concurrency_limit():
+            await get_async_client().chat.completions.create(...)
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        with _lock:
+            semaphore = _semaphores.get(loop)
+            if semaphore is None:
+                semaphore = _semaphores[loop] = asyncio.Semaphore(settings.AI_MAX_CONCURRENCY)
+    return semaphore
+
+
+async def astream_completion(on_chunk, **params):
+    """Async stream_completion."""
+    parts = []
+    stream = await get_async_client().chat.completions.create(stream=True, **params)
+    async for event in stream:
+        if not event.choices:
+            continue
+        text = event.choices[0].delta.content
+        if text:
+            parts.append(text)
+            on_chunk(text)
+    return ''.join(parts)
+
+
+def _background_loop():
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='ai-event-loop', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_async(coro):
+    """
+    Run a coroutine on this process's AI event loop and wait for its result.
+    For sync callers only: calling it from that loop would deadlock.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def gather(*aws):
+    """
+    ``run_async(asyncio.gather(*aws, return_exceptions=True))``: run the
+    coroutines concurrently and return their results, or the exceptions
+    they raised, in order.
+    """
+    async def gather_all():
+        return await asyncio.gather(*aws, return_exceptions=True)
+    return run_async(gather_all())
+
+
+def _forget_client_after_fork():
+    global _client, _lock, _loop, _async_clients, _semaphores
+    _lock = threading.Lock()
+    _client = None
+    # The loop's thread doesn't survive the fork
+    _loop = None
+    _async_clients = weakref.WeakKeyDictionary()
+    _semaphores = weakref.WeakKeyDictionary()
+
+
+def _reset_in_worker(**kwargs):
+    reset_client(close=False)
+
+
+def connect_signals():
+    from celery.signals import worker_process_init
+    worker_process_init.connect(_reset_in_worker, weak=False)
+
+
+os.register_at_fork(after_in_child=_forget_client_after_fork)
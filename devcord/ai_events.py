@@ -0,0 +1,95 @@
+"""
+Completion events for AI-processed items.
+
+When a task finishes a standup summary, code review or feature plan it calls
+``publish_completion``. This does two things:
+
+* It sends an ``ai.completed`` event to the Channels group of each user
+  waiting on the item. AIEventsConsumer passes the event on to every tab
+  those users have open.
+* It publishes the same payload on a Redis pub/sub channel for the item,
+  where ``check_ai_status`` long polls are waiting for it.
+
+Neither path reads the database; the event carries the result.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    return f'ai-events.user.{user_id}'
+
+
+def pubsub_channel(model_type, item_id):
+    return f'ai:events:{model_type}:{item_id}'
+
+
+def publish_completion(model_type, item_id, user_ids, data):
+    """Tell ``user_ids`` and any long polls that an item's result is ready."""
+    event = {'model_type': model_type, 'item_id': item_id, 'status': 'ready', 'data': data}
+
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        for user_id in {user_id for user_id in user_ids if user_id}:
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    user_group(user_id), {'type': 'ai.completed', **event}
+                )
+            except Exception as e:
+                logger.warning(f"Could not send AI completion to user {user_id}: {e}")
+
+    client = get_redis()
+    if client is not None:
+        try:
+            client.publish(pubsub_channel(model_type, item_id), json.dumps(event))
+        except Exception as e:
+            logger.warning(f"Could not publish AI completion for {model_type} {item_id}: {e}")
+
+
+def wait_for_completion(model_type, item_id, timeout, check):
+    """
+    Return an item's result, waiting up to ``timeout`` seconds for it.
+
+    ``check()`` reads the current result (None while pending). It is called
+    once, after subscribing, so a result that lands in between is not
+    missed. Without Redis there is nothing to wait on and the current
+    result is returned straight away.
+    """
+    client = get_redis()
+    if client is None:
+        return check()
+
+    channel = pubsub_channel(model_type, item_id)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        try:
+            pubsub.subscribe(channel)
+        except Exception as e:
+            logger.warning(f"Could not subscribe to {channel}: {e}")
+            return check()
+        data = check()
+        if data is not None:
+            return data
+        return _next_result(pubsub, channel, timeout)
+    finally:
+        pubsub.close()
+
+
+def _next_result(pubsub, channel, timeout):
+    deadline = time.monotonic() + timeout
+    try:
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = pubsub.get_message(timeout=remaining)
+            if message and message['type'] == 'message':
+                return json.loads(message['data'])['data']
+    except Exception as e:
+        logger.warning(f"Long poll on {channel} failed: {e}")
+    return None
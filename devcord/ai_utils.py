@@ -1,54 +1,144 @@
+import inspect
+import json
 import os
-from typing import List, Dict, Any
-from openai import OpenAI
+import re
+from typing import List, Dict, Any, Callable, Optional
 from django.conf import settings
 from functools import wraps
 import logging
 
+from asgiref.sync import sync_to_async
+
+from .ai_cache import acached_completion, cached_completion
+from .ai_client import (
+    astream_completion, concurrency_limit, get_async_client, get_client, stream_completion
+)
+from .circuit import aguarded, guarded
+from .ratelimit import RateLimitExceeded, check_ai_rate
+from .review_feedback import parse_feedback
+
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+AI_MODEL = "gpt-4"
 
 def handle_ai_errors(func):
-    """Decorator to handle AI-related errors consistently."""
+    """
+    Decorator to handle AI-related errors consistently. RateLimitExceeded is
+    let through so that tasks can retry once the limit allows.
+    """
+    def failed(e):
+        logger.error(f"AI operation failed in {func.__name__}: {str(e)}")
+        return {
+            "error": True,
+            "message": "AI operation failed. Please try again later.",
+            "details": str(e) if settings.DEBUG else None
+        }
+
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                return failed(e)
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except RateLimitExceeded:
+            raise
         except Exception as e:
-            logger.error(f"AI operation failed in {func.__name__}: {str(e)}")
-            return {
-                "error": True,
-                "message": "AI operation failed. Please try again later.",
-                "details": str(e) if settings.DEBUG else None
-            }
+            return failed(e)
     return wrapper
 
-def get_ai_response(prompt: str, temperature: float = 0.7) -> str:
+def get_ai_response(prompt: str, temperature: float = 0.7, use_cache: bool = True,
+                    on_chunk: Optional[Callable[[str], None]] = None,
+                    team_id: Optional[int] = None) -> str:
     """
     Get a response from OpenAI's API using the latest client.
+
+    Identical requests are answered from the AI response cache unless
+    ``use_cache`` is False. With ``on_chunk`` the response is streamed and
+    each piece of text is passed to it as it arrives; a cached response is
+    passed in one piece.
+
+    Requests that reach the API count against the model's rate limit and,
+    given ``team_id``, the team's. Raises RateLimitExceeded when either is
+    used up, or CircuitOpen or ProviderBusy (both RateLimitExceeded) when
+    the provider's circuit breaker turns the request away.
     """
+    streamed = False
+
+    def complete():
+        nonlocal streamed
+        check_ai_rate(AI_MODEL, team_id)
+        params = {
+            "model": AI_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+        }
+        with guarded():
+            if on_chunk is not None:
+                streamed = True
+                return stream_completion(on_chunk, **params)
+            response = get_client().chat.completions.create(**params)
+            return response.choices[0].message.content
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature,
-        )
-        return response.choices[0].message.content
+        response = cached_completion(complete, AI_MODEL, prompt, temperature, bypass=not use_cache)
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         logger.error(f"Error getting AI response: {e}")
         raise
+    if on_chunk is not None and not streamed:
+        on_chunk(response)
+    return response
 
-@handle_ai_errors
-def generate_standup_summary(commits: List[str], tasks: List[Dict[str, Any]], mood: str) -> Dict[str, Any]:
+async def aget_ai_response(prompt: str, temperature: float = 0.7, use_cache: bool = True,
+                           on_chunk: Optional[Callable[[str], None]] = None,
+                           team_id: Optional[int] = None) -> str:
     """
-    Generate an AI summary for a daily standup based on commits and tasks.
+    Async get_ai_response. Requests beyond AI_MAX_CONCURRENCY on the same
+    event loop wait for a free slot.
     """
+    streamed = False
+
+    async def complete():
+        nonlocal streamed
+        await sync_to_async(check_ai_rate, thread_sensitive=False)(AI_MODEL, team_id)
+        params = {
+            "model": AI_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+        }
+        async with concurrency_limit(), aguarded():
+            if on_chunk is not None:
+                streamed = True
+                return await astream_completion(on_chunk, **params)
+            response = await get_async_client().chat.completions.create(**params)
+            return response.choices[0].message.content
+
+    try:
+        response = await acached_completion(complete, AI_MODEL, prompt, temperature, bypass=not use_cache)
+    except RateLimitExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting AI response: {e}")
+        raise
+    if on_chunk is not None and not streamed:
+        on_chunk(response)
+    return response
+
+def _standup_prompt(commits: List[str], tasks: List[Dict[str, Any]], mood: str) -> str:
     commits_text = '\\n'.join(commits)
     tasks_text = '\\n'.join([f"- {task['title']}: {task['status']}" for task in tasks])
     
-    prompt = (
+    return (
         f"Generate a concise daily standup summary based on the following information:\\n\\n"
         f"Commits:\\n{commits_text}\\n\\n"
         f"Tasks:\\n{tasks_text}\\n\\n"
@@ -59,15 +149,74 @@ def generate_standup_summary(commits: List[str], tasks: List[Dict[str, Any]], mo
         f"3. Any potential blockers\\n"
         f"4. Overall progress assessment"
     )
-    summary = get_ai_response(prompt, temperature=0.5)
+
+@handle_ai_errors
+def generate_standup_summary(commits: List[str], tasks: List[Dict[str, Any]], mood: str,
+                             team_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Generate an AI summary for a daily standup based on commits and tasks.
+    """
+    summary = get_ai_response(_standup_prompt(commits, tasks, mood), temperature=0.5, team_id=team_id)
+    return {"summary": summary, "error": False}
+
+@handle_ai_errors
+async def agenerate_standup_summary(commits: List[str], tasks: List[Dict[str, Any]], mood: str,
+                                    team_id: Optional[int] = None) -> Dict[str, Any]:
+    """Async generate_standup_summary."""
+    summary = await aget_ai_response(_standup_prompt(commits, tasks, mood), temperature=0.5, team_id=team_id)
     return {"summary": summary, "error": False}
 
 @handle_ai_errors
-def review_code(code: str, language: str = "python") -> Dict[str, Any]:
+def generate_standup_summaries(standups: List[Dict[str, Any]],
+                               team_id: Optional[int] = None) -> Dict[str, Any]:
     """
-    Generate an AI code review with suggestions and improvements.
+    Generate summaries for several standups of one team with a single
+    prompt. Each standup is a dict with ``id``, ``tasks``, ``mood`` and,
+    optionally, ``commits``.
+    ``summaries`` maps standup id to summary; standups the response leaves
+    out are missing from it.
     """
+    sections = []
+    for standup in standups:
+        commits_text = '\n'.join(standup.get('commits', [])) or 'None'
+        tasks_text = '\n'.join(
+            f"- {task['title']}: {task['status']}" for task in standup['tasks']
+        ) or 'None'
+        sections.append(
+            f"Standup {standup['id']}:\n"
+            f"Commits:\n{commits_text}\n"
+            f"Tasks:\n{tasks_text}\n"
+            f"Developer's Mood: {standup['mood']}"
+        )
+
     prompt = (
+        "Generate a concise daily standup summary for each of the standups below.\n"
+        "Format each summary into:\n"
+        "1. What was accomplished\n"
+        "2. What's planned\n"
+        "3. Any potential blockers\n"
+        "4. Overall progress assessment\n\n"
+        "Respond with only a JSON object mapping each standup's number to its "
+        "summary, for example {\"12\": \"...\", \"15\": \"...\"}.\n\n"
+        + '\n\n'.join(sections)
+    )
+    response = get_ai_response(prompt, temperature=0.5, team_id=team_id)
+    return {"summaries": parse_standup_summaries(response), "error": False}
+
+def parse_standup_summaries(response: str) -> Dict[int, str]:
+    """Read the ``{"<standup id>": "<summary>"}`` object out of a batch response."""
+    start, end = response.find('{'), response.rfind('}')
+    if start == -1 or end < start:
+        raise ValueError("No JSON object in batch standup response")
+    data = json.loads(response[start:end + 1])
+    return {
+        int(standup_id): summary.strip()
+        for standup_id, summary in data.items()
+        if str(standup_id).isdigit() and isinstance(summary, str) and summary.strip()
+    }
+
+def _review_prompt(code: str, language: str) -> str:
+    return (
         f"Review this {language} code and provide a structured analysis:\\n\\n"
         f"{language} code:\\n{code}\\n\\n"
         f"Please provide:\\n"
@@ -78,21 +227,31 @@ def review_code(code: str, language: str = "python") -> Dict[str, Any]:
         f"5. Security concerns (if any)\\n"
         f"6. Specific improvement recommendations"
     )
-    review = get_ai_response(prompt, temperature=0.3)
-    
+
+def _review_result(review: str) -> Dict[str, Any]:
     severity = "low" if "no major issues" in review.lower() else "medium"
     return {
         "review": review,
         "severity": severity,
-        "error": False
+        "error": False,
+        # Parsed once here and stored, so readers get the sections as data
+        **parse_feedback(review),
     }
 
 @handle_ai_errors
-def generate_feature_plan(idea: str) -> Dict[str, Any]:
+def review_code(code: str, language: str = "python",
+                on_chunk: Optional[Callable[[str], None]] = None,
+                team_id: Optional[int] = None) -> Dict[str, Any]:
     """
-    Generate an AI-powered feature planning breakdown.
+    Generate an AI code review with suggestions and improvements.
+    Pass ``on_chunk`` to receive the review text as it is generated.
     """
-    prompt = (
+    review = get_ai_response(_review_prompt(code, language), temperature=0.3,
+                             on_chunk=on_chunk, team_id=team_id)
+    return _review_result(review)
+
+def _feature_plan_prompt(idea: str) -> str:
+    return (
         f"Create a detailed feature planning breakdown for the following idea:\\n"
         f"{idea}\\n\\n"
         f"Please provide:\\n"
@@ -102,8 +261,8 @@ def generate_feature_plan(idea: str) -> Dict[str, Any]:
         f"4. Potential challenges\\n"
         f"5. Estimated effort (in story points)"
     )
-    plan = get_ai_response(prompt, temperature=0.4)
-    
+
+def _feature_plan_result(plan: str) -> Dict[str, Any]:
     return {
         "plan": plan,
         "type": "feature_plan",
@@ -111,30 +270,43 @@ def generate_feature_plan(idea: str) -> Dict[str, Any]:
     }
 
 @handle_ai_errors
-def analyze_team_vibe(messages: List[str], activities: List[Dict[str, Any]]) -> Dict[str, Any]:
+def generate_feature_plan(idea: str, on_chunk: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     """
-    Analyze team vibe based on messages and activities.
+    Generate an AI-powered feature planning breakdown.
+    Pass ``on_chunk`` to receive the plan text as it is generated.
     """
-    messages_text = '\\n'.join(messages)
-    activities_text = '\\n'.join([f"- {activity['type']}: {activity['description']}" for activity in activities])
+    plan = get_ai_response(_feature_plan_prompt(idea), temperature=0.4, on_chunk=on_chunk)
+    return _feature_plan_result(plan)
+
+def _team_vibe_prompt(messages: List[str], activities: List[Dict[str, Any]]) -> str:
+    messages_text = '\n'.join(messages) or 'None'
+    activities_text = '\n'.join([f"- {activity['type']}: {activity['description']}" for activity in activities]) or 'None'
     
-    prompt = (
-        f"Analyze the team's vibe based on the following data:\\n\\n"
-        f"Recent Messages:\\n{messages_text}\\n\\n"
-        f"Activities:\\n{activities_text}\\n\\n"
-        f"Provide:\\n"
-        f"1. Overall team mood assessment\\n"
-        f"2. Productivity indicators\\n"
-        f"3. Collaboration quality\\n"
-        f"4. Stress/workload balance\\n"
-        f"5. Numeric vibe score (0-10)"
+    return (
+        f"Analyze the team's vibe based on the following data:\n\n"
+        f"Recent Messages:\n{messages_text}\n\n"
+        f"Activities:\n{activities_text}\n\n"
+        f"Provide:\n"
+        f"1. Overall team mood assessment\n"
+        f"2. Productivity indicators\n"
+        f"3. Collaboration quality\n"
+        f"4. Stress/workload balance\n"
+        f"5. Numeric vibe score (0-10), on its own line as \"Vibe score: <number>\""
     )
-    analysis = get_ai_response(prompt, temperature=0.4)
-    
+
+VIBE_SCORE = re.compile(r'score\W*(\d+(?:\.\d+)?)', re.I)
+# "(0-10)" and "/10" are the scale, not the score
+SCORE_SCALE = re.compile(r'\(?\b0\s*-\s*10\b\)?|/\s*10\b')
+
+def _team_vibe_result(analysis: str) -> Dict[str, Any]:
     # Extract numeric score from analysis
-    try:
-        score = float([line for line in analysis.split('\\n') if 'score' in line.lower()][0].split(':')[1].strip())
-    except:
+    match = None
+    for line in analysis.split('\n'):
+        if 'score' in line.lower():
+            match = VIBE_SCORE.search(SCORE_SCALE.sub('', line)) or match
+    if match:
+        score = min(10.0, max(0.0, float(match.group(1))))
+    else:
         score = 7.0  # Default score if parsing fails
         logger.warning("Could not parse vibe score from AI response, using default")
     
@@ -142,4 +314,13 @@ def analyze_team_vibe(messages: List[str], activities: List[Dict[str, Any]]) ->
         "analysis": analysis,
         "vibe_score": score,
         "error": False
-    } 
\ No newline at end of file
+    }
+
+@handle_ai_errors
+def analyze_team_vibe(messages: List[str], activities: List[Dict[str, Any]],
+                      team_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Analyze team vibe based on messages and activities.
+    """
+    analysis = get_ai_response(_team_vibe_prompt(messages, activities), temperature=0.4, team_id=team_id)
+    return _team_vibe_result(analysis)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class DevcordConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'devcord'
+
+    def ready(self):
+        from . import activity, ai_client, memberships, stats
+        activity.connect_signals()
+        ai_client.connect_signals()
+        memberships.connect_signals()
+        stats.connect_signals()
@@ -0,0 +1,462 @@
+"""
+Circuit breaker and adaptive concurrency for the AI provider.
+
+Every call to the provider is made inside ``guarded()``, which first asks
+for admission and afterwards reports how the call went. The state behind
+both is shared by all workers through Redis and updated by Lua scripts.
+
+Circuit breaker. While *closed*, calls are counted in windows of
+CIRCUIT_WINDOW seconds. Once a window has seen CIRCUIT_MIN_CALLS calls and
+the share that failed reaches AI_CIRCUIT_FAILURE_RATE, or the share slower
+than AI_CIRCUIT_SLOW_CALL_SECONDS reaches CIRCUIT_SLOW_CALL_RATE, the
+circuit *opens*. Calls are then refused straight away with CircuitOpen
+for AI_CIRCUIT_OPEN_SECONDS. After that the circuit is *half open*: a round
+of CIRCUIT_HALF_OPEN_PROBES probe calls goes through. If they all succeed
+the circuit closes. If one fails it opens again, for twice as long, up to
+CIRCUIT_MAX_OPEN_SECONDS. A probe that says nothing about the provider (a
+400, a cancelled call) gives its place back, and once every probe's lease
+has expired without an answer a new round starts, so lost probes can't
+hold the circuit half open.
+
+Adaptive concurrency. Calls in flight across all workers are capped by a
+limit between AI_CONCURRENCY_MIN and AI_CONCURRENCY_MAX. Each good call
+raises the limit by 1/limit, so about one per round of calls. A failed or
+slow call halves it, at most once a second (AIMD). Calls over the limit are
+refused with ProviderBusy. Each admitted call holds a lease that expires on
+its own, so a crashed worker can't keep its slot.
+
+Both refusals are RateLimitExceeded subclasses carrying a wait, so tasks
+that already retry on rate limits defer themselves the same way. Without
+Redis the same rules run per process.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .ratelimit import RateLimitExceeded
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'circuit:'
+
+CIRCUIT_WINDOW = 60
+CIRCUIT_MIN_CALLS = 10
+CIRCUIT_SLOW_CALL_RATE = 0.5
+CIRCUIT_MAX_OPEN_SECONDS = 10 * 60
+CIRCUIT_HALF_OPEN_PROBES = 3
+# State of a circuit nobody has called for this long is dropped
+CIRCUIT_STATE_TTL = 24 * 60 * 60
+
+CONCURRENCY_INCREASE = 1.0
+CONCURRENCY_DECREASE_FACTOR = 0.5
+CONCURRENCY_DECREASE_INTERVAL = 1.0
+# How long to wait before trying again when every slot is taken
+BUSY_WAIT = 1.0
+
+# Outcomes reported to ``complete``
+OK, FAILED, IGNORED = 1, 0, -1
+
+# An admitted call. ``probe_round`` is the half-open round it probes for,
+# or 0 if it isn't a probe.
+Lease = namedtuple('Lease', 'id probe_round')
+
+# KEYS: state hash, lease sorted set. ARGV: lease id, lease ttl, probes,
+# initial limit, min limit, busy wait, state ttl. Returns {verdict, wait,
+# probe round}.
+ADMIT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local lease_id, lease_ttl = ARGV[1], tonumber(ARGV[2])
+local probes, initial, min_limit = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local busy_wait = ARGV[6]
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local new_round = false
+if state == 'open' then
+    local open_until = tonumber(redis.call('HGET', KEYS[1], 'open_until')) or 0
+    if now < open_until then
+        return {'open', tostring(open_until - now), 0}
+    end
+    redis.call('HSET', KEYS[1], 'state', 'half_open')
+    state = 'half_open'
+    new_round = true
+end
+local round = 0
+if state == 'half_open' then
+    if not new_round and (tonumber(redis.call('HGET', KEYS[1], 'probes')) or 0) >= probes then
+        -- Wait for the round's probes, unless their leases have all expired
+        if now < (tonumber(redis.call('HGET', KEYS[1], 'probes_until')) or 0) then
+            return {'open', busy_wait, 0}
+        end
+        new_round = true
+    end
+    if new_round then
+        round = redis.call('HINCRBY', KEYS[1], 'round', 1)
+        redis.call('HSET', KEYS[1], 'probes', 0, 'probe_ok', 0)
+    else
+        round = tonumber(redis.call('HGET', KEYS[1], 'round')) or 0
+    end
+end
+
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit')) or initial
+if redis.call('ZCARD', KEYS[2]) >= math.max(min_limit, math.floor(limit)) then
+    return {'busy', busy_wait, 0}
+end
+redis.call('ZADD', KEYS[2], now + lease_ttl, lease_id)
+redis.call('EXPIRE', KEYS[2], math.ceil(lease_ttl * 2))
+if state == 'half_open' then
+    redis.call('HINCRBY', KEYS[1], 'probes', 1)
+    redis.call('HSET', KEYS[1], 'probes_until', now + lease_ttl)
+end
+return {'ok', '0', round}
+"""
+
+# KEYS: state hash, lease sorted set. ARGV: lease id, outcome, slow, probe
+# round, then the thresholds in the order of ``_complete_args``. Returns the
+# state.
+COMPLETE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local outcome, slow, probe_round = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local window, min_calls = tonumber(ARGV[5]), tonumber(ARGV[6])
+local failure_rate, slow_rate = tonumber(ARGV[7]), tonumber(ARGV[8])
+local open_seconds, max_open = tonumber(ARGV[9]), tonumber(ARGV[10])
+local probes = tonumber(ARGV[11])
+local initial, min_limit, max_limit = tonumber(ARGV[12]), tonumber(ARGV[13]), tonumber(ARGV[14])
+local increase, factor, interval = tonumber(ARGV[15]), tonumber(ARGV[16]), tonumber(ARGV[17])
+redis.call('EXPIRE', KEYS[1], ARGV[18])
+
+redis.call('ZREM', KEYS[2], ARGV[1])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+-- Only probes of the current round decide a half-open circuit
+local probe = state == 'half_open' and probe_round > 0
+    and tonumber(redis.call('HGET', KEYS[1], 'round')) == probe_round
+if outcome < 0 then
+    if probe then
+        redis.call('HINCRBY', KEYS[1], 'probes', -1)
+    end
+    return state
+end
+local good = outcome == 1 and slow == 0
+
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit')) or initial
+if good then
+    redis.call('HSET', KEYS[1], 'limit', math.min(max_limit, limit + increase / limit))
+else
+    local last = tonumber(redis.call('HGET', KEYS[1], 'last_decrease')) or 0
+    if now - last >= interval then
+        redis.call('HSET', KEYS[1], 'limit', math.max(min_limit, limit * factor), 'last_decrease', now)
+    end
+end
+
+if state == 'half_open' then
+    if not probe then
+        return state
+    end
+    if not good then
+        local open_for = tonumber(redis.call('HGET', KEYS[1], 'open_for')) or 0
+        open_for = math.min(max_open, math.max(open_seconds, open_for * 2))
+        redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + open_for, 'open_for', open_for)
+        return 'open'
+    end
+    if redis.call('HINCRBY', KEYS[1], 'probe_ok', 1) >= probes then
+        redis.call('HSET', KEYS[1], 'state', 'closed', 'window_start', now,
+                   'calls', 0, 'failures', 0, 'slow', 0, 'open_for', 0)
+        return 'closed'
+    end
+    return 'half_open'
+end
+if state == 'open' then
+    return 'open'
+end
+
+local start = tonumber(redis.call('HGET', KEYS[1], 'window_start')) or now
+local calls, failures, slow_calls = 0, 0, 0
+if now - start < window then
+    calls = tonumber(redis.call('HGET', KEYS[1], 'calls')) or 0
+    failures = tonumber(redis.call('HGET', KEYS[1], 'failures')) or 0
+    slow_calls = tonumber(redis.call('HGET', KEYS[1], 'slow')) or 0
+else
+    start = now
+end
+calls = calls + 1
+if outcome == 0 then failures = failures + 1 end
+if slow == 1 then slow_calls = slow_calls + 1 end
+redis.call('HSET', KEYS[1], 'window_start', start, 'calls', calls, 'failures', failures, 'slow', slow_calls)
+
+if calls >= min_calls and (failures / calls >= failure_rate or slow_calls / calls >= slow_rate) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + open_seconds, 'open_for', open_seconds)
+    return 'open'
+end
+return 'closed'
+"""
+
+
+class CircuitOpen(RateLimitExceeded):
+    """The provider's circuit is open; calls are refused until ``wait`` passes."""
+
+    def __init__(self, wait):
+        super().__init__(wait, f"AI provider unavailable, circuit open for {wait:.0f} more seconds.")
+
+
+class ProviderBusy(RateLimitExceeded):
+    """Every concurrency slot for the provider is in use."""
+
+    def __init__(self, wait):
+        super().__init__(wait, "AI provider at its concurrency limit.")
+
+
+def is_provider_failure(exc):
+    """
+    Whether an error says something about the provider's health: timeouts,
+    connection errors, 429s and 5xx responses. Errors in our own requests,
+    such as a 400, don't count.
+    """
+    import openai
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    status = getattr(exc, 'status_code', None)
+    return status is not None and status >= 500
+
+
+def _lease_ttl():
+    # Long enough for the slowest call the client will make, retries included
+    return settings.OPENAI_TIMEOUT * (settings.OPENAI_MAX_RETRIES + 1) + 5
+
+
+def _complete_args():
+    # The limit starts at the maximum and backs off from there
+    return [
+        CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS,
+        settings.AI_CIRCUIT_FAILURE_RATE, CIRCUIT_SLOW_CALL_RATE,
+        settings.AI_CIRCUIT_OPEN_SECONDS, CIRCUIT_MAX_OPEN_SECONDS,
+        CIRCUIT_HALF_OPEN_PROBES,
+        settings.AI_CONCURRENCY_MAX, settings.AI_CONCURRENCY_MIN, settings.AI_CONCURRENCY_MAX,
+        CONCURRENCY_INCREASE, CONCURRENCY_DECREASE_FACTOR, CONCURRENCY_DECREASE_INTERVAL,
+        CIRCUIT_STATE_TTL,
+    ]
+
+
+class LocalCircuit:
+    """The same rules kept in memory, for processes without Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = 'closed'
+            self.open_until = 0
+            self.open_for = 0
+            self.round = 0
+            self.probes = 0
+            self.probe_ok = 0
+            self.probes_until = 0
+            self.window_start = None
+            self.calls = self.failures = self.slow = 0
+            self.limit = None
+            self.last_decrease = 0
+            self.leases = {}
+
+    def admit(self, lease_id):
+        now = time.monotonic()
+        with self._lock:
+            new_round = False
+            if self.state == 'open':
+                if now < self.open_until:
+                    return 'open', self.open_until - now, 0
+                self.state, new_round = 'half_open', True
+            if self.state == 'half_open' and not new_round and self.probes >= CIRCUIT_HALF_OPEN_PROBES:
+                # Wait for the round's probes, unless their leases have all expired
+                if now < self.probes_until:
+                    return 'open', BUSY_WAIT, 0
+                new_round = True
+            if new_round:
+                self.round += 1
+                self.probes, self.probe_ok = 0, 0
+
+            self.leases = {lease: expires for lease, expires in self.leases.items() if expires > now}
+            limit = self.limit if self.limit is not None else settings.AI_CONCURRENCY_MAX
+            if len(self.leases) >= max(settings.AI_CONCURRENCY_MIN, int(limit)):
+                return 'busy', BUSY_WAIT, 0
+            self.leases[lease_id] = now + _lease_ttl()
+            if self.state == 'half_open':
+                self.probes += 1
+                self.probes_until = now + _lease_ttl()
+                return 'ok', 0, self.round
+            return 'ok', 0, 0
+
+    def complete(self, lease_id, outcome, slow, probe_round=0):
+        now = time.monotonic()
+        with self._lock:
+            self.leases.pop(lease_id, None)
+            # Only probes of the current round decide a half-open circuit
+            probe = self.state == 'half_open' and probe_round and probe_round == self.round
+            if outcome == IGNORED:
+                if probe:
+                    self.probes -= 1
+                return self.state
+            good = outcome == OK and not slow
+
+            limit = self.limit if self.limit is not None else settings.AI_CONCURRENCY_MAX
+            if good:
+                self.limit = min(settings.AI_CONCURRENCY_MAX, limit + CONCURRENCY_INCREASE / limit)
+            elif now - self.last_decrease >= CONCURRENCY_DECREASE_INTERVAL:
+                self.limit = max(settings.AI_CONCURRENCY_MIN, limit * CONCURRENCY_DECREASE_FACTOR)
+                self.last_decrease = now
+
+            if self.state == 'half_open':
+                if not probe:
+                    return self.state
+                if not good:
+                    self.open_for = min(CIRCUIT_MAX_OPEN_SECONDS,
+                                        max(settings.AI_CIRCUIT_OPEN_SECONDS, self.open_for * 2))
+                    self.state, self.open_until = 'open', now + self.open_for
+                else:
+                    self.probe_ok += 1
+                    if self.probe_ok >= CIRCUIT_HALF_OPEN_PROBES:
+                        self.state, self.open_for = 'closed', 0
+                        self.window_start, self.calls, self.failures, self.slow = now, 0, 0, 0
+                return self.state
+            if self.state == 'open':
+                return self.state
+
+            if self.window_start is None or now - self.window_start >= CIRCUIT_WINDOW:
+                self.window_start, self.calls, self.failures, self.slow = now, 0, 0, 0
+            self.calls += 1
+            self.failures += outcome == FAILED
+            self.slow += bool(slow)
+            if self.calls >= CIRCUIT_MIN_CALLS and (
+                self.failures / self.calls >= settings.AI_CIRCUIT_FAILURE_RATE
+                or self.slow / self.calls >= CIRCUIT_SLOW_CALL_RATE
+            ):
+                self.state = 'open'
+                self.open_for = settings.AI_CIRCUIT_OPEN_SECONDS
+                self.open_until = now + self.open_for
+            return self.state
+
+
+_local = {}
+_scripts = {}
+
+
+def _local_circuit(name):
+    circuit = _local.get(name)
+    if circuit is None:
+        circuit = _local.setdefault(name, LocalCircuit())
+    return circuit
+
+
+def _run_script(client, source, keys, args):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = client.register_script(source)
+    return script(keys=keys, args=args, client=client)
+
+
+def _keys(name):
+    return [f'{KEY_PREFIX}{name}', f'{KEY_PREFIX}{name}:leases']
+
+
+def admit(name):
+    """
+    Ask to make a call to ``name``. Returns a Lease to pass to ``complete``,
+    or raises CircuitOpen or ProviderBusy.
+    """
+    lease_id = uuid.uuid4().hex
+    client = get_redis()
+    verdict = None
+    if client is not None:
+        try:
+            verdict, wait, probe_round = _run_script(client, ADMIT_SCRIPT, _keys(name), [
+                lease_id, _lease_ttl(), CIRCUIT_HALF_OPEN_PROBES,
+                settings.AI_CONCURRENCY_MAX, settings.AI_CONCURRENCY_MIN, BUSY_WAIT,
+                CIRCUIT_STATE_TTL,
+            ])
+            wait = float(wait)
+        except Exception as e:
+            logger.warning(f"Circuit state unavailable, using this process's: {e}")
+            verdict = None
+    if verdict is None:
+        verdict, wait, probe_round = _local_circuit(name).admit(lease_id)
+
+    if verdict == 'open':
+        raise CircuitOpen(wait)
+    if verdict == 'busy':
+        raise ProviderBusy(wait)
+    return Lease(lease_id, int(probe_round))
+
+
+def complete(name, lease, duration, error=None):
+    """
+    Report how an admitted call went and give back its lease. ``error`` is
+    the exception the call ended with, if any; errors that aren't provider
+    failures, cancellation included, are ignored.
+    """
+    if error is None:
+        outcome = OK
+    elif is_provider_failure(error):
+        outcome = FAILED
+    else:
+        outcome = IGNORED
+    slow = int(outcome == OK and duration >= settings.AI_CIRCUIT_SLOW_CALL_SECONDS)
+
+    client = get_redis()
+    state = None
+    if client is not None:
+        try:
+            state = _run_script(client, COMPLETE_SCRIPT, _keys(name),
+                                [lease.id, outcome, slow, lease.probe_round] + _complete_args())
+        except Exception as e:
+            logger.warning(f"Circuit state unavailable, using this process's: {e}")
+    if state is None:
+        state = _local_circuit(name).complete(lease.id, outcome, slow, lease.probe_round)
+    if state == 'open' and outcome != OK:
+        logger.warning(f"Circuit for {name} is open after a failed call: {error}")
+    return state
+
+
+@contextmanager
+def guarded(name='openai'):
+    """
+    Run one provider call under the breaker and concurrency limit:
+
+        with guarded():
+            client.chat.completions.create(...)
+    """
+    lease = admit(name)
+    started = time.monotonic()
+    try:
+        yield
+    except BaseException as e:
+        # Interrupted calls give their lease back too
+        complete(name, lease, time.monotonic() - started, e)
+        raise
+    complete(name, lease, time.monotonic() - started)
+
+
+@asynccontextmanager
+async def aguarded(name='openai'):
+    """Async guarded."""
+    lease = await sync_to_async(admit, thread_sensitive=False)(name)
+    started = time.monotonic()
+    try:
+        yield
+    except BaseException as e:
+        # Shielded, so a cancelled call still gives its lease back
+        await asyncio.shield(
+            sync_to_async(complete, thread_sensitive=False)(name, lease, time.monotonic() - started, e)
+        )
+        raise
+    await sync_to_async(complete, thread_sensitive=False)(name, lease, time.monotonic() - started)
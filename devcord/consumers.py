@@ -0,0 +1,112 @@
+"""
+WebSocket consumers for devcord.
+"""
+import json
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .ai_events import user_group
+from .models import CodeReview
+from .streaming import STREAM_TYPES, get_snapshot, get_stream_owner, stream_group
+
+
+class AIEventsConsumer(AsyncWebsocketConsumer):
+    """
+    Tell every open tab of a user when one of their AI-processed items (a
+    standup summary, code review or feature plan) is ready. Sends
+    ``{"type": "completed", "model_type", "item_id", "status", "data"}``.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = user_group(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def ai_completed(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'completed',
+            'model_type': event['model_type'],
+            'item_id': event['item_id'],
+            'status': event['status'],
+            'data': event['data'],
+        }))
+
+
+class AIStreamConsumer(AsyncWebsocketConsumer):
+    """
+    Forward an item's AI output to the page while it is being generated.
+
+    Messages sent to the socket:
+
+    * ``{"type": "snapshot", "text", "done", "result"}`` once on connect
+    * ``{"type": "chunk", "offset", "text"}`` for each new piece of text
+    * ``{"type": "done", "text", "result"}`` when generation has finished
+    * ``{"type": "error", "message"}`` if it failed
+    """
+
+    async def connect(self):
+        kwargs = self.scope['url_route']['kwargs']
+        self.model_type = kwargs['model_type']
+        self.item_id = kwargs['item_id']
+        user = self.scope.get('user')
+
+        if self.model_type not in STREAM_TYPES or not user or not user.is_authenticated:
+            await self.close()
+            return
+        if not await self.can_follow(user):
+            await self.close()
+            return
+
+        self.group_name = stream_group(self.model_type, self.item_id)
+        # Join before reading the snapshot so no chunk falls in between
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        snapshot = await database_sync_to_async(get_snapshot)(self.model_type, self.item_id)
+        if snapshot:
+            await self.send(text_data=json.dumps({'type': 'snapshot', **snapshot}))
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def can_follow(self, user):
+        if self.model_type == 'code-review':
+            if not self.item_id.isdigit():
+                return False
+            review = CodeReview.objects.select_related('project').filter(pk=self.item_id).first()
+            if review is None:
+                return False
+            return user.pk in (review.author_id, review.reviewer_id) or review.project.can_user_view(user)
+        # Feature plans aren't stored; only the user who asked may follow one
+        return get_stream_owner(self.model_type, self.item_id) == user.pk
+
+    async def ai_chunk(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'chunk',
+            'offset': event['offset'],
+            'text': event['text'],
+        }))
+
+    async def ai_done(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'done',
+            'text': event['text'],
+            'result': event['result'],
+        }))
+
+    async def ai_error(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': event['message'],
+        }))
@@ -0,0 +1,186 @@
+"""
+Cached per-user dashboard snapshots.
+
+The dashboard view renders from a precomputed snapshot stored in the cache.
+Writes that change what a user's dashboard shows replace that user's version
+token. A snapshot built against an older token, or past its soft TTL, is
+still served while a Celery task rebuilds it in the background.
+"""
+import logging
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ActivityLog, AIInsight, CodeReview, Project, TeamMember
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TIMEOUT = 60 * 60  # hard expiry of a snapshot and its version token
+SNAPSHOT_FRESH_FOR = 60  # seconds before a snapshot is refreshed regardless
+REFRESH_LOCK_TIMEOUT = 30
+
+
+def _snapshot_key(user_id):
+    return f'dashboard:snapshot:{user_id}'
+
+
+def _version_key(user_id):
+    return f'dashboard:version:{user_id}'
+
+
+def _refresh_lock_key(user_id):
+    return f'dashboard:refreshing:{user_id}'
+
+
+def build_dashboard_context(user):
+    """Run the dashboard queries and return a fully evaluated context."""
+    # Get user's teams
+    user_teams = user.teams.all()
+
+    # Get active projects for user's teams
+    active_projects = list(Project.objects.filter(
+        team__in=user_teams,
+        status='active'
+    ).select_related('team'))
+
+    # Get team members count
+    team_members_count = TeamMember.objects.filter(
+        team__in=user_teams
+    ).values('user').distinct().count()
+
+    # Get pending reviews
+    pending_reviews = CodeReview.objects.filter(
+        Q(project__team__in=user_teams) &
+        (Q(reviewer=user) | Q(author=user)),
+        status='pending'
+    ).select_related('project', 'author')
+
+    # Get recent activities
+    recent_activities = list(
+        ActivityLog.objects.for_teammates(user).select_related('user')[:10]
+    )
+
+    # Get AI insights
+    ai_insights = list(AIInsight.objects.filter(
+        Q(tracker__project__team__in=user_teams),
+        insight_type__in=['code_quality', 'performance', 'security', 'best_practices']
+    ).select_related('tracker', 'tracker__project')[:5])
+
+    context = {
+        'active_projects': active_projects,
+        'active_projects_count': len(active_projects),
+        'team_members_count': team_members_count,
+        'pending_reviews_count': pending_reviews.count(),
+        'recent_activities': recent_activities,
+        'ai_insights': ai_insights,
+        'recent_code_reviews': list(pending_reviews[:5]),
+    }
+
+    # Check if user has any projects
+    if not active_projects:
+        context['show_onboarding'] = True
+
+    return context
+
+
+def store_dashboard_snapshot(user):
+    """Rebuild a user's snapshot, store it and return its context."""
+    # Read the version first so a write racing the rebuild marks it stale
+    version = cache.get(_version_key(user.pk))
+    context = build_dashboard_context(user)
+    cache.set(_snapshot_key(user.pk), {
+        'version': version,
+        'built_at': time.time(),
+        'context': context,
+    }, SNAPSHOT_TIMEOUT)
+    return context
+
+
+def get_dashboard_context(user):
+    """
+    Return the dashboard context for a user with a single cache read.
+
+    Missing snapshots are built inline; stale ones are returned as-is and
+    refreshed in the background.
+    """
+    snapshot_key = _snapshot_key(user.pk)
+    version_key = _version_key(user.pk)
+    cached = cache.get_many([snapshot_key, version_key])
+    snapshot = cached.get(snapshot_key)
+    if snapshot is None:
+        return store_dashboard_snapshot(user)
+
+    expired = time.time() - snapshot['built_at'] > SNAPSHOT_FRESH_FOR
+    if expired or snapshot['version'] != cached.get(version_key):
+        schedule_dashboard_refresh(user.pk)
+    return snapshot['context']
+
+
+def schedule_dashboard_refresh(user_id):
+    """Queue a background rebuild unless one is already pending."""
+    if not cache.add(_refresh_lock_key(user_id), True, REFRESH_LOCK_TIMEOUT):
+        return
+    from .tasks import refresh_dashboard_snapshot
+    try:
+        refresh_dashboard_snapshot.delay(user_id)
+    except Exception as e:
+        logger.error(f"Could not queue dashboard refresh for user {user_id}: {e}")
+        cache.delete(_refresh_lock_key(user_id))
+
+
+def release_dashboard_refresh(user_id):
+    """Allow another background rebuild to be queued."""
+    cache.delete(_refresh_lock_key(user_id))
+
+
+def invalidate_dashboards(user_ids):
+    """Mark the given users' snapshots stale once the transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    def bump():
+        token = uuid.uuid4().hex
+        cache.set_many(
+            {_version_key(user_id): token for user_id in user_ids},
+            SNAPSHOT_TIMEOUT
+        )
+
+    transaction.on_commit(bump)
+
+
+def invalidate_team_dashboards(team_ids, extra_user_ids=()):
+    """Mark every member of the given teams stale."""
+    def bump():
+        user_ids = set(TeamMember.objects.filter(
+            team_id__in=team_ids
+        ).values_list('user_id', flat=True))
+        invalidate_dashboards(user_ids.union(extra_user_ids))
+
+    transaction.on_commit(bump)
+
+
+def invalidate_teammate_dashboards(user_id):
+    """Mark the user and everyone sharing a team with them stale."""
+    def bump():
+        user_ids = set(TeamMember.objects.filter(
+            team__in=TeamMember.objects.filter(user_id=user_id).values('team')
+        ).values_list('user_id', flat=True))
+        user_ids.add(user_id)
+        invalidate_dashboards(user_ids)
+
+    transaction.on_commit(bump)
+
+
+def invalidate_project_dashboards(project_id):
+    """Mark every member of the project's team stale."""
+    def bump():
+        user_ids = set(TeamMember.objects.filter(
+            team__projects=project_id
+        ).values_list('user_id', flat=True))
+        invalidate_dashboards(user_ids)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from devcord.models import Project
+from devcord.stats import find_stale_project_stats, rebuild_project_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the denormalized ProjectStats counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project_ids', nargs='*', type=int,
+            help='Only check these projects (default: all projects)'
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Report stale counters without rewriting them'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of projects to count per query'
+        )
+
+    def handle(self, *args, **options):
+        project_ids = Project.objects.order_by('pk').values_list('pk', flat=True)
+        if options['project_ids']:
+            project_ids = project_ids.filter(pk__in=options['project_ids'])
+
+        batch_size = options['batch_size']
+        checked = 0
+        stale_total = 0
+        batch = []
+        for project_id in project_ids.iterator(chunk_size=batch_size):
+            batch.append(project_id)
+            if len(batch) >= batch_size:
+                stale_total += self._process(batch, options['verify'])
+                checked += len(batch)
+                batch = []
+        if batch:
+            stale_total += self._process(batch, options['verify'])
+            checked += len(batch)
+
+        if options['verify']:
+            if stale_total:
+                raise CommandError(f'{stale_total} of {checked} projects have stale stats')
+            self.stdout.write(self.style.SUCCESS(f'All {checked} project stats are up to date'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {stale_total} stale project stats ({checked} checked)'
+            ))
+
+    def _process(self, project_ids, verify_only):
+        stale = find_stale_project_stats(project_ids)
+        for project_id, fields in stale.items():
+            self.stdout.write(f"Project {project_id}: stale {', '.join(fields)}")
+        if stale and not verify_only:
+            rebuild_project_stats(list(stale))
+        return len(stale)
@@ -0,0 +1,125 @@
+"""
+Cached team and project roles for permission checks.
+
+A user's roles are loaded with two small queries, then kept on the user
+object for the rest of the request and in the cache for MEMBERSHIP_TIMEOUT
+seconds. Every TeamMember or ProjectMember saved or deleted, including by
+queryset and cascading deletes, replaces the user's membership version once
+committed, which makes any cached copy stale. If the row's User is loaded
+(``Project.add_member(request.user)``), its per-request copy is dropped too,
+and read from the database until the new version is committed.
+
+Queryset ``update()`` sends no signals: callers that change membership rows
+that way call ``invalidate_memberships`` for the users affected.
+"""
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import ProjectMember, TeamMember
+
+MEMBERSHIP_TIMEOUT = 60
+VERSION_TIMEOUT = 60 * 60
+
+TEAM_EDIT_ROLES = ('admin', 'leader')
+
+
+def _memberships_key(user_id):
+    return f'memberships:{user_id}'
+
+
+def _version_key(user_id):
+    return f'memberships:version:{user_id}'
+
+
+class Memberships:
+    """A user's roles, keyed by team id and by project id."""
+
+    def __init__(self, team_roles=None, project_roles=None):
+        self.team_roles = team_roles or {}
+        self.project_roles = project_roles or {}
+
+    def team_role(self, team_id):
+        return self.team_roles.get(team_id)
+
+    def project_role(self, project_id):
+        return self.project_roles.get(project_id)
+
+    def is_team_member(self, team_id):
+        return team_id in self.team_roles
+
+    def can_edit_team(self, team_id):
+        return self.team_role(team_id) in TEAM_EDIT_ROLES
+
+
+def load_memberships(user_id):
+    """Read a user's roles from the database."""
+    return Memberships(
+        dict(TeamMember.objects.filter(user_id=user_id).values_list('team_id', 'role')),
+        dict(ProjectMember.objects.filter(user_id=user_id).values_list('project_id', 'role')),
+    )
+
+
+def get_memberships(user):
+    """
+    Return the user's Memberships, reading the database at most once per
+    request and only when the cached copy is missing or stale.
+    """
+    if user is None or not user.is_authenticated:
+        return Memberships()
+    memberships = getattr(user, '_memberships', None)
+    if memberships is not None:
+        return memberships
+    if getattr(user, '_memberships_changed', False):
+        # The cached copy may be stale until the change is committed
+        user._memberships = load_memberships(user.pk)
+        return user._memberships
+
+    memberships_key = _memberships_key(user.pk)
+    version_key = _version_key(user.pk)
+    cached = cache.get_many([memberships_key, version_key])
+    entry = cached.get(memberships_key)
+    version = cached.get(version_key)
+    if entry is not None and entry['version'] == version:
+        memberships = Memberships(entry['teams'], entry['projects'])
+    else:
+        memberships = load_memberships(user.pk)
+        cache.set(memberships_key, {
+            'version': version,
+            'teams': memberships.team_roles,
+            'projects': memberships.project_roles,
+        }, MEMBERSHIP_TIMEOUT)
+    user._memberships = memberships
+    return memberships
+
+
+def invalidate_memberships(user):
+    """
+    Mark a user's cached roles stale once the transaction commits. ``user``
+    may be a User or a user id; a User also drops its per-request copy.
+    """
+    user_id = getattr(user, 'pk', user)
+    if isinstance(user, User):
+        if hasattr(user, '_memberships'):
+            del user._memberships
+        user._memberships_changed = True
+
+    def bump():
+        cache.set(_version_key(user_id), uuid.uuid4().hex, VERSION_TIMEOUT)
+
+    transaction.on_commit(bump)
+
+
+def _member_changed(sender, instance, **kwargs):
+    # Pass the User when it is loaded, so its per-request copy goes too
+    user = instance.user if sender.user.is_cached(instance) else instance.user_id
+    invalidate_memberships(user)
+
+
+def connect_signals():
+    for model in (TeamMember, ProjectMember):
+        post_save.connect(_member_changed, sender=model, dispatch_uid=f'memberships_{model.__name__}_saved')
+        post_delete.connect(_member_changed, sender=model, dispatch_uid=f'memberships_{model.__name__}_deleted')
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_total', models.PositiveIntegerField(default=0)),
+                ('task_completed', models.PositiveIntegerField(default=0)),
+                ('task_in_progress', models.PositiveIntegerField(default=0)),
+                ('task_pending', models.PositiveIntegerField(default=0)),
+                ('review_total', models.PositiveIntegerField(default=0)),
+                ('review_approved', models.PositiveIntegerField(default=0)),
+                ('review_pending', models.PositiveIntegerField(default=0)),
+                ('review_changes_requested', models.PositiveIntegerField(default=0)),
+                ('member_total', models.PositiveIntegerField(default=0)),
+                ('member_maintainers', models.PositiveIntegerField(default=0)),
+                ('member_contributors', models.PositiveIntegerField(default=0)),
+                ('member_reviewers', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='devcord.project')),
+            ],
+            options={
+                'verbose_name_plural': 'project stats',
+            },
+        ),
+    ]
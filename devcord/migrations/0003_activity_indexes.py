@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0002_projectstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['project', '-timestamp'], name='activity_project_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['target_type', 'target_id', '-timestamp'], name='activity_target_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', '-timestamp'], name='activity_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='codereview',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['reviewer', '-created_at'], name='review_pending_reviewer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teaminvite',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['team', '-created_at'], name='invite_pending_team_idx'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:05
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_activity_log(apps, schema_editor):
+    """
+    Convert devcord_activitylog into a table range partitioned by month on
+    PostgreSQL. Other databases keep the plain table.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    model = apps.get_model('devcord', 'ActivityLog')
+    table = model._meta.db_table
+    legacy = f'{table}_unpartitioned'
+    execute = schema_editor.execute
+
+    execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+    # Partitioned tables need the partition key in the primary key
+    execute(
+        f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS, '
+        f'PRIMARY KEY ("id", "timestamp")) PARTITION BY RANGE ("timestamp")'
+    )
+    execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN("timestamp"), MAX("id") FROM "{legacy}"')
+        oldest, max_id = cursor.fetchone()
+
+    now = datetime.now(timezone.utc)
+    month = datetime((oldest or now).year, (oldest or now).month, 1, tzinfo=timezone.utc)
+    last = _add_months(datetime(now.year, now.month, 1, tzinfo=timezone.utc), 2)
+    while month <= last:
+        execute(
+            f'CREATE TABLE "{table}_p{month:%Y%m}" PARTITION OF "{table}" '
+            f'FOR VALUES FROM (%s) TO (%s)',
+            params=[month, _add_months(month, 1)]
+        )
+        month = _add_months(month, 1)
+
+    execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+    execute(f'DROP TABLE "{legacy}"')
+
+    # The identity sequence went with the old table, so use a plain one
+    execute(f'CREATE SEQUENCE "{table}_id_seq" OWNED BY "{table}"."id"')
+    execute(f'SELECT setval(\'"{table}_id_seq"\', %s, false)', params=[(max_id or 0) + 1])
+    execute(f'ALTER TABLE "{table}" ALTER COLUMN "id" SET DEFAULT nextval(\'"{table}_id_seq"\')')
+
+    # Recreate the indexes and foreign keys under the names Django expects
+    for field in model._meta.local_fields:
+        if field.remote_field:
+            execute(schema_editor._create_index_sql(model, fields=[field]))
+            execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+    for index in model._meta.indexes:
+        execute(index.create_sql(model, schema_editor))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0003_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('action', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='devcord.project')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('project', 'date', 'action')},
+            },
+        ),
+        migrations.RunPython(partition_activity_log, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0005_activity_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codereview',
+            name='ai_suggestions',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='codereview',
+            name='code_snippet',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0006_codereview_ai_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamAnalysisRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done')], default='running', max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('analyzed', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('cursor', models.PositiveIntegerField(default=0)),
+                ('window_end', models.PositiveIntegerField(default=0)),
+                ('token', models.CharField(blank=True, max_length=32)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devcord', '0007_team_analysis_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='vibe_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
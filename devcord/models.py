@@ -1,10 +1,65 @@
+from django.core import checks
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
 import random
 from django.urls import reverse
 
+# The groups of ProjectStats counters, each a total and a breakdown
+STAT_GROUPS = ('task', 'review', 'member')
+
+class ProjectStatsMixin:
+    """
+    A row counted in the denormalized ProjectStats counters, which
+    devcord.stats keeps in step from its save and delete signals.
+    Subclasses set ``stat_group``, the counters they feed (one of
+    STAT_GROUPS), and ``stat_fields``, the attributes holding the row's
+    project id and the value its counters are broken down by. These are
+    checked when the class is defined; that the fields exist is checked by
+    ``manage.py check``.
+    """
+    stat_group = None
+    stat_fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.stat_group not in STAT_GROUPS or len(cls.stat_fields) != 2:
+            raise TypeError(
+                f"{cls.__name__} must set stat_group to one of {STAT_GROUPS} "
+                f"and stat_fields to (project field, breakdown field)"
+            )
+
+    @classmethod
+    def check(cls, **kwargs):
+        errors = super().check(**kwargs)
+        for name in cls.stat_fields:
+            try:
+                cls._meta.get_field(name)
+            except FieldDoesNotExist:
+                errors.append(checks.Error(
+                    f"stat_fields refers to the nonexistent field '{name}'.",
+                    obj=cls,
+                    id='devcord.E001',
+                ))
+        return errors
+
+    def stat_counters(self):
+        """The project id and the counter fields the row contributes to."""
+        project_field, value_field = self.stat_fields
+        return getattr(self, project_field), ProjectStats.counter_fields(
+            self.stat_group, getattr(self, value_field)
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields().intersection(cls.stat_fields):
+            instance._stat_snapshot = instance.stat_counters()
+        return instance
+
 class Team(models.Model):
     TEAM_TYPES = (
         ('individual', 'Individual'),
@@ -20,6 +75,7 @@ class Team(models.Model):
     members = models.ManyToManyField(User, through='TeamMember', related_name='teams')
     invite_code = models.CharField(max_length=8, unique=True, blank=True)
     is_active = models.BooleanField(default=True)
+    vibe_score = models.FloatField(null=True, blank=True)  # Set by the daily team analysis
 
     class Meta:
         ordering = ['-created_at']
@@ -58,6 +114,18 @@ class TeamMember(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.team.name} ({self.role})"
 
+    # Cached roles are invalidated by devcord.memberships' signal handlers
+    def save(self, *args, **kwargs):
+        from .dashboard import invalidate_team_dashboards
+        super().save(*args, **kwargs)
+        invalidate_team_dashboards([self.team_id], extra_user_ids=[self.user_id])
+
+    def delete(self, *args, **kwargs):
+        from .dashboard import invalidate_team_dashboards
+        result = super().delete(*args, **kwargs)
+        invalidate_team_dashboards([self.team_id], extra_user_ids=[self.user_id])
+        return result
+
 class Project(models.Model):
     PROJECT_TYPES = (
         ('frontend', 'Frontend'),
@@ -111,10 +179,11 @@ class Project(models.Model):
 
     @property
     def completion_percentage(self):
-        total_tasks = self.tasks.count()
+        task_stats = self.get_task_stats()
+        total_tasks = task_stats['total']
         if total_tasks == 0:
             return 0
-        completed_tasks = self.tasks.filter(status='completed').count()
+        completed_tasks = task_stats['completed']
         return int((completed_tasks / total_tasks) * 100)
 
     @property
@@ -123,11 +192,12 @@ class Project(models.Model):
 
     @property
     def recent_activities(self):
-        return self.activities.order_by('-timestamp')[:10]
+        return self.activities.select_related('user').order_by('-timestamp')[:10]
 
     def add_member(self, user, role='contributor'):
         """Add a user to the project team with a specific role"""
-        if not self.team.members.filter(user=user).exists():
+        from .memberships import get_memberships
+        if not get_memberships(user).is_team_member(self.team_id):
             TeamMember.objects.create(
                 team=self.team,
                 user=user,
@@ -142,8 +212,11 @@ class Project(models.Model):
 
     def remove_member(self, user):
         """Remove a user from the project team"""
-        self.team.members.filter(user=user).delete()
-        self.project_members.filter(user=user).delete()
+        # Delete one by one so cached roles and member counters are kept in step
+        for membership in TeamMember.objects.filter(team_id=self.team_id, user=user):
+            membership.delete()
+        for membership in self.project_members.filter(user=user):
+            membership.delete()
 
     def archive(self):
         """Archive the project"""
@@ -162,69 +235,53 @@ class Project(models.Model):
 
     def can_user_edit(self, user):
         """Check if a user can edit this project"""
-        return self.project_members.filter(
-            user=user,
-            role='maintainer'
-        ).exists() or self.team.members.filter(
-            user=user,
-            role__in=['admin', 'leader']
-        ).exists()
+        from .memberships import get_memberships
+        memberships = get_memberships(user)
+        return (
+            memberships.project_role(self.pk) == 'maintainer'
+            or memberships.can_edit_team(self.team_id)
+        )
 
     def can_user_view(self, user):
         """Check if a user can view this project"""
-        return self.team.members.filter(user=user).exists()
+        from .memberships import get_memberships
+        return get_memberships(user).is_team_member(self.team_id)
 
     def can_user_review_code(self, user):
         """Check if a user can review code"""
-        return self.project_members.filter(
-            user=user,
-            role__in=['maintainer', 'reviewer']
-        ).exists()
+        from .memberships import get_memberships
+        return get_memberships(user).project_role(self.pk) in ('maintainer', 'reviewer')
 
     def can_user_submit_review(self, user):
         """Check if a user can submit code for review"""
-        return self.project_members.filter(
-            user=user,
-            role__in=['maintainer', 'contributor']
-        ).exists()
+        from .memberships import get_memberships
+        return get_memberships(user).project_role(self.pk) in ('maintainer', 'contributor')
+
+    def get_stats(self):
+        """Get task, code review and member statistics from the project's ProjectStats row"""
+        if not hasattr(self, '_stats_cache'):
+            from .stats import get_project_stats
+            self._stats_cache = get_project_stats(self)
+        return self._stats_cache
 
     def get_task_stats(self):
         """Get project task statistics"""
-        return {
-            'total': self.tasks.count(),
-            'completed': self.tasks.filter(status='completed').count(),
-            'in_progress': self.tasks.filter(status='in_progress').count(),
-            'pending': self.tasks.filter(status='pending').count()
-        }
+        return self.get_stats()['tasks']
 
     def get_review_stats(self):
         """Get project code review statistics"""
-        return {
-            'total': self.code_reviews.count(),
-            'approved': self.code_reviews.filter(status='approved').count(),
-            'pending': self.code_reviews.filter(status='pending').count(),
-            'changes_requested': self.code_reviews.filter(status='changes_requested').count()
-        }
+        return self.get_stats()['reviews']
 
     def get_member_stats(self):
         """Get project member statistics"""
-        return {
-            'total': self.project_members.count(),
-            'maintainers': self.project_members.filter(role='maintainer').count(),
-            'contributors': self.project_members.filter(role='contributor').count(),
-            'reviewers': self.project_members.filter(role='reviewer').count()
-        }
+        return self.get_stats()['members']
 
     def log_activity(self, user, action, details=None):
         """Log a project activity"""
-        ActivityLog.objects.create(
-            user=user,
-            project=self,
-            action=action,
-            details=details
-        )
+        from .activity import log_activity
+        return log_activity(user, action, project=self, details=details)
 
-class Task(models.Model):
+class Task(ProjectStatsMixin, models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('in_progress', 'In Progress'),
@@ -257,6 +314,9 @@ class Task(models.Model):
     def get_absolute_url(self):
         return reverse('task-detail', kwargs={'task_id': self.id})
 
+    stat_group = 'task'
+    stat_fields = ('project_id', 'status')
+
     def assign_to(self, user):
         """Assign the task to a user"""
         self.assigned_to = user
@@ -318,7 +378,7 @@ class Standup(models.Model):
     def __str__(self):
         return f"{self.developer.username}'s Standup - {self.date}"
 
-class CodeReview(models.Model):
+class CodeReview(ProjectStatsMixin, models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('approved', 'Approved'),
@@ -332,11 +392,20 @@ class CodeReview(models.Model):
     reviewer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_reviews')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     github_pr_url = models.URLField(blank=True, null=True)
+    code_snippet = models.TextField(blank=True)  # Code sent for AI review
+    ai_suggestions = models.JSONField(null=True, blank=True)  # AI-generated review
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['reviewer', '-created_at'],
+                name='review_pending_reviewer_idx',
+                condition=Q(status='pending'),
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -344,6 +413,14 @@ class CodeReview(models.Model):
     def get_absolute_url(self):
         return reverse('code-review-detail', kwargs={'review_id': self.id})
 
+    stat_group = 'review'
+    stat_fields = ('project_id', 'status')
+
+    def save(self, *args, **kwargs):
+        from .dashboard import invalidate_dashboards
+        super().save(*args, **kwargs)
+        invalidate_dashboards([self.author_id, self.reviewer_id])
+
     def assign_reviewer(self, user):
         """Assign a reviewer to the code review"""
         self.reviewer = user
@@ -398,6 +475,37 @@ class CodeReviewComment(models.Model):
     def __str__(self):
         return f'Comment by {self.author.get_full_name()} on {self.review.title}'
 
+class ActivityLogQuerySet(models.QuerySet):
+    """The feed helpers only read the recent activity window"""
+
+    def recent(self):
+        """Limit to the feed window so only recent partitions are read"""
+        from .partitions import feed_cutoff
+        return self.filter(timestamp__gte=feed_cutoff())
+
+    def for_team(self, team):
+        """Activities on the team's projects or on the team itself"""
+        # Filter on project ids rather than joining so each branch of the
+        # OR can be served from an index
+        return self.recent().filter(
+            Q(project__in=team.projects.values('pk')) |
+            Q(target_type='team', target_id=team.id)
+        )
+
+    def for_user(self, user):
+        """The user's own activities and those targeting the user's teams"""
+        return self.recent().filter(
+            Q(user=user) |
+            Q(target_type='team', target_id__in=user.teams.values_list('id', flat=True))
+        )
+
+    def for_teammates(self, user):
+        """Activities by the user or anyone sharing a team with them"""
+        return self.recent().filter(
+            Q(user__in=TeamMember.objects.filter(team__in=user.teams.all()).values('user')) |
+            Q(user=user)
+        )
+
 class ActivityLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='activities', null=True, blank=True)
@@ -406,16 +514,69 @@ class ActivityLog(models.Model):
     target_type = models.CharField(max_length=50, blank=True, null=True)  # e.g., 'project', 'team', 'code-review'
     target_id = models.IntegerField(blank=True, null=True)  # ID of the target object
     target_name = models.CharField(max_length=255, blank=True, null=True)  # Name of the target object
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)  # set when logged, not when the buffer is written
+
+    objects = ActivityLogQuerySet.as_manager()
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['project', '-timestamp'], name='activity_project_time_idx'),
+            models.Index(fields=['target_type', 'target_id', '-timestamp'], name='activity_target_time_idx'),
+            models.Index(fields=['user', '-timestamp'], name='activity_user_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .dashboard import invalidate_teammate_dashboards
+        super().save(*args, **kwargs)
+        invalidate_teammate_dashboards(self.user_id)
 
     def __str__(self):
         if self.target_name:
             return f'{self.user.get_full_name()} {self.action} {self.target_name} at {self.timestamp}'
         return f'{self.user.get_full_name()} {self.action} at {self.timestamp}'
 
+class ActivityRollup(models.Model):
+    """Daily per-project activity counts kept after raw ActivityLog rows expire"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='activity_rollups', null=True, blank=True)
+    date = models.DateField()
+    action = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('project', 'date', 'action')
+
+    def __str__(self):
+        return f'{self.action} x{self.count} on {self.date}'
+
+class TeamAnalysisRun(models.Model):
+    """Progress of one day's team analysis, so that a crashed run can resume"""
+    STATUS_CHOICES = (
+        ('running', 'Running'),
+        ('done', 'Done'),
+    )
+
+    date = models.DateField(unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    total = models.PositiveIntegerField(default=0)
+    analyzed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Teams up to ``cursor`` (by id) are done; those up to ``window_end`` are in flight
+    cursor = models.PositiveIntegerField(default=0)
+    window_end = models.PositiveIntegerField(default=0)
+    # Changed on resume, so the dispatch chain of a stalled attempt stops
+    token = models.CharField(max_length=32, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        return f'Team analysis {self.date}: {self.analyzed + self.failed}/{self.total}'
+
 class AIInsightTracker(models.Model):
     INSIGHT_TYPES = (
         ('code_quality', 'Code Quality'),
@@ -458,6 +619,12 @@ class AIInsight(models.Model):
     def __str__(self):
         return f"{self.title} - {self.tracker.project.name if self.tracker else 'No Project'}"
 
+    def save(self, *args, **kwargs):
+        from .dashboard import invalidate_project_dashboards
+        super().save(*args, **kwargs)
+        if self.tracker_id:
+            invalidate_project_dashboards(self.tracker.project_id)
+
 class TeamInvite(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -474,6 +641,15 @@ class TeamInvite(models.Model):
     expires_at = models.DateTimeField()
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_invites')
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['team', '-created_at'],
+                name='invite_pending_team_idx',
+                condition=Q(status='pending'),
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.expires_at:
             self.expires_at = timezone.now() + timezone.timedelta(days=7)
@@ -485,7 +661,7 @@ class TeamInvite(models.Model):
     def __str__(self):
         return f"Invite for {self.email} to {self.team.name}"
 
-class ProjectMember(models.Model):
+class ProjectMember(ProjectStatsMixin, models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='project_members')
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='project_memberships')
     role = models.CharField(max_length=20, choices=Project.ROLE_CHOICES, default='contributor')
@@ -499,6 +675,60 @@ class ProjectMember(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.get_role_display()} in {self.project.name}"
 
+    stat_group = 'member'
+    stat_fields = ('project_id', 'role')
+
+class ProjectStats(models.Model):
+    """
+    Denormalized per-project counters so stats reads are a single row lookup.
+    Field names match the annotations built in ``devcord.stats``.
+    """
+    TASK_FIELDS = {
+        'completed': 'task_completed',
+        'in_progress': 'task_in_progress',
+        'pending': 'task_pending',
+    }
+    REVIEW_FIELDS = {
+        'approved': 'review_approved',
+        'pending': 'review_pending',
+        'changes_requested': 'review_changes_requested',
+    }
+    MEMBER_FIELDS = {
+        'maintainer': 'member_maintainers',
+        'contributor': 'member_contributors',
+        'reviewer': 'member_reviewers',
+    }
+
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name='stats')
+    task_total = models.PositiveIntegerField(default=0)
+    task_completed = models.PositiveIntegerField(default=0)
+    task_in_progress = models.PositiveIntegerField(default=0)
+    task_pending = models.PositiveIntegerField(default=0)
+    review_total = models.PositiveIntegerField(default=0)
+    review_approved = models.PositiveIntegerField(default=0)
+    review_pending = models.PositiveIntegerField(default=0)
+    review_changes_requested = models.PositiveIntegerField(default=0)
+    member_total = models.PositiveIntegerField(default=0)
+    member_maintainers = models.PositiveIntegerField(default=0)
+    member_contributors = models.PositiveIntegerField(default=0)
+    member_reviewers = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'project stats'
+
+    def __str__(self):
+        return f"Stats for {self.project.name}"
+
+    @classmethod
+    def counter_fields(cls, group, value):
+        """The counters a row of ``group`` with breakdown ``value`` adds to."""
+        fields = [f'{group}_total']
+        breakdown = getattr(cls, f'{group.upper()}_FIELDS')
+        if value in breakdown:
+            fields.append(breakdown[value])
+        return fields
+
 class TaskBoard(models.Model):
     project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name='task_board')
     name = models.CharField(max_length=100)
@@ -543,10 +773,4 @@ class CodeReviewInbox(models.Model):
 
     def get_review_stats(self):
         """Get code review statistics"""
-        reviews = self.project.code_reviews
-        return {
-            'total': reviews.count(),
-            'pending': reviews.filter(status='pending').count(),
-            'approved': reviews.filter(status='approved').count(),
-            'changes_requested': reviews.filter(status='changes_requested').count()
-        }
+        return self.project.get_review_stats()
@@ -0,0 +1,171 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are ordered newest first on ``(<field>, id)`` and each page starts
+strictly after the last row of the previous one, so fetching a deep page
+costs the same index range scan as fetching the first.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import timezone as dt_timezone
+from typing import Any, List, Optional
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class InvalidCursor(ValueError):
+    """The cursor or ``before`` value could not be decoded."""
+    pass
+
+
+@dataclass
+class KeysetPage:
+    object_list: List[Any]
+    has_more: bool
+    next_cursor: Optional[str]
+
+
+def encode_cursor(value, pk):
+    """Encode the position of a row as an opaque, URL-safe cursor."""
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into its ``(datetime, pk)`` position."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        position = parse_datetime(value), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if position[0] is None:
+        raise InvalidCursor(cursor)
+    return position
+
+
+def parse_before(before):
+    """
+    Parse a plain ``before=<ISO timestamp>`` starting point. Rows at exactly
+    that timestamp are skipped, so clients page on from there with the
+    returned cursor, which keeps rows sharing a timestamp apart.
+    """
+    # A '+' in an unencoded query string arrives as a space
+    value = parse_datetime(before.replace(' ', '+'))
+    if value is None:
+        raise InvalidCursor(before)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, dt_timezone.utc)
+    return value, None
+
+
+def keyset_paginate(queryset, field, position=None, page_size=20):
+    """
+    Return the page of ``queryset`` that follows ``position``.
+
+    ``position`` is a ``(value, pk)`` pair from ``decode_cursor`` or
+    ``parse_before``; pk may be None to page on the field alone.
+    """
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if position is not None:
+        value, pk = position
+        if pk is None:
+            queryset = queryset.filter(**{f'{field}__lt': value})
+        else:
+            # Written with a plain upper bound on the field so the ordering
+            # index can be range scanned
+            queryset = queryset.filter(
+                Q(**{f'{field}__lte': value}),
+                Q(**{f'{field}__lt': value}) | Q(pk__lt=pk),
+            )
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return KeysetPage(rows, has_more, next_cursor)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination over ``(ordering_field, id)``, newest first.
+
+    Clients follow ``next`` (or pass back ``next_cursor`` as ``cursor``);
+    ``before=<ISO timestamp>`` is accepted as a starting point as well.
+    """
+    ordering_field = 'created_at'
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    before_query_param = 'before'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_position(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        before = request.query_params.get(self.before_query_param)
+        try:
+            if cursor:
+                return decode_cursor(cursor)
+            if before:
+                return parse_before(before)
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = keyset_paginate(
+            queryset,
+            self.ordering_field,
+            self.get_position(request),
+            self.get_page_size(request)
+        )
+        return self.page.object_list
+
+    def get_next_link(self):
+        if not self.page.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.page.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.page.next_cursor,
+            'has_more': self.page.has_more,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'has_more': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+class ActivityPagination(KeysetPagination):
+    ordering_field = 'timestamp'
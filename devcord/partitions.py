@@ -0,0 +1,212 @@
+"""
+Time partitioning and retention for ActivityLog.
+
+On PostgreSQL the activity table is range partitioned by month (see
+migration 0004) with one ``devcord_activitylog_pYYYYMM`` table per month and
+a default partition for anything outside them. Other databases keep a plain
+table and the same retention runs as ranged deletes.
+
+Raw rows older than ``ACTIVITY_RETENTION_MONTHS`` are rolled up into daily
+per-project ActivityRollup counts and then dropped, a whole partition at a
+time where possible.
+"""
+import logging
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ActivityLog, ActivityRollup
+
+logger = logging.getLogger(__name__)
+
+TABLE = ActivityLog._meta.db_table
+PARTITION_PREFIX = f'{TABLE}_p'
+DELETE_BATCH_SIZE = 5000
+
+
+def month_start(value):
+    """Midnight UTC on the first day of ``value``'s month."""
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    """Shift a month start by a number of months."""
+    index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month:%Y%m}'
+
+
+def feed_cutoff(now=None):
+    """
+    Oldest timestamp the activity feeds read. Feeds are bounded to the most
+    recent ``ACTIVITY_FEED_MONTHS`` monthly partitions so the planner can
+    prune everything older.
+    """
+    months = getattr(settings, 'ACTIVITY_FEED_MONTHS', 3)
+    return add_months(month_start(now or timezone.now()), 1 - months)
+
+
+def retention_cutoff(now=None):
+    """Raw rows before this timestamp are rolled up and dropped."""
+    months = getattr(settings, 'ACTIVITY_RETENTION_MONTHS', 12)
+    return add_months(month_start(now or timezone.now()), 1 - months)
+
+
+def is_partitioned():
+    """Whether the activity table is a partitioned PostgreSQL table."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass',
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Return the month start of every existing monthly partition, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        if name.startswith(PARTITION_PREFIX):
+            suffix = name[len(PARTITION_PREFIX):]
+            months.append(datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=dt_timezone.utc))
+    return sorted(months)
+
+
+def ensure_partitions(months_ahead=2, now=None):
+    """Create the current month's partition and the next ``months_ahead``."""
+    if not is_partitioned():
+        return []
+    existing = set(list_partitions())
+    created = []
+    month = month_start(now or timezone.now())
+    last = add_months(month, months_ahead)
+    while month <= last:
+        if month not in existing:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" '
+                    f'PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)',
+                    [month, add_months(month, 1)]
+                )
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+def rollup_range(start, end):
+    """
+    Add the raw activity in ``[start, end)`` to the daily rollups.
+
+    Returns the number of raw rows counted.
+    """
+    rows = (
+        ActivityLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by()
+        .annotate(day=TruncDate('timestamp'))
+        .values('project_id', 'day', 'action')
+        .annotate(total=Count('id'))
+    )
+    counts = {(row['project_id'], row['day'], row['action']): row['total'] for row in rows}
+    if not counts:
+        return 0
+
+    existing = {
+        (rollup.project_id, rollup.date, rollup.action): rollup
+        for rollup in ActivityRollup.objects.filter(
+            date__in={day for project_id, day, action in counts}
+        )
+    }
+    to_update = []
+    to_create = []
+    for (project_id, day, action), total in counts.items():
+        rollup = existing.get((project_id, day, action))
+        if rollup is not None:
+            rollup.count += total
+            to_update.append(rollup)
+        else:
+            to_create.append(ActivityRollup(
+                project_id=project_id, date=day, action=action, count=total
+            ))
+    ActivityRollup.objects.bulk_update(to_update, ['count'], batch_size=1000)
+    ActivityRollup.objects.bulk_create(to_create, batch_size=1000)
+    return sum(counts.values())
+
+
+def _delete_range(start, end):
+    """Delete raw rows in ``[start, end)`` in bounded batches."""
+    deleted = 0
+    while True:
+        ids = list(
+            ActivityLog.objects.filter(timestamp__gte=start, timestamp__lt=end)
+            .order_by()
+            .values_list('id', flat=True)[:DELETE_BATCH_SIZE]
+        )
+        if not ids:
+            return deleted
+        deleted += ActivityLog.objects.filter(
+            id__in=ids, timestamp__gte=start, timestamp__lt=end
+        ).delete()[0]
+
+
+def apply_retention(now=None):
+    """
+    Roll up and drop every month of raw activity older than the retention
+    cutoff. Each month is rolled up and removed in one transaction, so a
+    crash never double counts or loses rows.
+
+    Returns the number of raw rows rolled up.
+    """
+    cutoff = retention_cutoff(now)
+    partitioned = is_partitioned()
+    if partitioned:
+        months = [month for month in list_partitions() if month < cutoff]
+    else:
+        oldest = ActivityLog.objects.filter(timestamp__lt=cutoff).aggregate(
+            oldest=Min('timestamp')
+        )['oldest']
+        months = []
+        month = month_start(oldest) if oldest else cutoff
+        while month < cutoff:
+            months.append(month)
+            month = add_months(month, 1)
+
+    rolled_up = 0
+    for month in months:
+        end = add_months(month, 1)
+        with transaction.atomic():
+            rolled_up += rollup_range(month, end)
+            if partitioned:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE "{partition_name(month)}"')
+            else:
+                _delete_range(month, end)
+        logger.info(f"Rolled up activity for {month:%Y-%m}")
+
+    if partitioned:
+        # Rows that landed in the default partition before their month existed
+        with transaction.atomic():
+            epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+            rolled_up += rollup_range(epoch, cutoff)
+            _delete_range(epoch, cutoff)
+    return rolled_up
@@ -0,0 +1,178 @@
+"""
+Per-view query budgets.
+
+Every devcord URL name has a declared maximum number of database queries.
+QueryBudgetMiddleware records the queries each request runs, how many of
+them repeat an earlier statement, and the total time spent in the database.
+It reports these as response headers and logs requests that go over their
+budget. The same recorder is used by the query count tests.
+"""
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# URL name -> maximum queries for one request, including the session and
+# user lookups. A budget must not depend on how many rows the page shows.
+QUERY_BUDGETS = {
+    # Accounts
+    'register': 5,
+    'profile': 8,
+    'settings': 5,
+
+    # Dashboard and activity
+    'dashboard': 11,
+    'activity-list': 6,
+    'refresh-insights': 6,
+
+    # Teams
+    'team-list': 6,
+    'team-detail': 10,
+    'team-create': 10,
+    'team-edit': 8,
+    'team-delete': 8,
+    'team-invite': 12,
+    'team-join': 10,
+    'remove-team-member': 10,
+
+    # Projects
+    'project-list': 8,
+    'project-detail': 16,
+    'project-create': 12,
+    'project-create-team': 12,
+    'project-edit': 12,
+    'project-archive': 10,
+
+    # Tasks
+    'task-list': 6,
+    'task-detail': 12,
+    'create-task': 12,
+    'task-edit': 12,
+    'task-complete': 12,
+    'task-assign': 12,
+
+    # Code reviews
+    'code-review-list': 8,
+    'code-review-detail': 8,
+    'create-code-review': 12,
+    'code-review-edit': 10,
+    'code-review-approve': 10,
+    'code-review-request-changes': 10,
+    'code-review-assign': 12,
+    'code-review-comment': 10,
+
+    # AI
+    'ai-feature-plan': 3,
+    'ai-status': 3,
+
+    # API
+    'api-root': 3,
+    'api-team-members': 8,
+    'api-activity-feed': 5,
+    'api-team-activity-feed': 6,
+    'api-team-list': 6,
+    'api-team-detail': 6,
+    'api-team-update-vibe': 8,
+    'api-project-list': 6,
+    'api-project-detail': 6,
+    'api-task-list': 6,
+    'api-task-detail': 6,
+    'api-profile-list': 6,
+    'api-profile-detail': 6,
+    'api-standup-list': 6,
+    'api-standup-detail': 6,
+    'api-standup-generate-summary': 8,
+    'api-code-review-list': 6,
+    'api-code-review-detail': 6,
+    'api-code-review-generate-review': 8,
+}
+
+DEFAULT_BUDGET = 10
+
+
+def get_budget(url_name):
+    return QUERY_BUDGETS.get(url_name, DEFAULT_BUDGET)
+
+
+class QueryRecorder:
+    """
+    Record every query run on the default connection while active.
+
+        with QueryRecorder() as recorder:
+            ...
+        recorder.count, recorder.duplicates, recorder.duration
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """Total seconds spent executing queries."""
+        return sum(duration for sql, duration in self.queries)
+
+    @property
+    def duplicates(self):
+        """Statements run more than once, with how many times each ran."""
+        counts = Counter(sql for sql, duration in self.queries)
+        return {sql: n for sql, n in counts.items() if n > 1}
+
+    @property
+    def duplicate_count(self):
+        return sum(n - 1 for n in self.duplicates.values())
+
+
+class QueryBudgetMiddleware:
+    """
+    Record queries per request and flag views that go over their budget.
+
+    Active when ``QUERY_BUDGET_ENABLED`` is set (it defaults to ``DEBUG``).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Duplicates'] = str(recorder.duplicate_count)
+        response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+
+        budget = get_budget(url_name)
+        if recorder.count > budget:
+            logger.warning(
+                "%s %s (%s) ran %d queries, budget %d, %d duplicates, %.1fms",
+                request.method, request.path, url_name, recorder.count,
+                budget, recorder.duplicate_count, recorder.duration * 1000,
+            )
+        return response
@@ -0,0 +1,177 @@
+"""
+Token-bucket rate limiting shared by every worker.
+
+Each bucket holds up to ``count`` tokens and refills at ``count`` per period,
+so a limit of "10/m" allows a burst of ten requests and then one every six
+seconds. Buckets live in Redis and are checked and updated by a Lua script,
+so concurrent workers can't both take the last token, and refilling is
+continuous rather than resetting at window boundaries.
+
+``acquire`` never blocks. It takes a token from every bucket it is given, or
+from none of them, and returns how many seconds to wait before trying again
+(0 when admitted). Celery tasks pass that wait to ``self.retry(countdown=...)``.
+Without Redis the buckets are kept per process.
+"""
+import logging
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ratelimit:'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+# KEYS: the buckets. ARGV: cost, then the refill rate (tokens per second)
+# and capacity of each bucket in turn. Returns the wait in seconds as a
+# string, since Lua numbers are truncated to integers on the way out.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+
+if wait > 0 then
+    return tostring(wait)
+end
+
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - cost, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is not admitted; ``wait`` is in seconds."""
+
+    def __init__(self, wait, message=None):
+        self.wait = wait
+        super().__init__(message or f"Rate limit exceeded. Try again in {wait:.1f} seconds.")
+
+
+def retry_countdown(wait):
+    """
+    Delay before retrying a request that was told to wait ``wait`` seconds,
+    with jitter so requests turned away together don't all return together.
+    """
+    return wait + random.uniform(0, max(1.0, wait * 0.2))
+
+
+def parse_rate(rate):
+    """Turn ``"10/m"`` into ``(tokens per second, capacity)``."""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    seconds = PERIODS[period.strip()[:1].lower()]
+    if count <= 0:
+        raise ValueError(f"Invalid rate limit {rate!r}")
+    return count / seconds, count
+
+
+class LocalBuckets:
+    """The same algorithm kept in memory, for processes without Redis."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, limits, cost):
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0
+            for key, (rate, capacity) in limits:
+                tokens, ts = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0, now - ts) * rate)
+                levels.append(tokens)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+            if wait > 0:
+                return wait
+            for (key, _), tokens in zip(limits, levels):
+                self._buckets[key] = (tokens - cost, now)
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_local = LocalBuckets()
+_script = None
+
+
+def _run_script(client, keys, args):
+    # Sent by SHA; redis-py loads it again if the server's script cache was
+    # flushed
+    global _script
+    if _script is None:
+        _script = client.register_script(TOKEN_BUCKET_SCRIPT)
+    return _script(keys=keys, args=args, client=client)
+
+
+def acquire(limits, cost=1):
+    """
+    Take ``cost`` tokens from every bucket in ``limits``, a list of
+    ``(key, rate)`` pairs such as ``[('ai:gpt-4', '60/m')]``.
+
+    Returns 0 when admitted. Otherwise nothing is taken and the return value
+    is the number of seconds until all the buckets can admit the request.
+    """
+    parsed = [(KEY_PREFIX + key, parse_rate(rate)) for key, rate in limits]
+    for key, (rate, capacity) in parsed:
+        if cost > capacity:
+            raise ValueError(f"Cost {cost} exceeds the capacity of {key}")
+
+    client = get_redis()
+    if client is None:
+        return _local.acquire(parsed, cost)
+
+    args = [cost]
+    for key, (rate, capacity) in parsed:
+        args += [rate, capacity]
+    try:
+        wait = float(_run_script(client, [key for key, _ in parsed], args))
+    except Exception as e:
+        logger.warning(f"Rate limiter unavailable, limiting per process: {e}")
+        return _local.acquire(parsed, cost)
+    # Round up so a retry after ``wait`` seconds finds the token there
+    return math.ceil(wait * 1000) / 1000
+
+
+def ai_limits(model, team_id=None):
+    """The buckets an AI request draws from: its model and, if known, its team."""
+    limits = [(f'ai:{model}', settings.AI_RATE_LIMIT)]
+    if team_id is not None:
+        limits.append((f'ai:{model}:team:{team_id}', settings.AI_TEAM_RATE_LIMIT))
+    return limits
+
+
+def check_ai_rate(model, team_id=None):
+    """Admit an AI request or raise RateLimitExceeded with the wait."""
+    wait = acquire(ai_limits(model, team_id))
+    if wait:
+        raise RateLimitExceeded(wait)
@@ -0,0 +1,40 @@
+"""
+Shared Redis connection.
+
+Most code goes through Django's cache, but a few features need Redis data
+structures or pub/sub directly. They share one lazily created client per
+process, built from ``REDIS_URL``. When no Redis is configured,
+``get_redis`` returns None and callers fall back to the cache.
+"""
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_client = None
+
+
+def get_redis():
+    """Return the process-wide Redis client, or None without ``REDIS_URL``."""
+    global _client
+    url = getattr(settings, 'REDIS_URL', None)
+    if not url:
+        return None
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import redis
+                _client = redis.Redis.from_url(
+                    url,
+                    decode_responses=True,
+                    health_check_interval=30,
+                    socket_timeout=5,
+                )
+    return _client
+
+
+def reset_redis():
+    """Drop the client so the next ``get_redis`` call connects again."""
+    global _client
+    with _lock:
+        _client = None
@@ -0,0 +1,179 @@
+"""
+Turning AI code review feedback into typed data.
+
+``parse_feedback`` reads free-text feedback in one pass. Section headings
+are recognised however the model writes them: markdown (``## Security``),
+bold (``**Security Issues**``), numbered (``5. Security concerns (if any)``)
+or a plain line, with or without a trailing colon or upper case. Bullet and
+numbered items are collected under the section they appear in.
+
+Models that support structured output can instead be asked for JSON
+matching REVIEW_SCHEMA; ``parse_structured`` reads that and
+``render_feedback`` writes the text shown on the page.
+
+Both return the same fields, which are stored with the review so readers
+never parse the text again.
+"""
+import json
+import re
+from typing import Any, Dict, Optional
+
+LIST_SECTIONS = (
+    'bugs', 'security_issues', 'performance_issues',
+    'best_practices', 'style_issues', 'improvements',
+)
+
+SECTION_TITLES = {
+    'summary': 'Summary',
+    'bugs': 'Potential Bugs',
+    'security_issues': 'Security Issues',
+    'performance_issues': 'Performance Concerns',
+    'best_practices': 'Best Practices',
+    'style_issues': 'Style Guide Violations',
+    'improvements': 'Suggested Improvements',
+}
+
+# Matched against a heading lower-cased, without markup, numbering,
+# parentheticals or the trailing colon
+SECTION_PATTERNS = [
+    ('summary', re.compile(r'(?:overall )?(?:code quality|quality|assessment|summary|overview)(?: assessment)?')),
+    ('bugs', re.compile(r'(?:potential )?(?:bugs?|issues|bugs or issues|correctness)')),
+    ('security_issues', re.compile(r'(?:potential )?security(?: issues| concerns| vulnerabilities| risks)?')),
+    ('performance_issues', re.compile(r'performance(?: issues| concerns| considerations)?')),
+    ('best_practices', re.compile(r'best practices?(?: suggestions| violations)?')),
+    ('style_issues', re.compile(r'(?:code )?style(?: guide)?(?: issues| violations)?')),
+    ('improvements', re.compile(
+        r'(?:specific |suggested )?(?:improvements?|recommendations|suggestions)'
+        r'(?: recommendations| suggestions)?'
+    )),
+]
+
+HEADING_MARKUP = re.compile(r'^(?:#+\s*|\d+[.)]\s*)?[*_]{0,2}(.*?)[*_]{0,2}\s*$')
+BULLET = re.compile(r'^(?:[-*•]|\d+[.)])\s+(.*)$')
+PARENTHETICAL = re.compile(r'\s*\([^)]*\)')
+NOTHING_TO_REPORT = re.compile(
+    r'^(?:none|n/?a|no (?:major |significant |obvious )?\w+(?: \w+)? (?:were |was )?'
+    r'(?:found|identified|detected))\.?$',
+    re.I,
+)
+
+REVIEW_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'summary': {'type': 'string'},
+        **{section: {'type': 'array', 'items': {'type': 'string'}} for section in LIST_SECTIONS},
+    },
+    'required': ['summary', *LIST_SECTIONS],
+    'additionalProperties': False,
+}
+
+
+def empty_review() -> Dict[str, Any]:
+    review = {'summary': '', 'suggestions': []}
+    review.update({section: [] for section in LIST_SECTIONS})
+    return review
+
+
+def section_for(heading: str) -> Optional[str]:
+    """The section a heading names, or None if it isn't one we know."""
+    text = HEADING_MARKUP.match(heading.strip()).group(1)
+    text = PARENTHETICAL.sub('', text).strip().rstrip(':').strip(' *_').lower()
+    for section, pattern in SECTION_PATTERNS:
+        if pattern.fullmatch(text):
+            return section
+    return None
+
+
+def parse_feedback(feedback: str) -> Dict[str, Any]:
+    """
+    Read free-text review feedback into its sections in one pass. Returns
+    ``summary``, a list for each of LIST_SECTIONS, and ``suggestions``, every
+    item with the section it came from.
+    """
+    review = empty_review()
+    summary = []
+    section = None
+    items = None  # the list the last item went into, for continuation lines
+
+    for raw in feedback.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+
+        # "Security Issues: none found" is a heading with its text inline
+        head, colon, rest = line.partition(':')
+        named = section_for(head if colon else line)
+        if named is not None and (colon or not BULLET.match(line) or line[0].isdigit()):
+            section, items = named, None
+            line = rest.strip(' *_') if colon else ''
+            if not line:
+                continue
+
+        bullet = BULLET.match(line)
+        if bullet:
+            text = bullet.group(1).strip()
+            if NOTHING_TO_REPORT.match(text):
+                continue
+            if section in LIST_SECTIONS:
+                items = review[section]
+                items.append(text)
+            else:
+                items = None
+            review['suggestions'].append({'section': section, 'suggestion': text})
+        elif items is not None and raw[:1].isspace():
+            # An indented line carries on the item above it
+            items[-1] = f'{items[-1]} {line}'
+            review['suggestions'][-1]['suggestion'] = items[-1]
+        elif section in (None, 'summary'):
+            summary.append(line)
+        elif not NOTHING_TO_REPORT.match(line):
+            # Prose under a list section counts as one item
+            review[section].append(line)
+            review['suggestions'].append({'section': section, 'suggestion': line})
+
+    review['summary'] = ' '.join(summary)
+    return review
+
+
+def parse_structured(response: str) -> Dict[str, Any]:
+    """
+    Read a response written to REVIEW_SCHEMA. Raises ValueError if it isn't
+    JSON of that shape.
+    """
+    try:
+        data = json.loads(response)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Review response is not JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise ValueError("Review response is not a JSON object")
+
+    review = empty_review()
+    review['summary'] = str(data.get('summary') or '').strip()
+    for section in LIST_SECTIONS:
+        values = data.get(section) or []
+        if not isinstance(values, list):
+            raise ValueError(f"Review section {section} is not a list")
+        review[section] = [str(value).strip() for value in values if str(value).strip()]
+        review['suggestions'] += [{'section': section, 'suggestion': value} for value in review[section]]
+    return review
+
+
+def render_feedback(review: Dict[str, Any]) -> str:
+    """Write a parsed review back out as text, one section per heading."""
+    parts = []
+    if review.get('summary'):
+        parts.append(review['summary'])
+    for section in LIST_SECTIONS:
+        if review.get(section):
+            lines = [f'{SECTION_TITLES[section]}:'] + [f'- {item}' for item in review[section]]
+            parts.append('\n'.join(lines))
+    return '\n\n'.join(parts)
+
+
+def schema_response_format(name: str = 'code_review') -> Dict[str, Any]:
+    """The ``response_format`` asking the model for REVIEW_SCHEMA."""
+    return {
+        'type': 'json_schema',
+        'json_schema': {'name': name, 'strict': True, 'schema': REVIEW_SCHEMA},
+    }
+
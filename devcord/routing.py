@@ -0,0 +1,12 @@
+from django.urls import re_path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'^ws/ai/events/$', consumers.AIEventsConsumer.as_asgi(), name='ws-ai-events'),
+    re_path(
+        r'^ws/ai/(?P<model_type>code-review|feature-plan)/(?P<item_id>[\w-]+)/$',
+        consumers.AIStreamConsumer.as_asgi(),
+        name='ws-ai-stream',
+    ),
+]
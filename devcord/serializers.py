@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Team, Project, Task, DeveloperProfile, Standup, CodeReview
+from .models import Team, Project, Task, DeveloperProfile, Standup, CodeReview, ActivityLog
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -84,4 +84,12 @@ class CodeReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = CodeReview
         fields = ('id', 'task', 'task_id', 'reviewer', 'code_snippet',
-                 'ai_suggestions', 'status', 'created_at', 'updated_at') 
\ No newline at end of file
+                 'ai_suggestions', 'status', 'created_at', 'updated_at')
+
+class ActivityLogSerializer(serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = ActivityLog
+        fields = ('id', 'user', 'project', 'action', 'details', 'target_type',
+                 'target_id', 'target_name', 'timestamp')
@@ -0,0 +1,230 @@
+"""
+Batched standup summaries.
+
+Standups mostly arrive together, just before the daily window closes.
+Rather than one task, one Task query and one model call per standup,
+``queue_standup_summary`` puts them on a Redis queue. The queue is drained
+by ``process_standup_batch`` when it holds STANDUP_BATCH_SIZE standups, or
+STANDUP_BATCH_WINDOW seconds after the first one arrived, whichever comes
+first. A batch loads the tasks of all its standups with one query, asks for
+each team's summaries in one prompt, counted against that team's rate
+limit, and saves them with one ``bulk_update``.
+
+Standups the batch response leaves out are then asked for one at a time,
+concurrently, on the async AI client. Without Redis every standup is a
+batch of one.
+
+A batch's ids are moved off the queue with LMOVE into a processing list of
+their own, which is deleted once the batch is done or handed to a retry.
+Batches still there after RECLAIM_AFTER seconds, because their task died,
+are put back on the queue by the next flush. This needs Redis 6.2 or later.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from .ai_events import publish_completion
+from .ai_client import gather
+from .ai_utils import agenerate_standup_summary, generate_standup_summaries
+from .models import Standup, Task
+from .ratelimit import RateLimitExceeded
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = 'standups:pending'
+SCHEDULED_KEY = 'standups:scheduled'
+# Batches being processed, scored by when they were taken
+PROCESSING_KEY = 'standups:processing'
+BATCH_KEY_PREFIX = 'standups:batch:'
+RECLAIM_AFTER = 10 * 60
+
+# KEYS: processing set, queue. ARGV: cutoff. Moves the ids of batches taken
+# before the cutoff back to the queue; returns how many.
+RECLAIM_SCRIPT = """
+local moved = 0
+for _, batch in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])) do
+    while redis.call('LMOVE', batch, KEYS[2], 'LEFT', 'RIGHT') do
+        moved = moved + 1
+    end
+    redis.call('ZREM', KEYS[1], batch)
+end
+return moved
+"""
+
+_reclaim = None
+
+
+def queue_standup_summary(standup_id):
+    """Summarize a standup with the next batch."""
+    from .tasks import process_standup_batch
+
+    client = get_redis()
+    if client is None:
+        process_standup_batch.delay([standup_id])
+        return
+
+    window = settings.STANDUP_BATCH_WINDOW
+    try:
+        pipe = client.pipeline()
+        pipe.rpush(QUEUE_KEY, standup_id)
+        # The first standup of a window schedules the flush; the key expires
+        # in case that task is lost, and the periodic flush picks up the rest
+        pipe.set(SCHEDULED_KEY, 1, nx=True, ex=int(window) + 60)
+        queued, first = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not queue standup {standup_id} for batching: {e}")
+        process_standup_batch.delay([standup_id])
+        return
+
+    if queued >= settings.STANDUP_BATCH_SIZE:
+        process_standup_batch.delay()
+    elif first:
+        process_standup_batch.apply_async(countdown=window)
+
+
+def _reclaim_stale_batches(client):
+    global _reclaim
+    if _reclaim is None:
+        _reclaim = client.register_script(RECLAIM_SCRIPT)
+    moved = _reclaim(keys=[PROCESSING_KEY, QUEUE_KEY], args=[time.time() - RECLAIM_AFTER], client=client)
+    if moved:
+        logger.warning(f"Requeued {moved} standups from batches that didn't finish")
+
+
+def take_queued(limit):
+    """
+    Take up to ``limit`` queued standup ids as a new batch. Returns
+    ``(batch_key, ids, remaining)``; pass the key to ``finish_batch`` once
+    the ids are dealt with. The next standup queued after this starts a new
+    window.
+    """
+    client = get_redis()
+    if client is None:
+        return None, [], 0
+    _reclaim_stale_batches(client)
+
+    batch_key = f'{BATCH_KEY_PREFIX}{uuid.uuid4().hex}'
+    pipe = client.pipeline()
+    pipe.delete(SCHEDULED_KEY)
+    for _ in range(limit):
+        pipe.lmove(QUEUE_KEY, batch_key, 'LEFT', 'RIGHT')
+    pipe.zadd(PROCESSING_KEY, {batch_key: time.time()})
+    pipe.llen(QUEUE_KEY)
+    results = pipe.execute()
+    ids = [int(standup_id) for standup_id in results[1:limit + 1] if standup_id is not None]
+    if not ids:
+        finish_batch(batch_key)
+        return None, [], results[-1]
+    return batch_key, ids, results[-1]
+
+
+def finish_batch(batch_key):
+    """Drop a batch taken by ``take_queued`` once it needn't be reclaimed."""
+    client = get_redis()
+    if client is None or batch_key is None:
+        return
+    pipe = client.pipeline()
+    pipe.delete(batch_key)
+    pipe.zrem(PROCESSING_KEY, batch_key)
+    pipe.execute()
+
+
+def load_tasks(standups):
+    """The title and status of each standup's tasks, in one query."""
+    pairs = Q()
+    for standup in standups:
+        pairs |= Q(assigned_to_id=standup.developer_id, project_id=standup.project_id)
+    tasks = defaultdict(list)
+    rows = Task.objects.filter(pairs).values('assigned_to_id', 'project_id', 'title', 'status')
+    for row in rows:
+        tasks[row['assigned_to_id'], row['project_id']].append(
+            {'title': row['title'], 'status': row['status']}
+        )
+    return tasks
+
+
+def summarize_standups(standup_ids):
+    """
+    Write AI summaries for a batch of standups. Returns the ids that still
+    need a summary because the rate limiter turned them away.
+    """
+    standups = list(
+        Standup.objects.filter(id__in=standup_ids, ai_summary='')
+        .only('id', 'developer_id', 'project_id', 'mood', 'ai_summary')
+        .annotate(team_id=F('project__team_id'))
+    )
+    if not standups:
+        return []
+
+    tasks = load_tasks(standups)
+    entries = {
+        standup.id: {
+            'id': standup.id,
+            'tasks': tasks[standup.developer_id, standup.project_id],
+            'mood': standup.mood,
+        }
+        for standup in standups
+    }
+    teams = defaultdict(list)
+    for standup in standups:
+        teams[standup.team_id].append(standup)
+
+    summaries = {}
+    limited = []
+    for team_id, team_standups in teams.items():
+        try:
+            result = generate_standup_summaries(
+                [entries[standup.id] for standup in team_standups], team_id=team_id
+            )
+        except RateLimitExceeded:
+            if len(limited) + len(team_standups) == len(standups):
+                # Nothing got through; the whole batch is retried
+                raise
+            limited.extend(standup.id for standup in team_standups)
+            continue
+        if not result.get('error'):
+            ids = {standup.id for standup in team_standups}
+            summaries.update(
+                (standup_id, summary) for standup_id, summary in result['summaries'].items()
+                if standup_id in ids
+            )
+
+    # Whatever the batch responses left out is asked for one standup at a
+    # time, all at once
+    left_out = [
+        standup for standup in standups
+        if not summaries.get(standup.id) and standup.id not in limited
+    ]
+    results = gather(*(
+        agenerate_standup_summary([], entries[standup.id]['tasks'], standup.mood, team_id=standup.team_id)
+        for standup in left_out
+    ))
+
+    failed = {}
+    for standup, single in zip(left_out, results):
+        if isinstance(single, RateLimitExceeded):
+            limited.append(standup.id)
+        elif isinstance(single, BaseException) or single.get('error'):
+            failed[standup] = single if isinstance(single, dict) else {'error': True}
+        else:
+            summaries[standup.id] = single['summary']
+
+    done = []
+    for standup in standups:
+        summary = summaries.get(standup.id)
+        if summary:
+            standup.ai_summary = summary
+            done.append(standup)
+    Standup.objects.bulk_update(done, ['ai_summary'])
+
+    for standup in done:
+        publish_completion('standup', standup.id, [standup.developer_id], standup.ai_summary)
+    for standup, error in failed.items():
+        # Leave ai_summary empty so the summary can be generated again
+        publish_completion('standup', standup.id, [standup.developer_id], error)
+    return limited
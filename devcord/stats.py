@@ -0,0 +1,238 @@
+"""
+Aggregate statistics for projects.
+
+All task, code review and member breakdowns for a set of projects are
+computed with one grouped query per related table, using conditional
+aggregation.
+
+The results are materialized in ProjectStats rows, which are adjusted
+incrementally as tasks, reviews and members are written, so single-project
+reads are one row lookup. The adjustments come from post_save and
+post_delete, so queryset and cascading deletes are counted too. Queryset
+``update()`` and ``bulk_create()`` send no signals: callers that write rows
+that way call ``rebuild_project_stats`` for the projects affected, and
+``manage.py rebuild_project_stats --verify`` finds any row left stale.
+
+List pages use the lighter ``annotate_team_counts`` and
+``annotate_project_counts``, which add only the counts those pages show.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import CodeReview, Project, ProjectMember, ProjectStats, Task, TeamMember
+
+TASK_STATS = {
+    'total': None,
+    'completed': Q(status='completed'),
+    'in_progress': Q(status='in_progress'),
+    'pending': Q(status='pending'),
+}
+
+REVIEW_STATS = {
+    'total': None,
+    'approved': Q(status='approved'),
+    'pending': Q(status='pending'),
+    'changes_requested': Q(status='changes_requested'),
+}
+
+MEMBER_STATS = {
+    'total': None,
+    'maintainers': Q(role='maintainer'),
+    'contributors': Q(role='contributor'),
+    'reviewers': Q(role='reviewer'),
+}
+
+# group name -> (field prefix, related model, breakdown)
+STAT_FIELDS_BY_GROUP = {
+    'tasks': ('task', Task, TASK_STATS),
+    'reviews': ('review', CodeReview, REVIEW_STATS),
+    'members': ('member', ProjectMember, MEMBER_STATS),
+}
+
+STAT_NAMES = tuple(
+    f'{prefix}_{key}'
+    for prefix, model, breakdown in STAT_FIELDS_BY_GROUP.values()
+    for key in breakdown
+)
+
+
+def count_rows(model, field, condition=None, outer='pk'):
+    """
+    Correlated COUNT(*) FILTER (WHERE condition) over the ``model`` rows whose
+    ``field`` points at the outer row's ``outer``. Unlike ``Count`` over a
+    join, it is not skewed by other joins or filters on the outer queryset.
+    """
+    rows = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(n=Count('pk', filter=condition))
+        .values('n')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def _count(model, condition):
+    """Correlated COUNT(*) FILTER (WHERE condition) over a project's rows."""
+    return count_rows(model, 'project', condition)
+
+
+def annotate_team_counts(queryset):
+    """Annotate a Team queryset with ``member_count`` and ``project_count``."""
+    return queryset.annotate(
+        member_count=count_rows(TeamMember, 'team'),
+        project_count=count_rows(Project, 'team'),
+    )
+
+
+def annotate_project_counts(queryset):
+    """
+    Annotate a Project queryset with its team's ``member_count`` and its
+    ``task_count`` and ``completed_task_count``.
+    """
+    return queryset.annotate(
+        member_count=count_rows(TeamMember, 'team', outer='team'),
+        task_count=_count(Task, None),
+        completed_task_count=_count(Task, TASK_STATS['completed']),
+    )
+
+
+def _group_stats(values):
+    """Fold flat ``<prefix>_<key>`` values into the nested stats dict."""
+    return {
+        group: {key: values[f'{prefix}_{key}'] for key in breakdown}
+        for group, (prefix, model, breakdown) in STAT_FIELDS_BY_GROUP.items()
+    }
+
+
+def _count_projects(project_ids):
+    """Count every stat for the given projects, keyed by project id."""
+    counts = {
+        project_id: dict.fromkeys(STAT_NAMES, 0)
+        for project_id in Project.objects.filter(pk__in=project_ids).values_list('pk', flat=True)
+    }
+    if not counts:
+        return counts
+    for prefix, model, breakdown in STAT_FIELDS_BY_GROUP.values():
+        aggregates = {
+            f'{prefix}_{key}': Count('pk', filter=condition)
+            for key, condition in breakdown.items()
+        }
+        rows = (
+            model.objects.filter(project_id__in=list(counts))
+            .order_by()
+            .values('project_id')
+            .annotate(**aggregates)
+        )
+        for row in rows:
+            counts[row.pop('project_id')].update(row)
+    return counts
+
+
+def get_project_stats(project):
+    """
+    Get stats for a single project from its materialized ProjectStats row,
+    building the row if it is missing.
+    """
+    try:
+        row = project.stats
+    except ProjectStats.DoesNotExist:
+        row = rebuild_project_stats([project.pk]).get(project.pk)
+        if row is None:
+            return _group_stats(dict.fromkeys(STAT_NAMES, 0))
+    return _group_stats({name: getattr(row, name) for name in STAT_NAMES})
+
+
+def record_stats_change(old, new):
+    """
+    Apply a single row's change to the ProjectStats counters.
+
+    ``old`` and ``new`` are ``(project_id, counter_fields)`` pairs as returned
+    by ``stat_counters``; either may be None for a create or delete.
+    """
+    deltas = defaultdict(Counter)
+    if old is not None:
+        project_id, fields = old
+        deltas[project_id].subtract(fields)
+    if new is not None:
+        project_id, fields = new
+        deltas[project_id].update(fields)
+
+    with transaction.atomic():
+        for project_id, counter in deltas.items():
+            changes = {field: F(field) + delta for field, delta in counter.items() if delta}
+            if project_id is None or not changes:
+                continue
+            updated = ProjectStats.objects.filter(project_id=project_id).update(
+                updated_at=timezone.now(), **changes
+            )
+            if not updated and new is not None:
+                # No row yet, the source tables already include this change.
+                # Deletes leave it missing: they may be deleting the project
+                # itself, and get_project_stats builds it on the next read.
+                rebuild_project_stats([project_id])
+
+
+def rebuild_project_stats(project_ids):
+    """
+    Recount the given projects and write their ProjectStats rows.
+
+    Returns a dict mapping each project id to its saved row.
+    """
+    rows = {}
+    for project_id, values in _count_projects(project_ids).items():
+        rows[project_id], created = ProjectStats.objects.update_or_create(
+            project_id=project_id, defaults=values
+        )
+    return rows
+
+
+def find_stale_project_stats(project_ids):
+    """
+    Compare stored counters against a fresh count.
+
+    Returns a dict mapping each project id whose row is missing or wrong to
+    the list of mismatched field names.
+    """
+    stored = {
+        row['project_id']: row
+        for row in ProjectStats.objects.filter(project_id__in=project_ids).values(
+            'project_id', *STAT_NAMES
+        )
+    }
+    stale = {}
+    for project_id, expected in _count_projects(project_ids).items():
+        row = stored.get(project_id)
+        if row is None:
+            stale[project_id] = list(STAT_NAMES)
+            continue
+        mismatched = [name for name in STAT_NAMES if row[name] != expected[name]]
+        if mismatched:
+            stale[project_id] = mismatched
+    return stale
+
+
+def _row_saved(sender, instance, created, **kwargs):
+    new = instance.stat_counters()
+    if created or hasattr(instance, '_stat_snapshot'):
+        record_stats_change(getattr(instance, '_stat_snapshot', None), new)
+    else:
+        # Previous values are unknown, recount the project instead
+        rebuild_project_stats([new[0]])
+    instance._stat_snapshot = new
+
+
+def _row_deleted(sender, instance, **kwargs):
+    old = getattr(instance, '_stat_snapshot', None) or instance.stat_counters()
+    record_stats_change(old, None)
+
+
+def connect_signals():
+    for prefix, model, breakdown in STAT_FIELDS_BY_GROUP.values():
+        post_save.connect(_row_saved, sender=model, dispatch_uid=f'stats_{model.__name__}_saved')
+        post_delete.connect(_row_deleted, sender=model, dispatch_uid=f'stats_{model.__name__}_deleted')
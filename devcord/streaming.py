@@ -0,0 +1,129 @@
+"""
+Incremental delivery of AI output over Channels.
+
+A Celery task that generates text for an item writes the model's tokens to a
+StreamPublisher. The publisher groups them into chunks and sends each chunk
+to the item's group, where AIStreamConsumer passes it on to the browser.
+Chunks are sent every STREAM_CHUNK_CHARS characters or STREAM_CHUNK_INTERVAL
+seconds, whichever comes first.
+
+A page can connect after generation has started. Each chunk carries the
+offset of its first character, and the text sent so far is also kept in the
+cache, so the consumer opens with a snapshot and the browser skips any chunk
+it has already seen.
+
+Streams that aren't about a stored item, such as feature plans, record the
+user who asked for them; only that user may follow them.
+"""
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STREAM_TYPES = ('code-review', 'feature-plan')
+
+# Long enough for a request to wait out the rate limiter before it starts
+OWNER_TIMEOUT = 60 * 60 * 24
+
+
+def stream_group(model_type, item_id):
+    """Channels group for one item's output. Names allow only [a-zA-Z0-9_.-]."""
+    return f'ai-stream.{model_type}.{item_id}'
+
+
+def _snapshot_key(group):
+    return f'{group}:text'
+
+
+def _owner_key(group):
+    return f'{group}:owner'
+
+
+def get_snapshot(model_type, item_id):
+    """Return ``{'text', 'done', 'result'}`` for a stream, or None."""
+    return cache.get(_snapshot_key(stream_group(model_type, item_id)))
+
+
+def set_stream_owner(model_type, item_id, user_id):
+    """Record the user a stream is for."""
+    cache.set(_owner_key(stream_group(model_type, item_id)), user_id, OWNER_TIMEOUT)
+
+
+def get_stream_owner(model_type, item_id):
+    """The id of the user a stream is for, or None if none was recorded."""
+    return cache.get(_owner_key(stream_group(model_type, item_id)))
+
+
+class StreamPublisher:
+    """
+    Send text to an item's group as it is generated.
+
+        publisher = StreamPublisher('code-review', review.id)
+        text = get_ai_response(prompt, on_chunk=publisher.write)
+        publisher.finish(result)
+
+    ``owner_id``, if given, is recorded as the user the stream is for.
+    Publishing is best effort: if the channel layer cannot be reached the
+    task carries on and the page falls back to the final result.
+    """
+
+    def __init__(self, model_type, item_id, owner_id=None):
+        self.group = stream_group(model_type, item_id)
+        if owner_id is not None:
+            set_stream_owner(model_type, item_id, owner_id)
+        self.channel_layer = get_channel_layer()
+        self.sent = ''
+        self.pending = []
+        self.pending_chars = 0
+        self.last_sent = time.monotonic()
+
+    def write(self, text):
+        if not text:
+            return
+        self.pending.append(text)
+        self.pending_chars += len(text)
+        if (self.pending_chars >= settings.STREAM_CHUNK_CHARS
+                or time.monotonic() - self.last_sent >= settings.STREAM_CHUNK_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        text = ''.join(self.pending)
+        offset = len(self.sent)
+        self.pending = []
+        self.pending_chars = 0
+        self.sent += text
+        self.last_sent = time.monotonic()
+        self._save_snapshot(done=False)
+        self._send({'type': 'ai.chunk', 'offset': offset, 'text': text})
+
+    def finish(self, result=None):
+        """Send what is left, then the final result."""
+        self.flush()
+        self._save_snapshot(done=True, result=result)
+        self._send({'type': 'ai.done', 'text': self.sent, 'result': result})
+
+    def fail(self, message):
+        self.flush()
+        self._send({'type': 'ai.error', 'message': message})
+
+    def _save_snapshot(self, done, result=None):
+        cache.set(
+            _snapshot_key(self.group),
+            {'text': self.sent, 'done': done, 'result': result},
+            settings.STREAM_SNAPSHOT_TIMEOUT,
+        )
+
+    def _send(self, event):
+        if self.channel_layer is None:
+            return
+        try:
+            async_to_sync(self.channel_layer.group_send)(self.group, event)
+        except Exception as e:
+            logger.warning(f"Could not publish to {self.group}: {e}")
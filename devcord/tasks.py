@@ -1,21 +1,42 @@
+import logging
+
 from celery import shared_task
 from .ai_utils import (
     generate_standup_summary,
     review_code,
-    generate_feature_plan,
-    analyze_team_vibe
+    generate_feature_plan
 )
+from .activity import deserialize, write_entries
+from .ai_events import publish_completion
+from .dashboard import release_dashboard_refresh, store_dashboard_snapshot
+from .partitions import apply_retention, ensure_partitions
+from .ratelimit import RateLimitExceeded, retry_countdown
+from .standups import finish_batch, summarize_standups, take_queued
+from .streaming import StreamPublisher
+from .team_analysis import analyze_team, dispatch_window, record_progress, start_team_analysis
 from .models import Standup, CodeReview, Task, Team
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.utils import timezone
 from typing import List, Dict, Any
 
-@shared_task
-def process_standup_summary(standup_id: int) -> None:
+logger = logging.getLogger(__name__)
+
+# Tasks turned away by the AI rate limiter are retried when it expects a
+# free token
+RATE_LIMIT_MAX_RETRIES = 20
+
+def retry_when_admitted(task, exc: RateLimitExceeded, **options):
+    options.setdefault('max_retries', RATE_LIMIT_MAX_RETRIES)
+    return task.retry(exc=exc, countdown=retry_countdown(exc.wait), **options)
+
+@shared_task(bind=True)
+def process_standup_summary(self, standup_id: int) -> None:
     """
     Generate an AI summary for a standup and update the record.
     """
     try:
-        standup = Standup.objects.get(id=standup_id)
+        standup = Standup.objects.select_related('project').get(id=standup_id)
         # Get relevant commits and tasks
         commits = []  # TODO: Integrate with GitHub API
         tasks = Task.objects.filter(
@@ -26,61 +47,185 @@ def process_standup_summary(standup_id: int) -> None:
         summary = generate_standup_summary(
             commits=commits,
             tasks=list(tasks),
-            mood=standup.mood
+            mood=standup.mood,
+            team_id=standup.project.team_id
         )
         
-        standup.ai_summary = summary
-        standup.save()
+        if summary.get('error'):
+            # Leave ai_summary empty so the summary can be generated again
+            publish_completion('standup', standup_id, [standup.developer_id], summary)
+            return
+        standup.ai_summary = summary['summary']
+        standup.save(update_fields=['ai_summary'])
+        publish_completion('standup', standup_id, [standup.developer_id], standup.ai_summary)
     except Standup.DoesNotExist:
-        print(f"Standup {standup_id} not found")
+        logger.warning("Standup %s not found", standup_id)
+    except RateLimitExceeded as exc:
+        raise retry_when_admitted(self, exc)
 
-@shared_task
-def process_code_review(review_id: int) -> None:
+@shared_task(bind=True)
+def process_standup_batch(self, standup_ids: List[int] = None) -> int:
+    """
+    Summarize a batch of standups with one prompt. Without ``standup_ids``
+    the next batch is taken from the standup queue. Returns the number of
+    standups summarized.
+    """
+    batch_key = None
+    if standup_ids is None:
+        batch_key, standup_ids, remaining = take_queued(settings.STANDUP_BATCH_SIZE)
+        if remaining:
+            process_standup_batch.delay()
+    if not standup_ids:
+        return 0
+
+    try:
+        missing = summarize_standups(standup_ids)
+    except RateLimitExceeded as exc:
+        retry = self.retry(
+            args=[standup_ids], exc=exc, throw=False,
+            countdown=retry_countdown(exc.wait), max_retries=RATE_LIMIT_MAX_RETRIES
+        )
+        # The retry carries the ids from here
+        finish_batch(batch_key)
+        raise retry
+    # Rate-limited standups wait for their turn in tasks of their own
+    for standup_id in missing:
+        process_standup_summary.delay(standup_id)
+    finish_batch(batch_key)
+    return len(standup_ids) - len(missing)
+
+@shared_task(bind=True)
+def process_code_review(self, review_id: int) -> None:
     """
-    Generate an AI code review and update the record.
+    Generate an AI code review and update the record, streaming the review
+    to the review's page as it is written.
     """
     try:
-        code_review = CodeReview.objects.get(id=review_id)
+        code_review = CodeReview.objects.select_related('project').get(id=review_id)
+        publisher = StreamPublisher('code-review', review_id)
         result = review_code(
             code=code_review.code_snippet,
-            language="python"  # TODO: Add language detection
+            language="python",  # TODO: Add language detection
+            on_chunk=publisher.write,
+            team_id=code_review.project.team_id
         )
         
         code_review.ai_suggestions = result
-        code_review.save()
+        code_review.save(update_fields=['ai_suggestions', 'updated_at'])
+        publisher.finish(result)
+        publish_completion(
+            'code-review', review_id,
+            [code_review.author_id, code_review.reviewer_id], result
+        )
     except CodeReview.DoesNotExist:
-        print(f"Code review {review_id} not found")
+        logger.warning("Code review %s not found", review_id)
+    except RateLimitExceeded as exc:
+        raise retry_when_admitted(self, exc)
 
-@shared_task
-def analyze_team_activity(team_id: int) -> None:
+@shared_task(bind=True)
+def analyze_team_activity(self, team_id: int) -> None:
     """
     Analyze team activity and update the team's vibe score.
     """
     try:
         team = Team.objects.get(id=team_id)
-        
-        # Get recent messages and activities
-        messages = []  # TODO: Integrate with chat system
-        activities = []  # TODO: Get from activity log
-        
-        result = analyze_team_vibe(messages, activities)
-        
-        team.vibe_score = result['vibe_score']
-        team.save()
+        analyze_team(team)
     except Team.DoesNotExist:
-        print(f"Team {team_id} not found")
+        logger.warning("Team %s not found", team_id)
+    except RateLimitExceeded as exc:
+        raise retry_when_admitted(self, exc)
+
+@shared_task(bind=True)
+def analyze_team_batch(self, team_ids: List[int], run_id: int) -> None:
+    """
+    Analyze a batch of a daily team analysis run and add to its progress.
+    When the rate limiter turns a team away, the batch is retried with the
+    teams it has left, as often as it takes; the run is paced to the limit,
+    so waits are short. Any other error counts the rest of the batch as
+    failed rather than failing the task, so the run's chord still completes.
+    """
+    analyzed = failed = 0
+    done = set()
+    try:
+        for team in Team.objects.filter(id__in=team_ids).order_by('id'):
+            try:
+                ok = analyze_team(team)
+            except RateLimitExceeded:
+                raise
+            except Exception:
+                logger.exception("Analysis of team %s failed", team.id)
+                ok = False
+            analyzed += ok
+            failed += not ok
+            done.add(team.id)
+    except RateLimitExceeded as exc:
+        remaining = [team_id for team_id in team_ids if team_id not in done]
+        raise retry_when_admitted(self, exc, args=[remaining, run_id], max_retries=None)
+    except Exception:
+        logger.exception("Team analysis batch failed after %d teams", len(done))
+        failed += len(team_ids) - len(done)
+    finally:
+        record_progress(run_id, analyzed, failed)
 
 @shared_task
-def process_feature_planning(idea: str) -> Dict[str, Any]:
+def dispatch_team_analysis(run_id: int, token: str) -> None:
+    """Send the next window of a daily team analysis run."""
+    dispatch_window(run_id, token)
+
+@shared_task(bind=True)
+def process_feature_planning(self, idea: str, user_id: int = None) -> Dict[str, Any]:
     """
-    Generate an AI-powered feature plan.
+    Generate an AI-powered feature plan, streaming it to the requester's
+    page under this task's id and telling ``user_id`` when it is done.
     """
-    return generate_feature_plan(idea)
+    publisher = StreamPublisher('feature-plan', self.request.id, owner_id=user_id)
+    try:
+        result = generate_feature_plan(idea, on_chunk=publisher.write)
+    except RateLimitExceeded as exc:
+        raise retry_when_admitted(self, exc)
+    publisher.finish(result)
+    publish_completion('feature-plan', self.request.id, [user_id], result)
+    return result
 
 @shared_task
 def daily_team_analysis() -> None:
     """
     Daily task to analyze all teams' activities and update vibe scores.
+    Scheduled every quarter hour: the first call of the day starts the run
+    and later ones resume it if it has stalled (see devcord.team_analysis).
+    """
+    start_team_analysis()
+
+@shared_task
+def refresh_dashboard_snapshot(user_id: int) -> None:
+    """
+    Rebuild a user's cached dashboard snapshot.
+    """
+    try:
+        store_dashboard_snapshot(User.objects.get(id=user_id))
+    except User.DoesNotExist:
+        logger.warning("User %s not found", user_id)
+    finally:
+        release_dashboard_refresh(user_id)
+
+@shared_task
+def maintain_activity_log() -> Dict[str, Any]:
+    """
+    Nightly ActivityLog upkeep: create upcoming monthly partitions, then
+    roll up and drop raw activity older than the retention window.
+    """
+    created = ensure_partitions()
+    rolled_up = apply_retention()
+    return {
+        'partitions_created': [month.strftime('%Y-%m') for month in created],
+        'rows_rolled_up': rolled_up,
+    }
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def write_activity_batch(entries: List[Dict[str, Any]]) -> int:
+    """
+    Insert a batch of buffered activity entries. The message is only
+    acknowledged once the batch is written, so a crashed worker hands it to
+    another one.
     """
-    for team in Team.objects.all():
-        analyze_team_activity.delay(team.id) 
\ No newline at end of file
+    return len(write_entries(deserialize(entries)))
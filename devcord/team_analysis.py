@@ -0,0 +1,133 @@
+"""
+Daily team analysis, dispatched a window at a time.
+
+Rather than queueing a task per team at midnight, each day's run walks the
+active teams in id order, TEAM_ANALYSIS_WINDOW at a time. A window is a
+Celery chord of ``analyze_team_batch`` tasks of TEAM_ANALYSIS_BATCH_SIZE
+teams each. Its callback moves the run's cursor past the window and
+dispatches the next one, so at most one window is ever queued.
+
+Each team is one request to the model, so teams are sent at
+TEAM_ANALYSIS_PER_MINUTE, and never faster than the model's AI_RATE_LIMIT:
+a window's batches are staggered at that pace rather than all started at
+once, and the next window waits until this one's requests would have been
+admitted. Batches turned away by the rate limiter wait and carry on
+however often that happens; a batch that fails for any other reason
+counts its remaining teams as failed, so the callback always runs.
+
+Progress lives in a TeamAnalysisRun row. ``start_team_analysis`` runs every
+quarter hour: it starts the day's run, or, if the run has made no progress
+for TEAM_ANALYSIS_STALL_TIMEOUT (a worker died, a message was lost), picks
+it up again from the last finished window.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from celery import chord, group
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .ai_utils import analyze_team_vibe
+from .models import Team, TeamAnalysisRun
+from .ratelimit import parse_rate
+from .team_digest import team_digest
+
+logger = logging.getLogger(__name__)
+
+
+def analyze_team(team):
+    """
+    Analyze a team's recent activity and update its vibe score. Returns
+    whether the analysis succeeded; RateLimitExceeded is raised for the
+    caller to retry. A team with nothing in its digest isn't sent to the
+    model and keeps its score.
+    """
+    digest = team_digest(team)
+    if not digest['activities'] and not digest['messages']:
+        return True
+
+    result = analyze_team_vibe(digest['messages'], digest['activities'], team_id=team.id)
+    if result.get('error'):
+        return False
+    team.vibe_score = result['vibe_score']
+    team.save(update_fields=['vibe_score', 'updated_at'])
+    return True
+
+
+def teams_per_second():
+    """The pace of a run: TEAM_ANALYSIS_PER_MINUTE, within AI_RATE_LIMIT."""
+    model_rate, _ = parse_rate(settings.AI_RATE_LIMIT)
+    return min(settings.TEAM_ANALYSIS_PER_MINUTE / 60, model_rate)
+
+
+def record_progress(run_id, analyzed, failed):
+    if analyzed or failed:
+        TeamAnalysisRun.objects.filter(id=run_id).update(
+            analyzed=F('analyzed') + analyzed,
+            failed=F('failed') + failed,
+            updated_at=timezone.now(),
+        )
+
+
+def start_team_analysis():
+    """Start today's run, or resume it if it has stalled. Returns the run."""
+    run, created = TeamAnalysisRun.objects.get_or_create(
+        date=timezone.localdate(),
+        defaults={'total': Team.objects.filter(is_active=True).count()},
+    )
+    if run.status == 'done':
+        return run
+    if not created:
+        stalled_since = timezone.now() - timedelta(seconds=settings.TEAM_ANALYSIS_STALL_TIMEOUT)
+        if run.updated_at > stalled_since:
+            return run
+        logger.warning(f"Team analysis for {run.date} stalled after team {run.cursor}, resuming")
+
+    # The window that was in flight is sent again; teams in it that were
+    # already analyzed are analyzed twice, which is harmless
+    run.token = uuid.uuid4().hex
+    run.window_end = run.cursor
+    run.save(update_fields=['token', 'window_end', 'updated_at'])
+    dispatch_window(run.id, run.token)
+    return run
+
+
+def dispatch_window(run_id, token):
+    """Finish the window in flight, if any, and send the next."""
+    from .tasks import analyze_team_batch, dispatch_team_analysis
+
+    run = TeamAnalysisRun.objects.get(id=run_id)
+    if run.status == 'done' or run.token != token:
+        # A resumed attempt has taken over from this chain
+        return
+
+    run.cursor = run.window_end
+    team_ids = list(
+        Team.objects.filter(is_active=True, id__gt=run.cursor)
+        .order_by('id')
+        .values_list('id', flat=True)[:settings.TEAM_ANALYSIS_WINDOW]
+    )
+    if not team_ids:
+        run.status = 'done'
+        run.finished_at = timezone.now()
+        run.save(update_fields=['cursor', 'status', 'finished_at', 'updated_at'])
+        logger.info(f"Team analysis for {run.date} done: {run.analyzed} analyzed, {run.failed} failed")
+        return
+
+    run.window_end = team_ids[-1]
+    run.save(update_fields=['cursor', 'window_end', 'updated_at'])
+
+    # Each batch starts when the teams before it have had their turn, so
+    # batches don't compete for the same rate limit tokens
+    rate = teams_per_second()
+    size = settings.TEAM_ANALYSIS_BATCH_SIZE
+    batches = group(
+        analyze_team_batch.s(team_ids[i:i + size], run.id).set(countdown=i / rate)
+        for i in range(0, len(team_ids), size)
+    )
+    # The next window is sent when this one is done, but no sooner than
+    # its pace allows
+    not_before = timezone.now() + timedelta(seconds=len(team_ids) / rate)
+    chord(batches)(dispatch_team_analysis.si(run.id, token).set(eta=not_before))
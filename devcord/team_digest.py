@@ -0,0 +1,114 @@
+"""
+Compact digests of a team's recent activity, for the vibe analysis.
+
+A digest covers the last TEAM_DIGEST_HOURS. Activity is read with two
+range queries on the team's ActivityLog indexes: counts per action type,
+and a sample of at most TEAM_DIGEST_MAX_EVENTS recent events, which
+supplies the targets each action was most often about. Chat messages are
+the most recent in the window, with repeats dropped and long ones cut.
+
+Lines are added busiest action first, then newest message first, until
+the digest reaches TEAM_DIGEST_TOKENS. The prompt, and with it the cost of
+an analysis, stays the same size however busy the team is.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from chat.models import ChatMessage
+
+from .models import ActivityLog
+
+# Rough size of a token in characters
+CHARS_PER_TOKEN = 4
+MESSAGE_CHARS = 200
+TOP_TARGETS = 3
+
+
+def recent_activities(team, since, until):
+    """
+    The team's activity between ``since`` and ``until``, one entry per
+    action type, busiest first.
+    """
+    window = ActivityLog.objects.for_team(team).filter(timestamp__gte=since, timestamp__lt=until)
+    counts = (
+        window.order_by()
+        .values('action')
+        .annotate(count=Count('id'), members=Count('user_id', distinct=True))
+        .order_by('-count', 'action')
+    )
+    targets = defaultdict(Counter)
+    sample = window.values_list('action', 'target_name')[:settings.TEAM_DIGEST_MAX_EVENTS]
+    for action, target_name in sample:
+        if target_name:
+            targets[action][target_name] += 1
+
+    activities = []
+    for row in counts:
+        members = row['members']
+        times = 'once' if row['count'] == 1 else f"{row['count']} times"
+        description = f"{times} by {members} member{'s' if members != 1 else ''}"
+        top = targets[row['action']].most_common(TOP_TARGETS)
+        if top:
+            description += ', most often on ' + ', '.join(
+                f'{name} (x{times})' if times > 1 else name for name, times in top
+            )
+        activities.append({'type': row['action'], 'description': description})
+    return activities
+
+
+def recent_messages(team, since, until):
+    """
+    The text of the team's chat messages between ``since`` and ``until``,
+    newest first, at most TEAM_DIGEST_MAX_EVENTS of them.
+    """
+    return list(
+        ChatMessage.objects.filter(team=team, created_at__gte=since, created_at__lt=until)
+        .order_by('-created_at')
+        .values_list('content', flat=True)[:settings.TEAM_DIGEST_MAX_EVENTS]
+    )
+
+
+def _tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def team_digest(team, until=None):
+    """
+    Digest of ``team``'s recent activity and messages, within the token
+    budget: ``{'activities': [{'type', 'description'}], 'messages': [str]}``.
+    """
+    until = until or timezone.now()
+    since = until - timedelta(hours=settings.TEAM_DIGEST_HOURS)
+    budget = settings.TEAM_DIGEST_TOKENS
+
+    activities = []
+    for activity in recent_activities(team, since, until):
+        cost = _tokens(f"- {activity['type']}: {activity['description']}")
+        if cost > budget:
+            break
+        activities.append(activity)
+        budget -= cost
+
+    messages = []
+    seen = set()
+    for message in recent_messages(team, since, until):
+        message = ' '.join(message.split())
+        if len(message) > MESSAGE_CHARS:
+            message = message[:MESSAGE_CHARS - 3] + '...'
+        key = message.lower()
+        if not message or key in seen:
+            continue
+        cost = _tokens(message)
+        if cost > budget:
+            break
+        seen.add(key)
+        messages.append(message)
+        budget -= cost
+    # Oldest first in the prompt, so the conversation reads in order
+    messages.reverse()
+
+    return {'activities': activities, 'messages': messages}
@@ -1,3 +1,539 @@
-from django.test import TestCase
+import asyncio
+import re
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+
+from . import activity, circuit, urls
+from .models import (
+    ActivityLog, CodeReview, CodeReviewComment, DeveloperProfile, Project, ProjectMember,
+    ProjectStats, Task, Team, TeamInvite, TeamMember
+)
+from .querybudget import QUERY_BUDGETS, QueryRecorder, get_budget
+from .stats import STAT_FIELDS_BY_GROUP, _count_projects, find_stale_project_stats
+
+
+class HotQueryIndexTests(TestCase):
+    """The activity feed and pending inbox queries must be served from indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dev', password='password')
+        cls.team = Team.objects.create(name='Core', creator=cls.user)
+        TeamMember.objects.create(team=cls.team, user=cls.user, role='admin')
+        cls.project = Project.objects.create(
+            name='API', description='', project_type='backend', team=cls.team
+        )
+        ActivityLog.objects.create(user=cls.user, project=cls.project, action='created project')
+
+    def explain(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        # Tiny test tables always favour a sequential scan, so force the
+        # planner to show whether an index is usable at all
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                return queryset.explain()
+            finally:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset, table, *indexes):
+        """The plan reads ``table`` only through indexes, including each of ``indexes``."""
+        plan = self.explain(queryset)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan)
+            self.assertIn('Index', plan)
+        elif connection.vendor == 'sqlite':
+            self.assertIsNone(re.search(rf'\bSCAN {table}\b(?! USING)', plan), plan)
+            self.assertIn(f'SEARCH {table} USING', plan)
+        else:
+            self.skipTest(f'No plan check for {connection.vendor}')
+        for index in indexes:
+            self.assertIn(index, plan)
+
+    def test_team_activity_feed(self):
+        queryset = ActivityLog.objects.for_team(self.team).order_by('-timestamp')[:10]
+        self.assertUsesIndex(
+            queryset, 'devcord_activitylog', 'activity_project_time_idx', 'activity_target_time_idx'
+        )
+
+    def test_user_activity_feed(self):
+        queryset = ActivityLog.objects.for_user(self.user).order_by('-timestamp')[:20]
+        self.assertUsesIndex(
+            queryset, 'devcord_activitylog', 'activity_user_time_idx', 'activity_target_time_idx'
+        )
+
+    def test_dashboard_activity_feed(self):
+        queryset = ActivityLog.objects.for_teammates(self.user)[:10]
+        self.assertUsesIndex(queryset, 'devcord_activitylog', 'activity_user_time_idx')
+
+    def test_pending_reviews_by_reviewer(self):
+        queryset = CodeReview.objects.filter(reviewer=self.user, status='pending')
+        self.assertUsesIndex(queryset, 'devcord_codereview', 'review_pending_reviewer_idx')
+
+    def test_pending_invites_by_team(self):
+        queryset = TeamInvite.objects.filter(
+            team=self.team, status='pending'
+        ).order_by('-created_at')
+        self.assertUsesIndex(queryset, 'devcord_teaminvite', 'invite_pending_team_idx')
+
+
+def _url_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every page runs the same number of queries however many rows it shows,
+    and stays within its budget in devcord.querybudget.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dev', password='password')
+        DeveloperProfile.objects.create(user=cls.user)
+        cls.team = Team.objects.create(name='Core', creator=cls.user)
+        TeamMember.objects.create(team=cls.team, user=cls.user, role='admin')
+        cls.project = Project.objects.create(
+            name='API', description='', project_type='backend', team=cls.team
+        )
+        ProjectMember.objects.create(project=cls.project, user=cls.user, role='maintainer')
+        cls.task = Task.objects.create(title='Ship it', project=cls.project, assigned_to=cls.user)
+        cls.review = CodeReview.objects.create(
+            title='Review', description='', project=cls.project, author=cls.user
+        )
+        cls.seeded = 0
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Views queue Celery tasks; keep them away from the broker
+        patcher = mock.patch('celery.app.task.Task.apply_async')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def seed(self, count):
+        """Add ``count`` more of every kind of row the pages list."""
+        for _ in range(count):
+            n = self.seeded = self.seeded + 1
+            other = User.objects.create_user(username=f'dev{n}', first_name='Dev', last_name=str(n))
+            TeamMember.objects.create(team=self.team, user=other, role='developer')
+            ProjectMember.objects.create(project=self.project, user=other, role='reviewer')
+            Task.objects.create(title=f'Task {n}', project=self.project, assigned_to=self.user)
+            Task.objects.create(title=f'Other task {n}', project=self.project, assigned_to=other)
+            review = CodeReview.objects.create(
+                title=f'Review {n}', description='', project=self.project,
+                author=self.user, reviewer=other
+            )
+            CodeReview.objects.create(
+                title=f'Incoming {n}', description='', project=self.project,
+                author=other, reviewer=self.user
+            )
+            CodeReviewComment.objects.create(review=self.review, author=other, content='Looks good')
+            CodeReviewComment.objects.create(review=review, author=other, content='Nit')
+            ActivityLog.objects.create(user=other, project=self.project, action='created task')
+            Task.objects.create(
+                title=f'Team task {n}',
+                project=Project.objects.create(
+                    name=f'Module {n}', description='', project_type='backend', team=self.team
+                )
+            )
+
+            team = Team.objects.create(name=f'Team {n}', creator=self.user if n % 2 else other)
+            TeamMember.objects.create(team=team, user=self.user, role='developer')
+            TeamMember.objects.create(team=team, user=other, role='admin')
+            project = Project.objects.create(
+                name=f'Project {n}', description='', project_type='backend', team=team
+            )
+            Task.objects.create(title=f'Side task {n}', project=project, status='completed')
+
+    def count_queries(self, url):
+        cache.clear()
+        with QueryRecorder() as recorder:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, url)
+        return recorder
+
+    def assertConstantQueries(self, url_name, *args):
+        url = reverse(url_name, urlconf=urls, args=args)
+        self.seed(2)
+        small = self.count_queries(url)
+        self.seed(6)
+        large = self.count_queries(url)
+        self.assertEqual(
+            small.count, large.count,
+            f'{url} ran {small.count} queries with 2 rows and {large.count} with 8; '
+            f'repeated: {list(large.duplicates.values())}'
+        )
+        self.assertLessEqual(large.count, get_budget(url_name), url)
+
+    def test_every_url_has_a_budget(self):
+        missing = set(_url_names(urls.urlpatterns)) - set(QUERY_BUDGETS)
+        self.assertFalse(missing, f'No query budget for {sorted(missing)}')
+
+    def test_dashboard(self):
+        self.assertConstantQueries('dashboard')
+
+    def test_activity_list(self):
+        self.assertConstantQueries('activity-list')
+
+    def test_team_list(self):
+        self.assertConstantQueries('team-list')
+
+    def test_team_invite(self):
+        TeamMember.objects.filter(team=self.team, user=self.user).update(role='leader')
+        self.assertConstantQueries('team-invite', self.team.pk)
+
+    def test_team_detail(self):
+        self.assertConstantQueries('team-detail', self.team.pk)
+
+    def test_project_list(self):
+        self.assertConstantQueries('project-list')
+
+    def test_project_detail(self):
+        self.assertConstantQueries('project-detail', self.project.pk)
+
+    def test_project_forms(self):
+        self.assertConstantQueries('project-create')
+        self.assertConstantQueries('project-create-team', self.team.pk)
+        self.assertConstantQueries('project-edit', self.project.pk)
+
+    def test_task_detail(self):
+        self.assertConstantQueries('task-detail', self.task.pk)
+
+    def test_task_forms(self):
+        self.assertConstantQueries('create-task')
+        self.assertConstantQueries('task-edit', self.task.pk)
+
+    def test_code_review_list(self):
+        self.assertConstantQueries('code-review-list')
+
+    def test_code_review_detail(self):
+        self.assertConstantQueries('code-review-detail', self.review.pk)
+
+    def test_code_review_forms(self):
+        self.assertConstantQueries('create-code-review')
+        self.assertConstantQueries('code-review-edit', self.review.pk)
+
+    def test_profile_pages(self):
+        self.assertConstantQueries('profile')
+        self.assertConstantQueries('settings')
+
+    def test_team_members_api(self):
+        self.assertConstantQueries('api-team-members', self.team.pk)
+
+    def test_activity_feed_api(self):
+        self.assertConstantQueries('api-activity-feed')
+        self.assertConstantQueries('api-team-activity-feed', self.team.pk)
+
+
+class LocalCircuitTests(SimpleTestCase):
+    """The per-process breaker gets out of half open however its probes end."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('devcord.circuit.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.circuit = circuit._local_circuit('test')
+        self.circuit.reset()
+        self.addCleanup(self.circuit.reset)
+
+    def open_circuit(self):
+        for _ in range(circuit.CIRCUIT_MIN_CALLS):
+            lease = circuit.admit('test')
+            self.circuit.complete(lease.id, circuit.FAILED, 0)
+        self.assertEqual(self.circuit.state, 'open')
+        self.now = self.circuit.open_until
+
+    def probe(self, error=None):
+        lease = circuit.admit('test')
+        self.assertTrue(lease.probe_round)
+        if error is None:
+            self.circuit.complete(lease.id, circuit.OK, 0, lease.probe_round)
+        else:
+            circuit.complete('test', lease, 1, error)
+        return lease
+
+    def test_good_probes_close(self):
+        self.open_circuit()
+        for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES):
+            self.probe()
+        self.assertEqual(self.circuit.state, 'closed')
+
+    def test_failed_probe_reopens(self):
+        self.open_circuit()
+        lease = circuit.admit('test')
+        self.circuit.complete(lease.id, circuit.FAILED, 0, lease.probe_round)
+        self.assertEqual(self.circuit.state, 'open')
+        with self.assertRaises(circuit.CircuitOpen):
+            circuit.admit('test')
+
+    def test_ignored_probes_give_their_place_back(self):
+        self.open_circuit()
+        for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES):
+            self.probe(ValueError('bad request'))
+        self.assertEqual(self.circuit.state, 'half_open')
+        for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES):
+            self.probe()
+        self.assertEqual(self.circuit.state, 'closed')
+
+    def test_lost_probes_expire(self):
+        self.open_circuit()
+        lost = [circuit.admit('test') for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES)]
+        with self.assertRaises(circuit.CircuitOpen):
+            circuit.admit('test')
+        self.now += circuit._lease_ttl()
+        for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES - 1):
+            self.probe()
+        # A probe of the earlier round finishing late doesn't count
+        self.circuit.complete(lost[0].id, circuit.OK, 0, lost[0].probe_round)
+        self.assertEqual(self.circuit.state, 'half_open')
+        self.probe()
+        self.assertEqual(self.circuit.state, 'closed')
+
+    def test_interrupted_calls_give_their_lease_back(self):
+        self.open_circuit()
+        for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES):
+            with self.assertRaises(KeyboardInterrupt):
+                with circuit.guarded('test'):
+                    raise KeyboardInterrupt
+
+        async def cancelled():
+            async with circuit.aguarded('test'):
+                raise asyncio.CancelledError
+
+        for _ in range(circuit.CIRCUIT_HALF_OPEN_PROBES):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(cancelled())
+        self.assertEqual(self.circuit.leases, {})
+        self.assertEqual(self.circuit.probes, 0)
+
+
+class ProjectStatsTests(TestCase):
+    """ProjectStats counters follow every write, and the command repairs them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dev', password='password')
+        cls.other = User.objects.create_user(username='other', password='password')
+        cls.team = Team.objects.create(name='Core', creator=cls.user)
+        cls.project = Project.objects.create(
+            name='API', description='', project_type='backend', team=cls.team
+        )
+
+    def stats(self):
+        return ProjectStats.objects.get(project=self.project)
+
+    def assertUpToDate(self):
+        self.assertEqual(find_stale_project_stats([self.project.pk]), {})
+
+    def test_counters_follow_creates_and_updates(self):
+        task = Task.objects.create(title='Ship it', project=self.project)
+        Task.objects.create(title='Test it', project=self.project, status='completed')
+        CodeReview.objects.create(title='Review', description='', project=self.project, author=self.user)
+        ProjectMember.objects.create(project=self.project, user=self.user, role='maintainer')
+
+        task.status = 'in_progress'
+        task.save()
+        # A copy loaded without its status can't tell what changed
+        stale_copy = Task.objects.defer('status').get(pk=task.pk)
+        stale_copy.status = 'completed'
+        stale_copy.save()
+
+        self.assertUpToDate()
+        stats = self.stats()
+        self.assertEqual(stats.task_total, 2)
+        self.assertEqual(stats.task_completed, 2)
+        self.assertEqual(stats.task_in_progress, 0)
+        self.assertEqual(stats.review_pending, 1)
+        self.assertEqual(stats.member_maintainers, 1)
+
+    def test_counters_follow_cascading_deletes(self):
+        CodeReview.objects.create(title='Mine', description='', project=self.project, author=self.user)
+        CodeReview.objects.create(title='Theirs', description='', project=self.project, author=self.other)
+        ProjectMember.objects.create(project=self.project, user=self.user, role='maintainer')
+        ProjectMember.objects.create(project=self.project, user=self.other, role='reviewer')
+
+        self.other.delete()
+
+        self.assertUpToDate()
+        stats = self.stats()
+        self.assertEqual(stats.review_total, 1)
+        self.assertEqual(stats.review_pending, 1)
+        self.assertEqual(stats.member_total, 1)
+        self.assertEqual(stats.member_reviewers, 0)
+
+    def test_counters_follow_queryset_deletes(self):
+        Task.objects.create(title='Ship it', project=self.project)
+        Task.objects.create(title='Test it', project=self.project, status='completed')
+
+        Task.objects.filter(status='pending').delete()
+
+        self.assertUpToDate()
+        self.assertEqual(self.stats().task_total, 1)
+
+    def test_deleting_the_project_leaves_no_stats(self):
+        Task.objects.create(title='Ship it', project=self.project)
+        ProjectMember.objects.create(project=self.project, user=self.user, role='maintainer')
+
+        self.project.delete()
+
+        self.assertFalse(ProjectStats.objects.exists())
+
+    def test_counting_takes_one_query_per_table(self):
+        other = Project.objects.create(name='Web', description='', project_type='frontend', team=self.team)
+        Task.objects.create(title='Ship it', project=self.project, status='completed')
+        ProjectMember.objects.create(project=other, user=self.user, role='reviewer')
+
+        with self.assertNumQueries(1 + len(STAT_FIELDS_BY_GROUP)):
+            counts = _count_projects([self.project.pk, other.pk])
+
+        self.assertEqual(counts[self.project.pk]['task_completed'], 1)
+        self.assertEqual(counts[self.project.pk]['member_total'], 0)
+        self.assertEqual(counts[other.pk]['member_reviewers'], 1)
+        self.assertEqual(counts[other.pk]['task_total'], 0)
+
+    def test_command_verifies_and_rebuilds_stale_counters(self):
+        Task.objects.create(title='Ship it', project=self.project)
+        ProjectStats.objects.filter(project=self.project).update(task_total=5)
+
+        with self.assertRaisesMessage(CommandError, '1 of 1 projects have stale stats'):
+            call_command('rebuild_project_stats', '--verify', stdout=StringIO())
+        self.assertEqual(self.stats().task_total, 5)
+
+        out = StringIO()
+        call_command('rebuild_project_stats', stdout=out)
+        self.assertIn(f'Project {self.project.pk}: stale task_total', out.getvalue())
+        self.assertIn('Rebuilt 1 stale project stats (1 checked)', out.getvalue())
+        self.assertEqual(self.stats().task_total, 1)
+
+        out = StringIO()
+        call_command('rebuild_project_stats', str(self.project.pk), '--verify', stdout=out)
+        self.assertIn('All 1 project stats are up to date', out.getvalue())
+
+
+@override_settings(ACTIVITY_LOG_BUFFER_SIZE=3, ACTIVITY_LOG_ASYNC=False)
+class ActivityBufferTests(TestCase):
+    """Buffered activity is written once, and one bad entry can't hold back the rest."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dev', password='password')
+
+    def setUp(self):
+        activity._take()
+        self.addCleanup(activity._take)
+
+    def entry(self, action='pushed'):
+        return ActivityLog(user_id=self.user.pk, action=action)
+
+    def test_committed_entries_are_written_on_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.log_activity(self.user, 'created project')
+            activity.log_activity(self.user, 'created task')
+        self.assertFalse(ActivityLog.objects.exists())
+
+        self.assertEqual(activity.flush(), 2)
+        self.assertEqual(
+            set(ActivityLog.objects.values_list('action', flat=True)),
+            {'created project', 'created task'},
+        )
+        self.assertEqual(activity.flush(), 0)
+
+    def test_full_buffer_flushes_itself(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                activity.log_activity(self.user, 'pushed')
+        self.assertEqual(ActivityLog.objects.count(), 3)
+
+    def test_rejected_entry_is_dropped_and_the_rest_written(self):
+        for entry in (self.entry('first'), self.entry(None), self.entry('last')):
+            activity._buffer.append(entry)
+
+        with self.assertLogs('devcord.activity', 'ERROR') as logs:
+            activity.flush()
+
+        self.assertEqual(
+            sorted(ActivityLog.objects.values_list('action', flat=True)), ['first', 'last']
+        )
+        self.assertEqual(activity._buffer, [])
+        self.assertIn(f"Dropped activity 'None' by user {self.user.pk}", logs.output[0])
+
+    def test_entries_wait_while_the_database_is_unreachable(self):
+        entries = [self.entry(), self.entry()]
+        activity._buffer.extend(entries)
+
+        with mock.patch.object(ActivityLog.objects, 'bulk_create', side_effect=OperationalError):
+            with self.assertLogs('devcord.activity', 'ERROR'):
+                self.assertEqual(activity.safe_flush(), 0)
+        self.assertEqual(activity._buffer, entries)
+
+        self.assertEqual(activity.flush(), 2)
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+    def test_overflow_drops_the_oldest_entries(self):
+        limit = 3 * activity.RETRY_BUFFER_FACTOR
+        entries = [self.entry(str(n)) for n in range(limit + 5)]
+
+        with self.assertLogs('devcord.activity', 'ERROR'):
+            activity._restore(entries)
+
+        self.assertEqual(activity._buffer, entries[5:])
+
+
+class TeamActivityFeedTests(TestCase):
+    """Paging through a team's activity returns every row once, ties included."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='dev', password='password')
+        cls.team = Team.objects.create(name='Core', creator=cls.user)
+        TeamMember.objects.create(team=cls.team, user=cls.user, role='admin')
+        project = Project.objects.create(
+            name='API', description='', project_type='backend', team=cls.team
+        )
+        cls.now = timezone.now().replace(microsecond=0)
+        # Three rows on each of three timestamps, so page boundaries fall inside ties
+        for minutes in (1, 2, 3):
+            for _ in range(3):
+                ActivityLog.objects.create(
+                    user=cls.user, project=project, action='pushed',
+                    timestamp=cls.now - timedelta(minutes=minutes),
+                )
+        cls.expected = list(
+            ActivityLog.objects.order_by('-timestamp', '-pk').values_list('pk', flat=True)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def page_through(self, before):
+        url = reverse('api-team-activity-feed', args=[self.team.pk])
+        response = self.client.get(url, {'before': before.isoformat(), 'page_size': 2})
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.json()['results']]
+            if not response.json()['next']:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        self.assertEqual(self.page_through(self.now), self.expected)
+
+    def test_before_a_tied_timestamp_skips_the_whole_tie(self):
+        ids = self.page_through(self.now - timedelta(minutes=1))
+        self.assertEqual(ids, self.expected[3:])
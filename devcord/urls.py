@@ -2,14 +2,14 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 
-# API Router
+# API Router (basenames are prefixed so they don't shadow the page URL names)
 router = DefaultRouter()
-router.register(r'teams', views.TeamViewSet, basename='team')
-router.register(r'projects', views.ProjectViewSet, basename='project')
-router.register(r'tasks', views.TaskViewSet, basename='task')
-router.register(r'profiles', views.DeveloperProfileViewSet, basename='profile')
-router.register(r'standups', views.StandupViewSet, basename='standup')
-router.register(r'code-reviews', views.CodeReviewViewSet, basename='code-review')
+router.register(r'teams', views.TeamViewSet, basename='api-team')
+router.register(r'projects', views.ProjectViewSet, basename='api-project')
+router.register(r'tasks', views.TaskViewSet, basename='api-task')
+router.register(r'profiles', views.DeveloperProfileViewSet, basename='api-profile')
+router.register(r'standups', views.StandupViewSet, basename='api-standup')
+router.register(r'code-reviews', views.CodeReviewViewSet, basename='api-code-review')
 
 # URL patterns
 urlpatterns = [
@@ -63,7 +63,13 @@ urlpatterns = [
     path('code-reviews/<int:review_id>/assign/<int:user_id>/', views.assign_code_review, name='code-review-assign'),
     path('code-reviews/<int:review_id>/comment/', views.add_code_review_comment, name='code-review-comment'),
     
+    # AI URLs
+    path('ai/feature-plan/', views.plan_feature, name='ai-feature-plan'),
+    path('ai/status/<str:model_type>/<int:item_id>/', views.check_ai_status, name='ai-status'),
+    
     # API URLs
     path('api/', include(router.urls)),
     path('api/teams/<int:team_id>/members/', views.get_team_members, name='api-team-members'),
+    path('api/activities/', views.ActivityFeedView.as_view(), name='api-activity-feed'),
+    path('api/teams/<int:team_id>/activities/', views.TeamActivityFeedView.as_view(), name='api-team-activity-feed'),
 ] 
\ No newline at end of file
@@ -3,21 +3,31 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.urls import reverse_lazy
-from django.http import JsonResponse
-from rest_framework import viewsets, permissions
+from django.http import Http404, JsonResponse
+from rest_framework import generics, viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
+from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.urls import reverse
-from .models import Team, Project, Task, DeveloperProfile, Standup, CodeReview, TeamMember, ActivityLog, AIInsight, TeamInvite, TaskBoard, TaskColumn, AIInsightTracker, CodeReviewInbox
+from .models import Team, Project, Task, DeveloperProfile, Standup, CodeReview, CodeReviewComment, TeamMember, ActivityLog, AIInsight, TeamInvite, TaskBoard, TaskColumn, AIInsightTracker, CodeReviewInbox
 from .serializers import (
     TeamSerializer, ProjectSerializer, TaskSerializer,
-    DeveloperProfileSerializer, StandupSerializer, CodeReviewSerializer
+    DeveloperProfileSerializer, StandupSerializer, CodeReviewSerializer,
+    ActivityLogSerializer
 )
+from .pagination import ActivityPagination, KeysetPagination, InvalidCursor, decode_cursor, keyset_paginate
+from .activity import log_activity
+from .ai_events import wait_for_completion
+from .dashboard import get_dashboard_context
+from .memberships import get_memberships
+from .standups import queue_standup_summary
+from .stats import annotate_project_counts, annotate_team_counts
+from .streaming import set_stream_owner
 from .tasks import (
     process_standup_summary,
     process_code_review,
@@ -25,7 +35,7 @@ from .tasks import (
     process_feature_planning
 )
 from django.contrib import messages
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q
 from django.utils import timezone
 from .forms import TeamForm, TeamMemberForm, ProjectForm, TeamCreateForm, TeamInviteForm, TaskForm, CodeReviewForm, ProfileEditForm, SettingsForm
 from django.db.utils import IntegrityError
@@ -40,7 +50,9 @@ class TeamCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        self.object.members.add(self.request.user)  # Add the creator as a team member
+        # Add the creator as a team member; created, not members.add(), so the
+        # membership signals fire
+        TeamMember.objects.create(team=self.object, user=self.request.user)
         return response
 
 # Profile View
@@ -124,10 +136,16 @@ class TeamDetailView(LoginRequiredMixin, DetailView):
 
 @login_required
 def team_detail(request, team_id):
-    team = get_object_or_404(Team, id=team_id)
+    team = get_object_or_404(
+        Team.objects.prefetch_related(
+            Prefetch('members', queryset=User.objects.select_related('developer_profile')),
+            Prefetch('projects', queryset=Project.objects.annotate(task_count=Count('tasks')))
+        ),
+        id=team_id
+    )
     
     # Check if user is a team member
-    if not team.members.filter(id=request.user.id).exists():
+    if not get_memberships(request.user).is_team_member(team.id):
         messages.error(request, 'You do not have permission to view this team.')
         return redirect('dashboard')
     
@@ -138,19 +156,14 @@ def team_detail(request, team_id):
     team_members = TeamMember.objects.filter(team=team).select_related('user')
     
     # Get recent activities
-    activities = ActivityLog.objects.filter(
-        Q(project__team=team) | Q(target_type='team', target_id=team.id)
-    ).order_by('-timestamp')[:10]
+    activities = ActivityLog.objects.for_team(team).order_by('-timestamp')[:10]
     
     context = {
         'team': team,
         'projects': projects,
         'team_members': team_members,
         'activities': activities,
-        'can_edit': team.members.filter(
-            teammember__user=request.user,
-            teammember__role__in=['admin', 'leader']
-        ).exists()
+        'can_edit': get_memberships(request.user).can_edit_team(team.id)
     }
     return render(request, 'devcord/team_detail.html', context)
 
@@ -206,8 +219,8 @@ def submit_standup(request):
             mood=mood
         )
         
-        # Trigger async standup summary generation
-        process_standup_summary.delay(standup.id)
+        # Summarized with the next batch of standups
+        queue_standup_summary(standup.id)
         
         return JsonResponse({
             'status': 'processing',
@@ -220,20 +233,30 @@ def submit_standup(request):
 def check_ai_status(request, model_type, item_id):
     """
     Check the status of an AI-processed item (standup or code review).
+
+    Pages with a websocket hear about completed items from AIEventsConsumer.
+    Without one, pass ``?wait=<seconds>``: a pending item then holds the
+    request open until its completion event arrives on Redis pub/sub (or
+    AI_STATUS_LONG_POLL_TIMEOUT passes) instead of the client polling.
     """
     if model_type == 'standup':
-        item = get_object_or_404(Standup, id=item_id)
-        ready = bool(item.ai_summary)
-        data = item.ai_summary if ready else None
+        model, field = Standup, 'ai_summary'
     elif model_type == 'code-review':
-        item = get_object_or_404(CodeReview, id=item_id)
-        ready = bool(item.ai_suggestions)
-        data = item.ai_suggestions if ready else None
+        model, field = CodeReview, 'ai_suggestions'
     else:
         return JsonResponse({'status': 'error', 'message': 'Invalid model type'})
+
+    def read():
+        return getattr(get_object_or_404(model.objects.only('id', field), id=item_id), field) or None
+
+    try:
+        wait = min(float(request.GET.get('wait', 0)), settings.AI_STATUS_LONG_POLL_TIMEOUT)
+    except ValueError:
+        wait = 0
+    data = wait_for_completion(model_type, item_id, wait, read) if wait > 0 else read()
     
     return JsonResponse({
-        'status': 'ready' if ready else 'processing',
+        'status': 'ready' if data is not None else 'processing',
         'data': data
     })
 
@@ -259,7 +282,8 @@ def update_team_vibe(request, team_id):
 @login_required
 def plan_feature(request):
     """
-    Generate an AI-powered feature plan.
+    Generate an AI-powered feature plan. The plan is streamed to
+    ws/ai/feature-plan/<task_id>/ as it is written.
     """
     if request.method == 'POST':
         idea = request.POST.get('idea')
@@ -270,7 +294,8 @@ def plan_feature(request):
             })
         
         # Process feature plan asynchronously
-        task = process_feature_planning.delay(idea)
+        task = process_feature_planning.delay(idea, request.user.id)
+        set_stream_owner('feature-plan', task.id, request.user.id)
         
         return JsonResponse({
             'status': 'processing',
@@ -303,6 +328,7 @@ class TeamViewSet(viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Team.objects.filter(members=self.request.user)
@@ -317,6 +343,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Project.objects.filter(team__members=self.request.user)
@@ -325,6 +352,7 @@ class TaskViewSet(viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Task.objects.filter(project__team__members=self.request.user)
@@ -341,6 +369,7 @@ class StandupViewSet(viewsets.ModelViewSet):
     queryset = Standup.objects.all()
     serializer_class = StandupSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Standup.objects.filter(developer=self.request.user)
@@ -355,6 +384,7 @@ class CodeReviewViewSet(viewsets.ModelViewSet):
     queryset = CodeReview.objects.all()
     serializer_class = CodeReviewSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return CodeReview.objects.filter(reviewer=self.request.user)
@@ -365,6 +395,22 @@ class CodeReviewViewSet(viewsets.ModelViewSet):
         process_code_review.delay(review.id)
         return Response({'status': 'processing'})
 
+class ActivityFeedView(generics.ListAPIView):
+    """Cursor-paginated activity feed for the user's teams"""
+    serializer_class = ActivityLogSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ActivityPagination
+
+    def get_queryset(self):
+        return ActivityLog.objects.for_teammates(self.request.user).select_related('user')
+
+class TeamActivityFeedView(ActivityFeedView):
+    """Cursor-paginated activity feed for a single team"""
+
+    def get_queryset(self):
+        team = get_object_or_404(Team, id=self.kwargs['team_id'], members=self.request.user)
+        return ActivityLog.objects.for_team(team).select_related('user')
+
 # Task Views
 class TaskListView(LoginRequiredMixin, ListView):
     model = Task
@@ -407,67 +453,28 @@ class TeamListView(LoginRequiredMixin, ListView):
     template_name = 'teams/team_list.html'
     context_object_name = 'teams'
     
+    def get_queryset(self):
+        user = self.request.user
+        return annotate_team_counts(Team.objects.filter(
+            Q(creator=user) | Q(pk__in=TeamMember.objects.filter(user=user).values('team'))
+        ))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
+        teams = list(self.object_list)
         
         # Get teams created by the user
-        context['created_teams'] = Team.objects.filter(creator=user)
+        context['created_teams'] = [team for team in teams if team.creator_id == user.pk]
         
         # Get teams where user is a member (excluding teams they created)
-        context['member_teams'] = Team.objects.filter(members=user).exclude(creator=user)
+        context['member_teams'] = [team for team in teams if team.creator_id != user.pk]
         
         return context
 
 @login_required
 def dashboard(request):
-    # Get user's teams
-    user_teams = request.user.teams.all()
-    
-    # Get active projects for user's teams
-    active_projects = Project.objects.filter(
-        team__in=user_teams,
-        status='active'
-    ).select_related('team')
-    
-    # Get team members count
-    team_members_count = TeamMember.objects.filter(
-        team__in=user_teams
-    ).values('user').distinct().count()
-    
-    # Get pending reviews
-    pending_reviews = CodeReview.objects.filter(
-        Q(project__team__in=user_teams) & 
-        (Q(reviewer=request.user) | Q(author=request.user)),
-        status='pending'
-    ).select_related('project', 'author')
-    
-    # Get recent activities
-    recent_activities = ActivityLog.objects.filter(
-        Q(user__in=TeamMember.objects.filter(team__in=user_teams).values('user')) |
-        Q(user=request.user)
-    )[:10]
-    
-    # Get AI insights
-    ai_insights = AIInsight.objects.filter(
-        Q(tracker__project__team__in=user_teams),
-        insight_type__in=['code_quality', 'performance', 'security', 'best_practices']
-    ).select_related('tracker', 'tracker__project')[:5]
-    
-    context = {
-        'active_projects': active_projects,
-        'active_projects_count': active_projects.count(),
-        'team_members_count': team_members_count,
-        'pending_reviews_count': pending_reviews.count(),
-        'recent_activities': recent_activities,
-        'ai_insights': ai_insights,
-        'recent_code_reviews': pending_reviews[:5],
-    }
-    
-    # Check if user has any projects
-    if not active_projects.exists():
-        context['show_onboarding'] = True
-    
+    context = get_dashboard_context(request.user)
     return render(request, 'devcord/dashboard.html', context)
 
 @login_required
@@ -532,10 +539,10 @@ def send_team_invite_email(team, email, invite_code, request):
 
 @login_required
 def team_invite(request, team_id):
-    team = get_object_or_404(Team, id=team_id)
+    team = get_object_or_404(annotate_team_counts(Team.objects.all()), id=team_id)
     
     # Check if user is team leader
-    if not TeamMember.objects.filter(team=team, user=request.user, role='leader').exists():
+    if get_memberships(request.user).team_role(team.id) != 'leader':
         messages.error(request, 'You do not have permission to invite members.')
         return redirect('team-detail', team_id=team.id)
     
@@ -601,7 +608,7 @@ def team_invite(request, team_id):
     ).order_by('-created_at')
     
     # Get team members
-    team_members = TeamMember.objects.filter(team=team).select_related('user')
+    team_members = TeamMember.objects.filter(team=team).select_related('user__developer_profile')
     
     return render(request, 'teams/team_invite.html', {
         'form': form,
@@ -659,7 +666,7 @@ def remove_team_member(request, team_id, member_id):
     team = get_object_or_404(Team, id=team_id)
     
     # Check if user is team leader
-    if not team.members.filter(teammember__user=request.user, teammember__role='leader').exists():
+    if get_memberships(request.user).team_role(team.id) != 'leader':
         messages.error(request, 'You do not have permission to remove members.')
         return redirect('team_detail', team_id=team.id)
     
@@ -681,7 +688,7 @@ def add_team_members(request, team_id):
     team = get_object_or_404(Team, id=team_id)
     
     # Check if user is team admin
-    if not TeamMember.objects.filter(team=team, user=request.user, role='admin').exists():
+    if get_memberships(request.user).team_role(team.id) != 'admin':
         messages.error(request, 'You do not have permission to add team members.')
         return redirect('dashboard')
     
@@ -702,7 +709,7 @@ def add_team_members(request, team_id):
             )
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action=f'added {user.get_full_name()} as {role}',
                 target_type='team',
@@ -726,7 +733,7 @@ def add_team_members(request, team_id):
 def create_project(request, team_id=None):
     if team_id:
         team = get_object_or_404(Team, id=team_id)
-        if not TeamMember.objects.filter(team=team, user=request.user).exists():
+        if not get_memberships(request.user).is_team_member(team.id):
             messages.error(request, 'You do not have permission to create projects for this team.')
             return redirect('dashboard')
     
@@ -755,7 +762,7 @@ def create_project(request, team_id=None):
             create_default_project_modules(project)
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 project=project,
                 action='created project',
@@ -834,7 +841,7 @@ def edit_project(request, project_id):
             project.save()
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 project=project,
                 action='updated project',
@@ -874,7 +881,7 @@ def project_detail(request, project_id):
     code_reviews = project.code_reviews.all().select_related('author', 'reviewer')
     
     # Get team members
-    team_members = project.team.members.all().select_related('user')
+    team_members = TeamMember.objects.filter(team_id=project.team_id).select_related('user')
     
     context = {
         'project': project,
@@ -902,7 +909,7 @@ def archive_project(request, project_id):
         project.archive()
         
         # Log activity
-        ActivityLog.objects.create(
+        log_activity(
             user=request.user,
             project=project,
             action='archived project',
@@ -920,17 +927,18 @@ class ProjectListView(LoginRequiredMixin, ListView):
     context_object_name = 'projects'
 
     def get_queryset(self):
-        return Project.objects.filter(
+        return annotate_project_counts(Project.objects.filter(
             team__members=self.request.user
-        ).select_related('team').prefetch_related('team__members', 'tasks')
+        )).select_related('team').prefetch_related('team__members')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user_teams = self.request.user.teams.all()
+        projects = list(self.object_list)
         
-        context['active_projects'] = self.get_queryset().filter(status='active')
-        context['completed_projects'] = self.get_queryset().filter(status='completed')
-        context['archived_projects'] = self.get_queryset().filter(status='archived')
+        context['active_projects'] = [p for p in projects if p.status == 'active']
+        context['completed_projects'] = [p for p in projects if p.status == 'completed']
+        context['archived_projects'] = [p for p in projects if p.status == 'archived']
         context['user_teams'] = user_teams
         
         return context
@@ -945,14 +953,20 @@ class CodeReviewListView(LoginRequiredMixin, ListView):
         user = self.request.user
         return CodeReview.objects.filter(
             Q(author=user) | Q(reviewer=user)
-        ).select_related('project', 'author', 'reviewer').order_by('-created_at')
+        ).select_related(*self.related).order_by('-created_at')
+
+    related = ('project', 'author__developer_profile', 'reviewer__developer_profile')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
         context['pending_reviews'] = self.get_queryset().filter(status='pending')
-        context['my_submissions'] = CodeReview.objects.filter(author=user).order_by('-created_at')
-        context['to_review'] = CodeReview.objects.filter(reviewer=user, status='pending')
+        context['my_submissions'] = CodeReview.objects.filter(
+            author=user
+        ).select_related(*self.related).order_by('-created_at')
+        context['to_review'] = CodeReview.objects.filter(
+            reviewer=user, status='pending'
+        ).select_related(*self.related)
         return context
 
 @login_required
@@ -978,7 +992,7 @@ def create_code_review(request):
             review.save()
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 project=review.project,
                 action='created code review',
@@ -1009,11 +1023,20 @@ class CodeReviewDetailView(LoginRequiredMixin, DetailView):
         user = self.request.user
         return CodeReview.objects.filter(
             Q(author=user) | Q(reviewer=user) | Q(project__team__members=user)
-        ).select_related('project', 'author', 'reviewer')
+        ).distinct().select_related(
+            'project__team', 'author__developer_profile', 'reviewer__developer_profile'
+        ).prefetch_related(
+            Prefetch('comments', queryset=CodeReviewComment.objects.select_related(
+                'author__developer_profile'
+            )),
+            Prefetch('project__team__members', queryset=User.objects.select_related(
+                'developer_profile'
+            ))
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        review = self.get_object()
+        review = self.object
         context['can_review'] = self.request.user == review.reviewer
         context['is_author'] = self.request.user == review.author
         context['project'] = review.project
@@ -1033,7 +1056,7 @@ def add_code_review_comment(request, review_id):
             )
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 action='commented on code review',
                 target_type='code-review',
@@ -1061,7 +1084,7 @@ def approve_code_review(request, review_id):
         review.save()
         
         # Log activity
-        ActivityLog.objects.create(
+        log_activity(
             user=request.user,
             action='approved code review',
             target_type='code-review',
@@ -1087,7 +1110,7 @@ def request_code_review_changes(request, review_id):
         review.save()
         
         # Log activity
-        ActivityLog.objects.create(
+        log_activity(
             user=request.user,
             action='requested changes on code review',
             target_type='code-review',
@@ -1114,7 +1137,7 @@ def edit_code_review(request, review_id):
             review = form.save()
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 project=review.project,
                 action='updated code review',
@@ -1137,17 +1160,23 @@ class ActivityListView(LoginRequiredMixin, ListView):
     model = ActivityLog
     template_name = 'devcord/activity_list.html'
     context_object_name = 'activities'
-    paginate_by = 20
+    page_size = 20
 
     def get_queryset(self):
-        return ActivityLog.objects.filter(
-            Q(user=self.request.user) |
-            Q(target_type='team', target_id__in=self.request.user.teams.values_list('id', flat=True))
-        ).order_by('-timestamp')
+        cursor = self.request.GET.get('cursor')
+        try:
+            position = decode_cursor(cursor) if cursor else None
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        queryset = ActivityLog.objects.for_user(self.request.user).select_related('user')
+        self.page = keyset_paginate(queryset, 'timestamp', position, self.page_size)
+        return self.page.object_list
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Activity History'
+        context['is_first_page'] = not self.request.GET.get('cursor')
+        context['next_cursor'] = self.page.next_cursor
         return context
 
 @login_required
@@ -1155,7 +1184,7 @@ def team_edit(request, team_id):
     team = get_object_or_404(Team, id=team_id)
     
     # Check if user is team leader
-    if not TeamMember.objects.filter(team=team, user=request.user, role='leader').exists():
+    if get_memberships(request.user).team_role(team.id) != 'leader':
         messages.error(request, 'You do not have permission to edit this team.')
         return redirect('team-detail', team_id=team.id)
     
@@ -1182,7 +1211,7 @@ def team_delete(request, team_id):
     team = get_object_or_404(Team, id=team_id)
     
     # Check if user is team leader
-    if not TeamMember.objects.filter(team=team, user=request.user, role='leader').exists():
+    if get_memberships(request.user).team_role(team.id) != 'leader':
         messages.error(request, 'You do not have permission to delete this team.')
         return redirect('team-detail', team_id=team.id)
     
@@ -1216,7 +1245,7 @@ def create_task(request):
             task.save()
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 project=task.project,
                 action='created task',
@@ -1267,7 +1296,7 @@ def edit_task(request, task_id):
             task = form.save()
             
             # Log activity
-            ActivityLog.objects.create(
+            log_activity(
                 user=request.user,
                 project=task.project,
                 action='updated task',
@@ -1312,7 +1341,7 @@ def assign_task(request, task_id, user_id):
         return redirect('task-detail', task_id=task.id)
     
     # Check if assigned user is a team member
-    if not task.project.team.members.filter(user=user).exists():
+    if not get_memberships(user).is_team_member(task.project.team_id):
         messages.error(request, 'User is not a member of the project team.')
         return redirect('task-detail', task_id=task.id)
     
@@ -1334,7 +1363,7 @@ def assign_code_review(request, review_id, user_id):
         return redirect('code-review-detail', review_id=review.id)
     
     # Check if assigned user is a team member
-    if not review.project.team.members.filter(id=user.id).exists():
+    if not get_memberships(user).is_team_member(review.project.team_id):
         messages.error(request, 'User is not a member of the project team.')
         return redirect('code-review-detail', review_id=review.id)
     
@@ -1351,7 +1380,7 @@ def get_team_members(request, team_id):
     team = get_object_or_404(Team, id=team_id)
     
     # Check if user has access to the team
-    if not team.members.filter(id=request.user.id).exists():
+    if not get_memberships(request.user).is_team_member(team.id):
         return JsonResponse({'error': 'Access denied'}, status=403)
     
     members = team.members.all().values('id', 'username', 'first_name', 'last_name')
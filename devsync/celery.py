@@ -18,7 +18,20 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'daily-team-analysis': {
         'task': 'devcord.tasks.daily_team_analysis',
-        'schedule': crontab(hour=0, minute=0),  # Run at midnight
+        # Starts the day's run at midnight; later calls resume it if it stalled
+        'schedule': crontab(minute='*/15'),
+    },
+    'maintain-activity-log': {
+        'task': 'devcord.tasks.maintain_activity_log',
+        'schedule': crontab(hour=2, minute=30),  # Run daily at 2:30 AM
+    },
+    'cleanup-old-messages': {
+        'task': 'chat.tasks.cleanup_old_messages',
+        'schedule': crontab(hour=3, minute=0),  # Run daily at 3 AM
+    },
+    'flush-standup-batches': {
+        'task': 'devcord.tasks.process_standup_batch',
+        'schedule': crontab(),  # Every minute, for standups whose flush was lost
     },
 }
 
@@ -51,9 +51,11 @@ INSTALLED_APPS = [
     
     # Local apps
     'devcord.apps.DevcordConfig',
+    'chat.apps.ChatConfig',
 ]
 
 MIDDLEWARE = [
+    'devcord.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -64,6 +66,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
+    'devcord.activity.ActivityLogFlushMiddleware',
 ]
 
 ROOT_URLCONF = 'devsync.urls'
@@ -162,6 +165,26 @@ REST_FRAMEWORK = {
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Configure appropriately in production
 
+# Redis, used directly by devcord.redis_client for features that need more
+# than the cache API (left unset to run without Redis)
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Cache settings
+# Uses Redis when REDIS_URL is set, otherwise a per-process local memory cache
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_CACHE_URL', os.getenv('REDIS_URL')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Celery settings
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -170,9 +193,147 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Channels. Workers publish to groups that web processes consume, so
+# anything beyond a single development process needs the Redis layer
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_CHANNEL_URL', REDIS_URL)]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Activity log retention
+# Feeds only read the most recent ACTIVITY_FEED_MONTHS months of activity;
+# raw rows older than ACTIVITY_RETENTION_MONTHS are rolled up into daily counts
+ACTIVITY_FEED_MONTHS = int(os.getenv('ACTIVITY_FEED_MONTHS', 3))
+ACTIVITY_RETENTION_MONTHS = int(os.getenv('ACTIVITY_RETENTION_MONTHS', 12))
+
+# Record query counts per request and log views over their budget in
+# devcord.querybudget.QUERY_BUDGETS
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', str(DEBUG)).lower() == 'true'
+
+# Activity entries are buffered and written in batches of up to
+# ACTIVITY_LOG_BUFFER_SIZE; with ACTIVITY_LOG_ASYNC the batches are written by
+# the devcord.tasks.write_activity_batch Celery task instead
+ACTIVITY_LOG_BUFFER_SIZE = int(os.getenv('ACTIVITY_LOG_BUFFER_SIZE', 200))
+ACTIVITY_LOG_ASYNC = os.getenv('ACTIVITY_LOG_ASYNC', 'False').lower() == 'true'
+
 # OpenAI settings
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# Shared OpenAI HTTP client (devcord.ai_client): one pool of keep-alive
+# connections per process
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 2))
+OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', 'True').lower() == 'true'
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 120))
+
+# Most AI requests in flight at once per event loop on the async path
+# (devcord.ai_client.concurrency_limit); further requests wait their turn
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 32))
+
+# AI provider circuit breaker and adaptive concurrency (devcord.circuit),
+# shared by all workers through Redis. The circuit opens for
+# AI_CIRCUIT_OPEN_SECONDS when AI_CIRCUIT_FAILURE_RATE of recent calls fail,
+# or half are slower than AI_CIRCUIT_SLOW_CALL_SECONDS. Calls in flight are
+# kept between AI_CONCURRENCY_MIN and AI_CONCURRENCY_MAX, backing off when
+# calls fail or slow down.
+AI_CIRCUIT_FAILURE_RATE = float(os.getenv('AI_CIRCUIT_FAILURE_RATE', 0.5))
+AI_CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('AI_CIRCUIT_SLOW_CALL_SECONDS', 30))
+AI_CIRCUIT_OPEN_SECONDS = float(os.getenv('AI_CIRCUIT_OPEN_SECONDS', 30))
+AI_CONCURRENCY_MIN = int(os.getenv('AI_CONCURRENCY_MIN', 2))
+AI_CONCURRENCY_MAX = int(os.getenv('AI_CONCURRENCY_MAX', 64))
+
+# AI response cache (devcord.ai_cache). Identical prompts are answered from an
+# in-process LRU, then Redis (or the default cache without Redis). Redis keeps
+# at most AI_CACHE_MAX_ENTRIES responses and evicts the least recently used.
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'True').lower() == 'true'
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 60 * 60 * 24))
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 10000))
+AI_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('AI_CACHE_LOCAL_MAX_ENTRIES', 256))
+AI_CACHE_LOCAL_TTL = int(os.getenv('AI_CACHE_LOCAL_TTL', 60 * 5))
+
+# AI request rate limits (devcord.ratelimit), shared by all workers through
+# Redis as token buckets. Each model admits AI_RATE_LIMIT requests and each
+# team AI_TEAM_RATE_LIMIT, written as "<count>/<s|m|h|d>"; the count is also
+# the largest burst.
+AI_RATE_LIMIT = os.getenv('AI_RATE_LIMIT', '60/m')
+AI_TEAM_RATE_LIMIT = os.getenv('AI_TEAM_RATE_LIMIT', '10/m')
+
+# Model for CodeReviewService code reviews. With AI_REVIEW_STRUCTURED_OUTPUT
+# it is asked for JSON matching a schema rather than sectioned text, which
+# needs a model that supports structured outputs (devcord.review_feedback)
+AI_REVIEW_MODEL = os.getenv('AI_REVIEW_MODEL', 'gpt-4')
+AI_REVIEW_STRUCTURED_OUTPUT = os.getenv('AI_REVIEW_STRUCTURED_OUTPUT', 'False').lower() == 'true'
+
+# Code reviews longer than this many tokens (about four characters each)
+# are split into chunks of roughly that size, reviewed in parallel and
+# merged (ai.services.chunking)
+AI_REVIEW_CHUNK_TOKENS = int(os.getenv('AI_REVIEW_CHUNK_TOKENS', 3000))
+
+# Chat messages are written in batches of up to CHAT_WRITE_BATCH_SIZE, at
+# most CHAT_WRITE_INTERVAL_MS after they are sent (chat.buffer), and deleted
+# after CHAT_MESSAGE_RETENTION_DAYS, CHAT_CLEANUP_BATCH_SIZE rows at a time
+CHAT_WRITE_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BATCH_SIZE', 100))
+CHAT_WRITE_INTERVAL_MS = int(os.getenv('CHAT_WRITE_INTERVAL_MS', 250))
+CHAT_MESSAGE_RETENTION_DAYS = int(os.getenv('CHAT_MESSAGE_RETENTION_DAYS', 90))
+CHAT_CLEANUP_BATCH_SIZE = int(os.getenv('CHAT_CLEANUP_BATCH_SIZE', 1000))
+
+# The last CHAT_HISTORY_RING_SIZE messages of each room are kept in Redis for
+# CHAT_HISTORY_RING_TTL seconds, so reconnecting clients catch up without a
+# database query (chat.history). History is sent CHAT_HISTORY_PAGE_SIZE
+# messages a page, at most CHAT_HISTORY_MAX_PAGES pages per request
+CHAT_HISTORY_RING_SIZE = int(os.getenv('CHAT_HISTORY_RING_SIZE', 200))
+CHAT_HISTORY_RING_TTL = int(os.getenv('CHAT_HISTORY_RING_TTL', 86400))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+CHAT_HISTORY_MAX_PAGES = int(os.getenv('CHAT_HISTORY_MAX_PAGES', 10))
+
+# Daily team analysis (devcord.team_analysis) sends active teams in windows
+# of TEAM_ANALYSIS_WINDOW, as tasks of TEAM_ANALYSIS_BATCH_SIZE teams, at no
+# more than TEAM_ANALYSIS_PER_MINUTE teams a minute, nor faster than
+# AI_RATE_LIMIT admits; the default leaves half of it to users. A run with no
+# progress for TEAM_ANALYSIS_STALL_TIMEOUT seconds is resumed from its last
+# window.
+TEAM_ANALYSIS_WINDOW = int(os.getenv('TEAM_ANALYSIS_WINDOW', 500))
+TEAM_ANALYSIS_BATCH_SIZE = int(os.getenv('TEAM_ANALYSIS_BATCH_SIZE', 25))
+TEAM_ANALYSIS_PER_MINUTE = float(os.getenv('TEAM_ANALYSIS_PER_MINUTE', 30))
+TEAM_ANALYSIS_STALL_TIMEOUT = int(os.getenv('TEAM_ANALYSIS_STALL_TIMEOUT', 30 * 60))
+
+# The vibe analysis reads a digest of each team's last TEAM_DIGEST_HOURS of
+# activity and chat, built from at most TEAM_DIGEST_MAX_EVENTS events and
+# cut to TEAM_DIGEST_TOKENS tokens (devcord.team_digest)
+TEAM_DIGEST_HOURS = int(os.getenv('TEAM_DIGEST_HOURS', 24))
+TEAM_DIGEST_MAX_EVENTS = int(os.getenv('TEAM_DIGEST_MAX_EVENTS', 1000))
+TEAM_DIGEST_TOKENS = int(os.getenv('TEAM_DIGEST_TOKENS', 800))
+
+# Submitted standups are summarized in batches of up to STANDUP_BATCH_SIZE,
+# sent when the batch is full or STANDUP_BATCH_WINDOW seconds after the
+# first standup in it (devcord.standups; batching needs Redis 6.2 or later)
+STANDUP_BATCH_SIZE = int(os.getenv('STANDUP_BATCH_SIZE', 10))
+STANDUP_BATCH_WINDOW = float(os.getenv('STANDUP_BATCH_WINDOW', 30))
+
+# Streamed AI output (devcord.streaming) is sent to the page in chunks of
+# STREAM_CHUNK_CHARS characters or every STREAM_CHUNK_INTERVAL seconds; the
+# text so far is kept for STREAM_SNAPSHOT_TIMEOUT seconds for late joiners
+STREAM_CHUNK_CHARS = int(os.getenv('STREAM_CHUNK_CHARS', 64))
+STREAM_CHUNK_INTERVAL = float(os.getenv('STREAM_CHUNK_INTERVAL', 0.1))
+STREAM_SNAPSHOT_TIMEOUT = int(os.getenv('STREAM_SNAPSHOT_TIMEOUT', 60 * 10))
+
+# Longest a check_ai_status request with ?wait= is held open waiting for a
+# completion event. Each waiting request holds a worker thread and a Redis
+# connection, so keep this below any proxy read timeout.
+AI_STATUS_LONG_POLL_TIMEOUT = float(os.getenv('AI_STATUS_LONG_POLL_TIMEOUT', 25))
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -0,0 +1,155 @@
+// AI Stream JavaScript
+//
+// Shows AI output while it is being generated. Any element with
+// data-ai-stream="<code-review|feature-plan>" and data-item-id is filled in
+// as chunks arrive; other scripts can call AIStream.follow() directly.
+//
+// Elements with data-ai-pending="<standup|code-review>" and data-item-id are
+// filled in once their result is ready. Completion events arrive over one
+// websocket per page; if that can't connect, each pending item long-polls
+// check_ai_status instead. Either way an "ai:completed" event is dispatched
+// on the element.
+
+const AIStream = {
+    follow(modelType, itemId, handlers = {}) {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/ai/${modelType}/${itemId}/`);
+        let text = '';
+
+        const update = (newText) => {
+            text = newText;
+            if (handlers.onText) handlers.onText(text);
+        };
+
+        socket.addEventListener('message', (e) => {
+            const message = JSON.parse(e.data);
+            switch (message.type) {
+                case 'snapshot':
+                    update(message.text);
+                    if (message.done) {
+                        if (handlers.onDone) handlers.onDone(message.text, message.result);
+                        socket.close();
+                    }
+                    break;
+                case 'chunk':
+                    // Offsets let chunks already covered by the snapshot be
+                    // skipped, and a restarted stream replace the old text
+                    if (message.offset <= text.length) {
+                        update(text.slice(0, message.offset) + message.text);
+                    }
+                    break;
+                case 'done':
+                    update(message.text);
+                    if (handlers.onDone) handlers.onDone(message.text, message.result);
+                    socket.close();
+                    break;
+                case 'error':
+                    if (handlers.onError) handlers.onError(message.message);
+                    socket.close();
+                    break;
+            }
+        });
+
+        return socket;
+    }
+};
+
+const AIEvents = {
+    LONG_POLL_SECONDS: 25,
+
+    watch(elements) {
+        const pending = new Map();
+        elements.forEach(element => {
+            pending.set(`${element.dataset.aiPending}:${element.dataset.itemId}`, element);
+        });
+        if (!pending.size) return;
+
+        const complete = (modelType, itemId, data) => {
+            const key = `${modelType}:${itemId}`;
+            const element = pending.get(key);
+            if (!element) return;
+            pending.delete(key);
+            element.textContent = AIEvents.describe(data);
+            element.removeAttribute('data-ai-pending');
+            element.dispatchEvent(new CustomEvent('ai:completed', {
+                bubbles: true,
+                detail: { modelType, itemId, data }
+            }));
+        };
+
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/ai/events/`);
+        let connected = false;
+
+        socket.addEventListener('open', () => {
+            connected = true;
+            // Catch anything that finished before the socket was open
+            pending.forEach((element, key) => {
+                const [modelType, itemId] = key.split(':');
+                AIEvents.check(modelType, itemId, 0).then(result => {
+                    if (result && result.status === 'ready') complete(modelType, itemId, result.data);
+                });
+            });
+        });
+        socket.addEventListener('message', (e) => {
+            const message = JSON.parse(e.data);
+            if (message.type === 'completed') {
+                complete(message.model_type, String(message.item_id), message.data);
+                if (!pending.size) socket.close();
+            }
+        });
+        socket.addEventListener('close', () => {
+            if (connected && !pending.size) return;
+            // No websocket: wait on the long-poll endpoint instead
+            pending.forEach((element, key) => {
+                const [modelType, itemId] = key.split(':');
+                AIEvents.longPoll(modelType, itemId, (data) => complete(modelType, itemId, data));
+            });
+        });
+    },
+
+    async check(modelType, itemId, wait) {
+        try {
+            const response = await fetch(`/ai/status/${modelType}/${itemId}/?wait=${wait}`);
+            return response.ok ? await response.json() : null;
+        } catch (error) {
+            return null;
+        }
+    },
+
+    async longPoll(modelType, itemId, onReady) {
+        let failures = 0;
+        while (failures < 5) {
+            const result = await AIEvents.check(modelType, itemId, AIEvents.LONG_POLL_SECONDS);
+            if (result && result.status === 'ready') {
+                onReady(result.data);
+                return;
+            }
+            if (!result || result.status === 'error') {
+                failures += 1;
+            }
+            // Without Redis the server answers at once, so don't spin
+            await new Promise(resolve => setTimeout(resolve, 1000 * (failures + 1)));
+        }
+    },
+
+    describe(data) {
+        if (typeof data === 'string') return data;
+        if (!data) return '';
+        return data.summary || data.review || data.plan || data.message || '';
+    }
+};
+
+window.AIStream = AIStream;
+window.AIEvents = AIEvents;
+
+document.addEventListener('DOMContentLoaded', function() {
+    AIEvents.watch(document.querySelectorAll('[data-ai-pending]'));
+
+    document.querySelectorAll('[data-ai-stream]').forEach(element => {
+        AIStream.follow(element.dataset.aiStream, element.dataset.itemId, {
+            onText: (text) => { element.textContent = text; },
+            onError: (message) => { element.textContent = message; }
+        });
+    });
+});